@@ -1,19 +1,47 @@
+import io
 import os
+import re
 import sys
 import json
-import boto3
+import time
+import typing
 import tarfile
 import pathlib
 import logging
+import graph
+import store
 import grafana
+import metrics
+import compress
+import pipeline
 import datetime
+import exporters
+import threading
 import traceback
+import collections
 
-from urllib import request
+from concurrent import futures
 
 # DEBUG_MODE
+# BACKUP_CODEC
+# BACKUP_CATALOG
+# BACKUP_NO_GRAPH
+# BACKUP_STORE
+# BACKUP_STREAMING
+# BACKUP_CONCURRENCY
+# BACKUP_EXPORTERS
+# BACKUP_RESUME
+# BACKUP_INCREMENTAL
+# BACKUP_PIPELINE
+# BACKUP_QUEUE_SIZE
+# BACKUP_UPLOAD_CONCURRENCY
+# BACKUP_MANIFEST
+# BACKUP_METRICS_FILE
+# BACKUP_METRICS_SUMMARY
 # GRAFANA_URL
 # GRAFANA_TOKEN
+# GRAFANA_RATE_LIMIT
+# GRAFANA_CACHE_TTL
 # SLACK_API_URL
 # SLACK_CHANNEL
 # AWS_S3_BUCKET
@@ -22,148 +50,696 @@ from urllib import request
 # AWS_SECRET_ACCESS_KEY
 
 
+def get_meta(data: typing.Union[bytes, str]) -> dict:
+    '''
+    Decode only the "meta" object of a dashboard response, the dashboard model is left unparsed.
+    '''
+    text = data.decode() if isinstance(data, bytes) else data
+    match = re.match(r'\s*\{\s*"meta"\s*:\s*', text)
+
+    # Grafana writes "meta" before "dashboard", otherwise fall back to a full parse.
+    if not match:
+        return json.loads(text).get("meta", {})
+
+    (meta, _) = json.JSONDecoder().raw_decode(text, match.end())
+    return meta
+
+
+def get_s3_client() -> typing.Any:
+    '''
+    boto3 is imported on first use, it takes longer to import than the whole tool.
+    '''
+    import boto3
+
+    return boto3.client("s3")
+
+
+# https://api.slack.com/reference/surfaces/formatting#building-attachments
+def send_notification(api_url: str, channel: str, title: str, message: str, is_failed: bool = False) -> int:
+    color = "#FF9FA1" if is_failed else "#BDFFC3"
+
+    if api_url and channel:
+        data = json.dumps({
+            "username": "grafana-backup-tool", "channel": channel,
+            "icon_url": "https://grafana.com/img/fav32.png",
+            "attachments": [{
+                "title": title, "color": color, "text": message
+            }]
+        })
+
+        from urllib import request
+
+        headers = {"Content-type": "application/json"}
+        req = request.Request(
+            method="POST", url=api_url, headers=headers, data=data.encode()
+        )
+
+        with request.urlopen(req) as client:
+            return client.status
+
+
+# https://docs.aws.amazon.com/AmazonS3/latest/userguide/mpuoverview.html
+class MultipartUpload(io.RawIOBase):
+    '''
+    Writable stream that uploads data to S3 as parts of "part_size" bytes.
+    Parts are uploaded by the "executor" (pipeline.Stage) if it is set, the writer waits only for a full queue.
+    '''
+    def __init__(self, client: typing.Any, bucket: str, key: str, part_size: int = 8 * 1024 * 1024, executor: pipeline.Stage = None) -> None:
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._executor = executor
+        self._buffer = bytearray()
+        self._parts = []
+        self._tasks = []
+        self._count = 0
+
+        resp = client.create_multipart_upload(Bucket=bucket, Key=key)
+        self._upload_id = resp["UploadId"]
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+
+        while len(self._buffer) >= self._part_size:
+            self._submit_part(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+
+        return len(data)
+
+    def _submit_part(self, data: bytes) -> None:
+        self._count += 1
+
+        if self._executor:
+            self._tasks.append(self._executor.submit(self._upload_part, self._count, data, size=len(data)))
+
+        else:
+            self._parts.append(self._upload_part(self._count, data))
+
+    def _upload_part(self, number: int, data: bytes) -> dict:
+        resp = self._client.upload_part(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id, PartNumber=number, Body=data
+        )
+
+        logging.debug("Uploaded part: {} ({} bytes)".format(number, len(data)))
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        if self._buffer or not self._count:
+            self._submit_part(bytes(self._buffer))
+            self._buffer.clear()
+
+        parts = self._parts + [task.result() for task in self._tasks]
+        self._client.complete_multipart_upload(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": sorted(parts, key=lambda item: item["PartNumber"])}
+        )
+        super().close()
+
+    def abort(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        futures.wait(self._tasks)
+        if not self.closed:
+            self._client.abort_multipart_upload(Bucket=self._bucket, Key=self._key, UploadId=self._upload_id)
+            super().close()
+
+
 class Backup:
-    def __init__(self, client: grafana.Grafana, base_dir: str) -> None:
+    def __init__(self, client: grafana.Grafana, base_dir: str, concurrency: int = 1, incremental: bool = False, codec: str = "gzip",
+                 resources: list = None, with_graph: bool = True) -> None:
         self._grafana = client
+        self._exporters = exporters.get_exporters(resources)
         self._base_path = pathlib.Path(base_dir)
+        self._concurrency = max(1, concurrency)
+        self._incremental = incremental
+        self._codec = codec
         self._backup_items = []
+        self._backup_files = []
+        self.failed_items = []
+        self.failed_listings = []
         self._backup_items_file = "items.txt"
         self._backup_tmpl = r"%Y%m%d%H%M"
-        self._folder_data = "data.json"
-        self._folder_access = "access.json"
+        self._manifest_file = "manifest.json"
+        self._with_graph = with_graph
+        self._graph_file = "graph.json"
+        self._graph_items = []
+        self._manifest_lock = threading.Lock()
+        self._prev_manifest = {}
+        self._manifest = {}
+        self._store = None
+        self._store_items = {}
+        self._prev_store_items = {}
+        self._item_titles = {}
+        self._stream = None
+        self._stream_file = None
+        self._stream_writer = None
+        self._stream_lock = threading.Lock()
+        self._journal_file = "journal.jsonl"
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._checkpoints = {}
+        self._catalog = None
+        self._pipeline = None
+
+    @property
+    def client(self) -> grafana.Grafana:
+        return self._grafana
+
+    @property
+    def base_path(self) -> pathlib.Path:
+        return self._base_path
+
+    @property
+    def pipeline(self) -> pipeline.Pipeline:
+        return self._pipeline
 
     def backup_all(self) -> None:
-        self.backup_folders()
-        self.backup_dashboards()
-        self.backup_datasources()
+        '''
+        A failed listing fails the run, the backup is incomplete and must not replace the previous one.
+        '''
+        self.backup_items(self._exporters)
         self.create_item_list()
+        self.flush_pipeline()
+
+        if self.failed_listings:
+            raise Exception("Failed listing: {}".format(", ".join(self.failed_listings)))
 
     def update_item_list(self, name: str, file: str) -> None:
         self._backup_items.append("\"{}\": {}".format(name, file))
+        self._item_titles[str(file)] = name
 
     def create_item_list(self) -> None:
         path = self._base_path.joinpath(self._backup_items_file)
 
         logging.info("Store backup items: {}".format(path))
         data = "\n".join(self._backup_items)
-        path.write_text(data)
+        self.write_file(path, data)
+
+    def write_file(self, path: pathlib.Path, data: typing.Union[str, bytes]) -> None:
+        if isinstance(data, str):
+            data = data.encode()
+
+        # Store objects are uploaded in parallel, files and the archive stream are written in order by one worker.
+        if self._pipeline:
+            self._pipeline.add_bytes(len(data))
+            stage = self._pipeline.stages["upload" if self._store else "write"]
+            stage.submit(self.store_file, path, data, size=len(data))
+
+        else:
+            self.store_file(path, data)
+
+    def store_file(self, path: pathlib.Path, data: bytes) -> None:
+        if self._store:
+            self._store_items[str(path)] = self._store.put(data)
+
+        elif self._stream_file:
+            info = tarfile.TarInfo(str(path))
+            info.size = len(data)
+            info.mtime = int(time.time())
+
+            # Writes queued by a failed run must not fall back to the local directory.
+            with self._stream_lock:
+                if self._stream is None:
+                    raise Exception("Archive stream is closed: {}".format(path))
+
+                self._stream.addfile(info, io.BytesIO(data))
+
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+
+        self._backup_files.append(str(path))
+
+    def open_journal(self, resume: bool = False) -> None:
+        '''
+        Record every stored item in journal.jsonl, items of the journal are not fetched again by a resumed run.
+        '''
+        path = self._base_path.joinpath(self._journal_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if not (resume and path.exists()):
+            self._journal = open(path, "w")
+            return
+
+        data = path.read_text()
+        for line in data.splitlines():
+            try:
+                item = json.loads(line)
+                self._checkpoints[(item["type"], item["key"])] = item
+
+            # The last line of a killed run can be incomplete.
+            except ValueError:
+                logging.warning("Skip journal line: {}".format(line))
+
+        self._journal = open(path, "a")
+        if data and not data.endswith("\n"):
+            self._journal.write("\n")
+
+        logging.info("Resume from journal: {} ({} items)".format(path, len(self._checkpoints)))
+
+    def close_journal(self, remove: bool = False) -> None:
+        '''
+        Close the journal, "remove" is set after the archive is uploaded, so the next run starts from zero.
+        '''
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+        if remove:
+            self._base_path.joinpath(self._journal_file).unlink(missing_ok=True)
+
+    def write_journal(self, exporter: exporters.Exporter, item: dict, path: pathlib.Path) -> None:
+        data = json.dumps({
+            "type": exporter.name, "key": exporter.get_key(item),
+            "file": str(path) if path else None, "state": exporter.get_checkpoint(self, item)
+        })
+
+        # The line is written after the files of the item, they are queued to the same worker before it.
+        if self._pipeline:
+            self._pipeline.stages["write"].submit(self.append_journal, data)
+
+        else:
+            self.append_journal(data)
+
+    def append_journal(self, data: str) -> None:
+        # Every line is flushed, an evicted pod keeps all items stored before it.
+        with self._journal_lock:
+            self._journal.write("{}\n".format(data))
+            self._journal.flush()
+
+    def open_pipeline(self, queue_size: int = 0, upload_concurrency: int = 4) -> None:
+        '''
+        Run the backup as stages connected by bounded queues: list, fetch, write (files or the archive stream) and upload.
+        Call it before open_stream() or open_store(), close_pipeline() returns the per-stage report.
+        '''
+        self._pipeline = pipeline.Pipeline()
+        self._pipeline.add_stage("list", 0)
+        self._pipeline.add_stage("fetch", self._concurrency, queue_size)
+        self._pipeline.add_stage("write", 1, queue_size, stop_on_error=True)
+        self._pipeline.add_stage("upload", max(1, upload_concurrency), queue_size, stop_on_error=True)
+
+    def flush_pipeline(self) -> None:
+        '''
+        Wait for queued writes and uploads, an error of these stages fails the run.
+        '''
+        if self._pipeline:
+            self._pipeline.stages["write"].join()
+            self._pipeline.stages["upload"].join()
+
+    def close_pipeline(self) -> str:
+        if not self._pipeline:
+            return ""
+
+        self._pipeline.close()
+        summary = self._pipeline.summary()
+        logging.info("Pipeline summary:\n{}".format(summary))
+        return summary
+
+    def open_catalog(self, catalog: typing.Any) -> None:
+        '''
+        Index the run as a snapshot of the catalog (catalog.Catalog), it is closed by create_archive().
+        '''
+        self._catalog = catalog
+        self._catalog.open_snapshot(datetime.datetime.now().strftime(self._backup_tmpl))
+
+    def open_store(self, content_store: store.ContentStore) -> None:
+        '''
+        Send all stored items to the content-addressed store instead of the local directory.
+        '''
+        self._store = content_store
+        manifests = content_store.list_manifests()
+
+        # Objects of the last snapshot are not uploaded again.
+        if manifests:
+            self._prev_store_items = content_store.get_manifest(manifests[-1])
+
+        logging.info("Open content store (snapshots: {})".format(len(manifests)))
+
+    def close_store(self) -> str:
+        '''
+        Store the snapshot manifest and return its name.
+        '''
+        stamp = datetime.datetime.now().strftime(self._backup_tmpl)
+        self.create_manifest("manifests/{}.json".format(stamp))
+
+        items = {}
+        for (path, digest) in self._store_items.items():
+            title = self._item_titles.get(path) or self._item_titles.get(str(pathlib.Path(path).parent))
+            items[path] = {"digest": digest, "title": title}
+
+        # Dashboards skipped by the incremental mode are taken from the last snapshot.
+        for item in self._manifest.values():
+            if (item["file"] not in items) and (item["file"] in self._prev_store_items):
+                items[item["file"]] = self._prev_store_items[item["file"]]
+
+        name = self._store.put_manifest(stamp, items)
+        self._store = None
+
+        logging.info("Stored snapshot: {} ({} items)".format(name, len(items)))
+        return name
+
+    def open_stream(self, bucket: str) -> str:
+        '''
+        Send all stored items to the S3 archive instead of the local directory.
+        Return the archive name.
+        '''
+        name = self.get_archive_name()
+        executor = self._pipeline.stages["upload"] if self._pipeline else None
+        self._stream_file = MultipartUpload(get_s3_client(), bucket, name, executor=executor)
+        self._stream_writer = compress.open_writer(self._stream_file, self._codec)
+        self._stream = tarfile.open(fileobj=self._stream_writer, mode="w|")
+
+        logging.info("Open archive stream: s3://{}/{}".format(bucket, name))
+        return name
+
+    def close_stream(self) -> str:
+        name = self._stream_file._key
+        self.create_manifest(name)
+
+        self._stream.close()
+        self._stream_writer.close()
+        self._stream_file.close()
+        self._stream = None
+
+        logging.info("Uploaded archive stream: {}".format(name))
+        return name
+
+    def abort_stream(self) -> None:
+        '''
+        Abort the multipart upload, write workers still running fail on the closed stream.
+        '''
+        with self._stream_lock:
+            (stream, self._stream) = (self._stream, None)
+
+        if stream:
+            self._stream_file.abort()
+            logging.info("Aborted archive stream")
+
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/get_object.html
+    def load_manifest(self, location: str) -> None:
+        '''
+        Load the manifest of the previous run from a local path or "s3://bucket/key".
+        '''
+        try:
+            if location.startswith("s3://"):
+                (bucket, key) = location[5:].split("/", 1)
+                data = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+
+            else:
+                data = pathlib.Path(location).read_bytes()
+
+        except Exception as error:
+            logging.warning("Manifest is not loaded: {} ({}: {})".format(location, error.__class__.__name__, error))
+            return
+
+        self._prev_manifest = json.loads(data).get("dashboards", {})
+        logging.info("Loaded manifest: {} ({} dashboards)".format(location, len(self._prev_manifest)))
+
+    def save_manifest(self, location: str) -> None:
+        data = json.dumps({"dashboards": self._manifest})
+
+        if location.startswith("s3://"):
+            (bucket, key) = location[5:].split("/", 1)
+            get_s3_client().put_object(Bucket=bucket, Key=key, Body=data.encode())
+
+        else:
+            pathlib.Path(location).write_text(data)
+
+        logging.info("Saved manifest: {}".format(location))
+
+    def create_manifest(self, archive: str) -> None:
+        '''
+        Store the merged manifest. Changed dashboards point to the current archive.
+        '''
+        for item in self._manifest.values():
+            item["archive"] = item["archive"] or archive
+
+        if self._catalog:
+            self._catalog.close_snapshot(archive, self._manifest)
+
+        path = self._base_path.joinpath(self._manifest_file)
+        logging.info("Store manifest: {}".format(path))
+        self.write_file(path, json.dumps({"dashboards": self._manifest}))
+
+        if self._with_graph:
+            self.create_graph()
+
+        # The archive, the stream and the store snapshot are closed after the last queued write.
+        self.flush_pipeline()
+
+    def create_graph(self) -> None:
+        '''
+        Store dependencies of the stored items for selective restore, file paths are relative to the backup directory.
+        '''
+        items = [(kind, key, item, self.get_relative_path(file)) for (kind, key, item, file) in self._graph_items]
+        dashboards = {uid: dict(item, file=self.get_relative_path(item["file"])) for (uid, item) in self._manifest.items()}
+
+        path = self._base_path.joinpath(self._graph_file)
+        logging.info("Store dependency graph: {}".format(path))
+        self.write_file(path, graph.build_graph(items, dashboards).dumps())
+
+    def get_relative_path(self, file: str) -> str:
+        return pathlib.Path(os.path.relpath(file, self._base_path)).as_posix() if file else None
+
+    def update_manifest(self, uid: str, item: dict) -> None:
+        with self._manifest_lock:
+            self._manifest[uid] = item
+
+    def get_archive_name(self) -> str:
+        stamp = datetime.datetime.now().strftime(self._backup_tmpl)
+        return "{}.{}".format(stamp, compress.EXTENSIONS[self._codec])
 
     def create_archive(self) -> str:
         '''
         Return path to the archive.
+        In incremental mode the archive contains only files stored by the current run.
         '''
-        time = datetime.datetime.now()
-        path = "{}.tgz".format(time.strftime(self._backup_tmpl))
+        if self._store:
+            return self.close_store()
+
+        if self._stream:
+            return self.close_stream()
+
+        path = self.get_archive_name()
+        self.create_manifest(path)
         path = str(self._base_path.joinpath(path))
+        extensions = tuple(map(lambda item: ".{}".format(item), compress.EXTENSIONS.values()))
 
         logging.debug("Open archive: {}".format(path))
-        with tarfile.open(path, "w:gz") as archive_file:
-            for (root, _, files) in os.walk(str(self._base_path)):
-                files = filter(lambda item: not item.endswith(".tgz"), files)
-
-                for file_item in files:
-                    file_name = os.path.join(root, file_item)
-                    archive_file.add(file_name)
+        with open(path, "wb") as file, compress.open_writer(file, self._codec) as writer:
+            with tarfile.open(fileobj=writer, mode="w|") as archive_file:
+                if self._incremental:
+                    # graph.json goes first, so a selective restore keeps only files of the selected items.
+                    graph_file = str(self._base_path.joinpath(self._graph_file))
+                    for file_name in sorted(dict.fromkeys(self._backup_files), key=lambda item: item != graph_file):
+                        archive_file.add(file_name, recursive=False)
+
+                else:
+                    for (root, _, files) in os.walk(str(self._base_path)):
+                        files = filter(lambda item: not item.endswith(extensions) and item != self._journal_file, files)
+
+                        for file_item in files:
+                            file_name = os.path.join(root, file_item)
+                            archive_file.add(file_name)
 
         logging.info("Created archive: {}".format(path))
         return path
 
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-uploading-files.html
-    def upload_archive(self, path: str, bucket: str) -> None:
-        client = boto3.client("s3")
+    def upload_archive(self, path: str, bucket: str, prefix: str = "", client: typing.Any = None) -> str:
+        '''
+        Return the object key, "prefix" separates archives of several instances in one bucket.
+        '''
+        client = client or get_s3_client()
         file = pathlib.Path(path)
-        client.upload_file(str(file), bucket, file.name)
-        logging.info("Upload archive: {} to S3 bucket: s3://{}".format(file.name, bucket))
+        key = "{}/{}".format(prefix.strip("/"), file.name).lstrip("/")
+        client.upload_file(str(file), bucket, key)
+        logging.info("Upload archive: {} to S3 bucket: s3://{}".format(key, bucket))
+        return key
 
-    # https://api.slack.com/reference/surfaces/formatting#building-attachments
     def send_notification(self, api_url: str, channel: str, message: str, is_failed: bool = False) -> int:
-        color = "#FF9FA1" if is_failed else "#BDFFC3"
+        title = "Backup data from instance: {}".format(self._grafana.url.geturl())
+        return send_notification(api_url, channel, title, message, is_failed)
 
-        if api_url and channel:
-            data = json.dumps({
-                "username": "grafana-backup-tool", "channel": channel,
-                "icon_url": "https://grafana.com/img/fav32.png",
-                "attachments": [{
-                    "title": "Backup data from instance: {}".format(self._grafana.url.geturl()),
-                    "color": color, "text": message
-                }]
-            })
+    def backup_items(self, exporter_items: list) -> None:
+        '''
+        Run items of all exporters through one pool of workers.
+        Results are collected in listing order to keep items.txt stable.
+        '''
+        # The number of pending tasks is bounded to keep memory flat.
+        tasks = collections.deque()
+        (items, limit) = (self.iter_items(exporter_items), self._concurrency * 2)
 
-            headers = {"Content-type": "application/json"}
-            req = request.Request(
-                method="POST", url=api_url, headers=headers, data=data.encode()
-            )
+        # The fetch stage replaces the pool, listing waits while its queue is full.
+        if self._pipeline:
+            executor = self._pipeline.stages["fetch"]
+            (items, limit) = (self._pipeline.iter_source("list", items), limit + executor.queue_size)
 
-            with request.urlopen(req) as client:
-                return client.status
+        else:
+            executor = futures.ThreadPoolExecutor(max_workers=self._concurrency)
 
-    def backup_folders(self) -> None:
-        logging.debug("Create directory: {}".format(self._base_path))
-        self._base_path.mkdir(parents=True, exist_ok=True)
+        try:
+            for (exporter, item) in items:
+                tasks.append((exporter, item, self.submit_item(executor, exporter, item)))
 
-        logging.debug("Run list_folders()")
-        for folder_item in self._grafana.list_folders():
-            logging.debug("Current item: {}".format(folder_item))
+                if len(tasks) >= limit:
+                    self.collect_item(*tasks.popleft())
 
-            folder_path = self._base_path.joinpath(str(folder_item["id"]))
-            self.update_item_list(folder_item["title"], folder_path)
+            while tasks:
+                self.collect_item(*tasks.popleft())
 
-            logging.info("Create directory: {}".format(folder_path))
-            folder_path.mkdir(exist_ok=True)
+        finally:
+            if self._pipeline:
+                self._pipeline.set_current()
 
-            logging.debug("Run get_folder_by_uid({})".format(folder_item["uid"]))
-            tmp = json.dumps(self._grafana.get_folder_by_uid(folder_item["uid"]))
+            else:
+                executor.shutdown(wait=True)
 
-            folder_data = folder_path.joinpath(self._folder_data)
-            logging.info("Store folder data: {}".format(folder_data))
-            folder_data.write_text(tmp)
+    def submit_item(self, executor: typing.Any, exporter: exporters.Exporter, item: dict) -> futures.Future:
+        '''
+        Return the export task, an item stored by the interrupted run is resumed from the journal.
+        '''
+        checkpoint = self._checkpoints.get((exporter.name, exporter.get_key(item)))
 
-            logging.debug("Run get_folder_permissions({})".format(folder_item["uid"]))
-            tmp = json.dumps(self._grafana.get_folder_permissions(folder_item["uid"]))
+        if (checkpoint is None) or (checkpoint["file"] and not os.path.exists(checkpoint["file"])):
+            return executor.submit(self.export_item, exporter, item)
 
-            folder_access = folder_path.joinpath(self._folder_access)
-            logging.info("Store folder access: {}".format(folder_access))
-            folder_access.write_text(tmp)
+        logging.debug("Resume {}: {}".format(exporter.name, checkpoint["key"]))
+        exporter.resume(self, item, checkpoint["state"])
 
-    def backup_dashboards(self) -> None:
-        logging.debug("Run list_folders()")
-        folder_ids = self._grafana.list_folders()
-        folder_ids = list(map(lambda item: item["id"], folder_ids))
+        # A folder is journaled as its directory, dashboards below it are journaled on their own.
+        if checkpoint["file"] and os.path.isdir(checkpoint["file"]):
+            self._backup_files.extend(sorted(str(path) for path in pathlib.Path(checkpoint["file"]).iterdir() if path.is_file()))
 
-        logging.debug("Run list_dashboards({})".format(folder_ids))
-        for dash_item in self._grafana.list_dashboards(folder_ids):
-            logging.debug("Current item: {}".format(dash_item))
+        elif checkpoint["file"]:
+            self._backup_files.append(checkpoint["file"])
 
-            dash_folder_id = dash_item.get("folderId", 0)
-            logging.debug("Get folder id: {}".format(dash_folder_id))
+        task = futures.Future()
+        task.set_result(pathlib.Path(checkpoint["file"]) if checkpoint["file"] else None)
+        return task
 
-            if dash_folder_id:
-                folder_path = self._base_path.joinpath(str(dash_folder_id))
-                folder_path = folder_path.joinpath("dashboards")
-                folder_path.mkdir(parents=True, exist_ok=True)
+    def export_item(self, exporter: exporters.Exporter, item: dict) -> pathlib.Path:
+        path = exporter.export(self, item)
 
-                logging.debug("Run get_dashboard_by_uid({})".format(dash_item["uid"]))
-                tmp = json.dumps(self._grafana.get_dashboard_by_uid(dash_item["uid"]))
+        if self._journal:
+            self.write_journal(exporter, item, path)
 
-                dash_file = folder_path.joinpath("{}.json".format(dash_item["uid"]))
-                logging.info("Store dashboard data: {}".format(dash_file))
-                self.update_item_list(dash_item["title"], dash_file)
-                dash_file.write_text(tmp)
+        return path
+
+    def iter_items(self, exporter_items: list) -> typing.Iterator[tuple]:
+        for exporter in exporter_items:
+            logging.debug("Run {}.list_items()".format(exporter.name))
+
+            try:
+                for item in exporter.list_items(self._grafana):
+                    yield (exporter, item)
+
+            except Exception as error:
+                logging.error("Failed listing: {} ({}: {})".format(exporter.name, error.__class__.__name__, error))
+                self.failed_items.append(exporter.name)
+                self.failed_listings.append(exporter.name)
+
+                # Without folders, dashboards or datasources there is nothing worth storing, e.g. Grafana is down or the token expired.
+                if exporter.default:
+                    raise
+
+    def collect_item(self, exporter: exporters.Exporter, item: dict, task: futures.Future) -> None:
+        if self._pipeline:
+            self._pipeline.wait(task)
+
+        try:
+            path = task.result()
+            if path:
+                self.update_item_list(exporter.get_title(item), path)
+
+            if self._catalog:
+                self._catalog.add_item(exporter.name, exporter.get_key(item), exporter.get_title(item), item)
+
+            if exporter.name != "dashboards":
+                self._graph_items.append((exporter.name, exporter.get_key(item), item, str(path) if path else None))
+
+        except Exception as error:
+            logging.error("Failed {}: {} ({}: {})".format(exporter.name, exporter.get_key(item), error.__class__.__name__, error))
+            self.failed_items.append(exporter.get_key(item))
+            exporter.on_failure(self, item)
+
+    def index_dashboard(self, path: str) -> None:
+        '''
+        Index a dashboard stored by the interrupted run, catalog changes after its last commit are lost.
+        '''
+        if self._catalog and path and os.path.exists(path):
+            self._catalog.add_dashboard(pathlib.Path(path).read_bytes())
+
+    def get_manifest_item(self, uid: str) -> dict:
+        with self._manifest_lock:
+            return self._manifest.get(uid)
+
+    def keep_manifest(self, uid: str) -> None:
+        '''
+        Keep the previous state of a failed dashboard, so it is fetched again by the next run.
+        '''
+        if uid in self._prev_manifest:
+            self.update_manifest(uid, self._prev_manifest[uid])
+
+    def get_dashboard_version(self, dash_item: dict) -> int:
+        if "version" in dash_item:
+            return dash_item["version"]
+
+        logging.debug("Run get_dashboard_versions({})".format(dash_item["uid"]))
+        versions = self._grafana.get_dashboard_versions(dash_item["uid"])
+        return versions[0].get("version") if versions else None
+
+    def backup_dashboard(self, dash_item: dict) -> pathlib.Path:
+        '''
+        Return path to the stored file or None if the dashboard is not changed.
+        '''
+        logging.debug("Current item: {}".format(dash_item))
+        prev_item = self._prev_manifest.get(dash_item["uid"])
+
+        if self._incremental and prev_item:
+            version = self.get_dashboard_version(dash_item)
+
+            if version is not None and version == prev_item["version"]:
+                logging.debug("Skip unchanged dashboard: {} (version: {})".format(dash_item["uid"], version))
+                self.update_manifest(dash_item["uid"], dict(prev_item, title=dash_item["title"]))
+                return None
 
-    def backup_datasources(self) -> None:
-        ds_folder = self._base_path.joinpath("datasources")
-        logging.info("Create directory: {}".format(ds_folder))
-        ds_folder.mkdir(parents=True, exist_ok=True)
+        dash_folder_id = dash_item.get("folderId", 0)
+        logging.debug("Get folder id: {}".format(dash_folder_id))
 
-        logging.debug("Run list_datasources()")
-        for item in self._grafana.list_datasources():
-            logging.debug("Current item: {}".format(item))
+        folder_path = self._base_path.joinpath(str(dash_folder_id))
+        folder_path = folder_path.joinpath("dashboards")
 
-            ds_file = ds_folder.joinpath("{}.json".format(item["id"]))
-            self.update_item_list(item["name"], ds_file)
+        # The body is stored as received, only "meta" and the references of the graph are decoded.
+        logging.debug("Run get_dashboard_by_uid_raw({})".format(dash_item["uid"]))
+        data = self._grafana.get_dashboard_by_uid_raw(dash_item["uid"]) or b"{}"
+        text = data.decode()
+        meta = get_meta(text)
+        references = graph.get_raw_references(text) if self._with_graph else {}
 
-            logging.info("Store datasource data: {}".format(ds_file))
-            ds_file.write_text(json.dumps(item))
+        # The catalog indexes panel queries, it is the only user of the whole model.
+        if self._catalog:
+            self._catalog.add_dashboard(data)
+
+        dash_file = folder_path.joinpath("{}.json".format(dash_item["uid"]))
+        logging.info("Store dashboard data: {}".format(dash_file))
+        self.write_file(dash_file, data)
+
+        self.update_manifest(dash_item["uid"], {
+            "title": dash_item["title"], "folderId": dash_folder_id,
+            "folderUid": meta.get("folderUid", dash_item.get("folderUid", "")), "tags": dash_item.get("tags", []),
+            "version": meta.get("version"), "updated": meta.get("updated"),
+            "file": str(dash_file), "archive": None, **references
+        })
+        return dash_file
 
 
 if __name__ == "__main__":
@@ -173,26 +749,94 @@ if __name__ == "__main__":
         datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
     )
 
+    concurrency = int(os.environ.get("BACKUP_CONCURRENCY", "") or 1)
+    collector = metrics.MetricsCollector()
+    rate_limit = float(os.environ.get("GRAFANA_RATE_LIMIT", "") or 0)
+    cache_ttl = float(os.environ.get("GRAFANA_CACHE_TTL", "") or 0)
     grafana_client = grafana.Grafana(
         url=os.environ.get("GRAFANA_URL", ""),
-        token=os.environ.get("GRAFANA_TOKEN", "")
+        token=os.environ.get("GRAFANA_TOKEN", ""),
+        pool_size=max(10, concurrency), hooks=[collector],
+        rate_limiter=grafana.RateLimiter(rate_limit) if rate_limit else None,
+        cache=grafana.ResponseCache(cache_ttl) if cache_ttl > 0 else None
     )
 
-    grafana_backup = Backup(grafana_client, "./data")
+    incremental = bool(os.environ.get("BACKUP_INCREMENTAL", ""))
+    manifest = os.environ.get("BACKUP_MANIFEST", "") or "./manifest.json"
+    streaming = bool(os.environ.get("BACKUP_STREAMING", ""))
+    store_location = os.environ.get("BACKUP_STORE", "")
+    codec = os.environ.get("BACKUP_CODEC", "") or "gzip"
+    bucket = os.environ.get("AWS_S3_BUCKET", "")
+
+    resources = list(filter(None, os.environ.get("BACKUP_EXPORTERS", "").split(",")))
+    resume = bool(os.environ.get("BACKUP_RESUME", ""))
+    pipelined = bool(os.environ.get("BACKUP_PIPELINE", ""))
+    queue_size = int(os.environ.get("BACKUP_QUEUE_SIZE", "") or 0)
+    upload_concurrency = int(os.environ.get("BACKUP_UPLOAD_CONCURRENCY", "") or 4)
+    catalog_location = os.environ.get("BACKUP_CATALOG", "")
+    catalog_file = None
+    with_graph = not os.environ.get("BACKUP_NO_GRAPH", "")
+    grafana_backup = Backup(grafana_client, "./data", concurrency, incremental, codec, resources, with_graph)
     try:
+        if incremental:
+            grafana_backup.load_manifest(manifest)
+
+        if resume and (store_location or streaming):
+            raise Exception("BACKUP_RESUME requires the local backup directory, unset BACKUP_STORE and BACKUP_STREAMING")
+
+        if pipelined:
+            grafana_backup.open_pipeline(queue_size, upload_concurrency)
+
+        if store_location:
+            grafana_backup.open_store(store.ContentStore(store_location))
+
+        elif streaming:
+            grafana_backup.open_stream(bucket)
+
+        else:
+            grafana_backup.open_journal(resume)
+
+        if catalog_location:
+            import catalog
+
+            catalog_file = catalog.Catalog(catalog_location)
+            grafana_backup.open_catalog(catalog_file)
+
         grafana_backup.backup_all()
         archive = grafana_backup.create_archive()
-        bucket = os.environ.get("AWS_S3_BUCKET", "")
-        grafana_backup.upload_archive(archive, bucket)
+
+        if not (store_location or streaming):
+            grafana_backup.upload_archive(archive, bucket)
+            grafana_backup.close_journal(remove=True)
+
+        if incremental:
+            grafana_backup.save_manifest(manifest)
+
+        if catalog_file:
+            catalog_file.close()
+
+        pipeline_summary = grafana_backup.close_pipeline()
+        message = "Successfully upload {} to {}".format(archive, store_location or "s3://{}/".format(bucket))
+        if grafana_backup.failed_items:
+            message = "{}\nFailed items: {}".format(message, ", ".join(grafana_backup.failed_items))
+
+        if os.environ.get("BACKUP_METRICS_SUMMARY", ""):
+            message = "{}\n{}".format(message, "\n".join(filter(None, (collector.summary(), pipeline_summary))))
 
         grafana_backup.send_notification(
             api_url=os.environ.get("SLACK_API_URL", ""),
             channel=os.environ.get("SLACK_CHANNEL", ""),
-            message="Successfully upload {} to s3://{}/".format(archive, bucket)
+            message=message, is_failed=bool(grafana_backup.failed_items)
         )
 
     except Exception as error:
         logging.error(traceback.format_exc())
+        grafana_backup.abort_stream()
+        grafana_backup.close_journal()
+
+        # Indexed versions are kept for the resumed run, it removes the incomplete snapshot and indexes journaled dashboards again.
+        if catalog_file:
+            catalog_file.close()
 
         message = "Failure: ({}: {})".format(error.__class__.__name__, error)
         grafana_backup.send_notification(
@@ -201,3 +845,9 @@ if __name__ == "__main__":
             message=message, is_failed=True
         )
         sys.exit(1)
+
+    finally:
+        logging.info("Requests summary:\n{}".format(collector.summary()))
+
+        if os.environ.get("BACKUP_METRICS_FILE", ""):
+            pathlib.Path(os.environ["BACKUP_METRICS_FILE"]).write_text(collector.prometheus())
@@ -0,0 +1,1069 @@
+import io
+import os
+import json
+import time
+import runpy
+import typing
+import random
+import asyncio
+import backup
+import store
+import graph
+import shutil
+import catalog
+import compress
+import exporters
+import restore
+import metrics
+import pipeline
+import grafana
+import verify
+import pathlib
+import tempfile
+import threading
+import unittest
+import functools
+import fake_grafana
+import grafana_async
+import orchestrator
+import get_backup
+
+from email import utils as email
+from unittest import mock
+from urllib import error as errors
+
+
+# https://docs.python.org/3/library/unittest.html
+class TestBackupRestore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.source = fake_grafana.State(folders=3, dashboards=20, panels=2, datasources=2)
+        self.source_server = fake_grafana.start(self.source)
+        self.target = fake_grafana.State(0, 0, 0, 0)
+        self.target_server = fake_grafana.start(self.target)
+        self.base_dir = tempfile.mkdtemp()
+
+        self.client = grafana.Grafana("http://127.0.0.1:{}/".format(self.source_server.server_port), "")
+        self.target_client = grafana.Grafana("http://127.0.0.1:{}/".format(self.target_server.server_port), "")
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.target_client.close()
+        self.source_server.shutdown()
+        self.target_server.shutdown()
+        self.source_server.server_close()
+        self.target_server.server_close()
+        shutil.rmtree(self.base_dir)
+
+    def test_backup_all(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4)
+        grafana_backup.backup_all()
+
+        # Folders, dashboards with General and datasources are the default types.
+        items = open(os.path.join(data_dir, "items.txt")).read().splitlines()
+        self.assertFalse(grafana_backup.failed_items)
+        self.assertEqual(len(items), 3 + 20 + 2)
+        self.assertTrue(os.path.exists(os.path.join(data_dir, "0", "dashboards", "dash-0.json")))
+        self.assertFalse(os.path.exists(os.path.join(data_dir, "annotations")))
+
+        # Library panels, alert rules, contact points and annotations are opt-in.
+        data_dir = os.path.join(self.base_dir, "all")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=list(exporters.EXPORTERS))
+        grafana_backup.backup_all()
+
+        items = open(os.path.join(data_dir, "items.txt")).read().splitlines()
+        self.assertFalse(grafana_backup.failed_items)
+        self.assertEqual(len(items), 3 + 20 + 2 + 3 + 3 + 1 + 2)
+        self.assertTrue(os.path.exists(os.path.join(data_dir, "alert_rules", "rule-folder-0.json")))
+
+    def test_backup_without_graph(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, with_graph=False)
+
+        # Dashboards are stored with only their "meta" object decoded.
+        with mock.patch.object(backup.graph, "get_raw_references", side_effect=AssertionError("references are extracted")):
+            grafana_backup.backup_all()
+            archive = grafana_backup.create_archive()
+
+        self.assertFalse(grafana_backup.failed_items)
+        self.assertFalse(os.path.exists(os.path.join(data_dir, "graph.json")))
+
+        data = json.loads(open(os.path.join(data_dir, "manifest.json")).read())
+        self.assertEqual(len(data["dashboards"]), 20)
+        self.assertEqual(data["dashboards"]["dash-1"]["version"], 1)
+        self.assertNotIn("datasources", data["dashboards"]["dash-1"])
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        with open(archive, "rb") as file, self.assertRaises(Exception):
+            grafana_restore.restore_selected(restore.iter_stream(file), tags=["lib"])
+
+    def test_failed_listing(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        self.source_server.RequestHandlerClass.token = "valid"
+
+        # An expired token fails the listing of a default type, nothing is left to upload.
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4)
+        with self.assertRaises(errors.HTTPError) as context:
+            grafana_backup.backup_all()
+
+        self.assertEqual(context.exception.code, 401)
+        self.assertEqual(grafana_backup.failed_listings, ["folders"])
+
+        # A failed opt-in type is reported after the others are stored.
+        self.source_server.RequestHandlerClass.token = ""
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=["folders", "dashboards", "annotations"])
+        with mock.patch.object(self.client, "list_annotations", side_effect=errors.URLError("refused")), self.assertRaises(Exception) as context:
+            grafana_backup.backup_all()
+
+        self.assertEqual(str(context.exception), "Failed listing: annotations")
+        self.assertEqual(len(open(os.path.join(data_dir, "items.txt")).read().splitlines()), 3 + 20)
+
+    def test_backup_resources(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=["dashboards", "annotations"])
+        grafana_backup.backup_all()
+
+        items = open(os.path.join(data_dir, "items.txt")).read().splitlines()
+        self.assertEqual(len(items), 20 + 2)
+        self.assertRaises(Exception, backup.Backup, self.client, data_dir, resources=["unknown"])
+
+    def test_restore_archive(self) -> None:
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "data"), concurrency=4)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        with open(archive, "rb") as file:
+            grafana_restore.restore_stream(restore.iter_stream(file))
+
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(set(self.target.folders), set(self.source.folders))
+        self.assertEqual(len(self.target.dashboards), 20)
+
+        for (uid, item) in self.target.dashboards.items():
+            self.assertEqual(item["meta"]["folderUid"], self.source.dashboards[uid]["meta"]["folderUid"])
+
+    def test_restore_library_panels(self) -> None:
+        self.source.add_dashboard({
+            "uid": "dash-lib", "title": "Library dashboard", "panels": [
+                {"id": 1, "libraryPanel": {"uid": "lib-folder-1", "name": "Library panel folder-1"}}
+            ]
+        }, "folder-2")
+
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=["folders", "dashboards", "library_panels"])
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        with open(archive, "rb") as file:
+            members = list(restore.iter_stream(file))
+
+        # The fake server rejects dashboards with unknown library panels, like Grafana.
+        # Reversed members come before their folders and library panels, they wait for them.
+        sources = {
+            "stream": lambda: ("restore_stream", members), "reversed": lambda: ("restore_stream", reversed(members)),
+            "directory": lambda: ("restore_all", restore.iter_directory(data_dir))
+        }
+
+        for (name, source) in sources.items():
+            with self.subTest(source=name):
+                for items in (self.target.folders, self.target.dashboards, self.target.library_panels):
+                    items.clear()
+
+                grafana_restore = restore.Restore(self.target_client, concurrency=4)
+                (method, items) = source()
+                getattr(grafana_restore, method)(items)
+
+                self.assertFalse(grafana_restore.failed_items)
+                self.assertEqual(set(self.target.library_panels), set(self.source.library_panels))
+                self.assertEqual(set(self.target.dashboards), set(self.source.dashboards))
+                self.assertEqual(self.target.library_panels["lib-folder-1"]["folderUid"], "folder-1")
+
+    def test_codecs(self) -> None:
+        for codec in compress.CODECS:
+            with self.subTest(codec=codec):
+                if not compress.is_available(codec):
+                    self.skipTest("{} is not installed".format(compress.MODULES[codec]))
+
+                data_dir = os.path.join(self.base_dir, codec)
+                grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, codec=codec)
+                grafana_backup.backup_all()
+                archive = grafana_backup.create_archive()
+                self.assertTrue(archive.endswith(compress.EXTENSIONS[codec]))
+
+                with open(archive, "rb") as file:
+                    items = dict(restore.iter_stream(file))
+
+                # Members are stored by the file path without the leading "/".
+                files = {name.lstrip("/"): loader() for (name, loader) in restore.iter_directory(data_dir) if name != archive}
+                self.assertEqual(sorted(items), sorted(files))
+                self.assertEqual(items, files)
+
+        # Blocks of the parallel writer are separate gzip members of one stream.
+        (output, data) = (io.BytesIO(), os.urandom(64 * 1024) * 4)
+        with compress.ParallelGzipFile(output, threads=4, block_size=10000) as writer:
+            writer.write(data)
+
+        self.assertEqual(compress.open_reader(io.BytesIO(output.getvalue())).read(), data)
+
+    def test_incremental(self) -> None:
+        manifest = os.path.join(self.base_dir, "manifest.json")
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run1"), incremental=True)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+        grafana_backup.save_manifest(manifest)
+
+        self.source.add_dashboard(self.source.dashboards["dash-1"]["dashboard"], "folder-0")
+
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run2"), incremental=True)
+        grafana_backup.load_manifest(manifest)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+
+        data = json.loads(open(os.path.join(self.base_dir, "run2", "manifest.json")).read())
+        self.assertEqual(data["dashboards"]["dash-1"]["version"], 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.base_dir, "run2", "{}".format(self.source.folders["folder-0"]["id"]), "dashboards"))), 1)
+
+    def test_restore_incremental(self) -> None:
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run1"), incremental=True)
+        grafana_backup.backup_all()
+        first_archive = grafana_backup.create_archive()
+
+        manifest = os.path.join(self.base_dir, "manifest.json")
+        grafana_backup.save_manifest(manifest)
+        self.source.add_dashboard(self.source.dashboards["dash-1"]["dashboard"], "folder-0")
+
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run2"), incremental=True)
+        grafana_backup.load_manifest(manifest)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        # graph.json comes first in incremental archives, the reversed order is the one of streamed archives.
+        with open(archive, "rb") as file:
+            members = list(restore.iter_stream(file))
+
+        self.assertEqual(pathlib.PurePosixPath(members[0][0]).name, "graph.json")
+        folder_dashboards = {uid for (uid, item) in self.source.dashboards.items() if item["meta"]["folderUid"] == "folder-0"}
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        grafana_restore.restore_selected(reversed(members), folders=["Folder 0"])
+        self.assertEqual(set(self.target.dashboards), {"dash-1"})
+        self.assertEqual(len(grafana_restore.failed_items), len(folder_dashboards) - 1)
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        grafana_restore.restore_selected(reversed(members), folders=["Folder 0"], open_archive=functools.partial(restore.iter_archive, first_archive))
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(set(self.target.dashboards), folder_dashboards)
+
+    def test_resume(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=list(exporters.EXPORTERS))
+        grafana_backup.open_journal()
+        grafana_backup.backup_all()
+        grafana_backup.close_journal()
+
+        # Keep the first items and an incomplete line, as a run killed in the middle.
+        journal = os.path.join(data_dir, "journal.jsonl")
+        lines = open(journal).read().splitlines()
+        open(journal, "w").write("\n".join(lines[:15] + [lines[15][:10]]))
+        done = sum(map(lambda line: json.loads(line)["type"] == "dashboards", lines[:15]))
+
+        collector = metrics.MetricsCollector()
+        client = grafana.Grafana("http://127.0.0.1:{}/".format(self.source_server.server_port), "", hooks=[collector])
+        grafana_backup = backup.Backup(client, data_dir, concurrency=4, resources=list(exporters.EXPORTERS))
+        grafana_backup.open_journal(resume=True)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+        grafana_backup.close_journal(remove=True)
+        client.close()
+
+        items = open(os.path.join(data_dir, "items.txt")).read().splitlines()
+        self.assertEqual(len(items), 3 + 20 + 2 + 3 + 3 + 1 + 2)
+        self.assertEqual(collector.latency[("GET", "/api/dashboards/uid/:uid")].count, 20 - done)
+        self.assertFalse(os.path.exists(journal))
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        with open(archive, "rb") as file:
+            grafana_restore.restore_stream(restore.iter_stream(file))
+
+        self.assertEqual(len(self.target.dashboards), 20)
+
+    def test_resume_incremental(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, incremental=True)
+        grafana_backup.open_journal()
+        grafana_backup.backup_all()
+        grafana_backup.close_journal()
+
+        journal = os.path.join(data_dir, "journal.jsonl")
+        lines = open(journal).read().splitlines()
+        open(journal, "w").write("\n".join(lines[:10]))
+
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, incremental=True)
+        grafana_backup.open_journal(resume=True)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+        grafana_backup.close_journal(remove=True)
+
+        # Journaled folders add their own files once, not the dashboards below them.
+        with open(archive, "rb") as file:
+            names = [name for (name, _) in restore.iter_stream(file)]
+
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(len([name for name in names if name.endswith("/data.json")]), 3)
+        self.assertEqual(len([name for name in names if "/dashboards/" in name]), 20)
+
+    def test_catalog(self) -> None:
+        catalog_file = catalog.Catalog(os.path.join(self.base_dir, "catalog.db"))
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run1"), concurrency=4)
+        grafana_backup.open_catalog(catalog_file)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+
+        dashboard = self.source.dashboards["dash-1"]["dashboard"]
+        dashboard["panels"][0]["targets"][0]["expr"] = "sum(up)"
+        self.source.add_dashboard(dashboard, "folder-0")
+
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run2"), concurrency=4)
+        grafana_backup.open_catalog(catalog_file)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+
+        self.assertEqual(len(catalog_file.list_snapshots()), 2)
+        self.assertEqual(len(catalog_file.find_datasource("Datasource 1")), 20)
+        self.assertEqual([item["uid"] for item in catalog_file.search('queries: "sum(up)"')], ["dash-1"])
+        self.assertEqual(catalog_file.find_title("dash-1")[0]["folder_title"], "Folder 0")
+
+        history = catalog_file.history("dash-1", 0)
+        self.assertEqual([item["version"] for item in history], [1, 2])
+        self.assertEqual(history[1]["changed"][0]["query"], "sum(up)")
+        catalog_file.close()
+
+    def test_catalog_resume(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        catalog_file = catalog.Catalog(os.path.join(self.base_dir, "catalog.db"))
+        catalog_file.commit_size = 1000
+
+        # The run is killed after all items are journaled, before the catalog is committed.
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4)
+        grafana_backup.open_journal()
+        grafana_backup.open_catalog(catalog_file)
+        grafana_backup.backup_all()
+        grafana_backup.close_journal()
+        catalog_file._db.close()
+
+        catalog_file = catalog.Catalog(os.path.join(self.base_dir, "catalog.db"))
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4)
+        grafana_backup.open_journal(resume=True)
+        grafana_backup.open_catalog(catalog_file)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+        grafana_backup.close_journal(remove=True)
+
+        self.assertEqual([item["dashboards"] for item in catalog_file.list_snapshots()], [20])
+        self.assertEqual(len(catalog_file.find_datasource("Datasource 1")), 20)
+        catalog_file.close()
+
+    def test_restore_selected(self) -> None:
+        self.source.add_dashboard({
+            "uid": "dash-lib", "title": "Library dashboard", "tags": ["lib"], "panels": [
+                {"id": 1, "libraryPanel": {"uid": "lib-folder-1", "name": "Library panel folder-1"}},
+                {"id": 2, "datasource": {"type": "prometheus", "uid": "ds-1"}, "targets": [{"refId": "A", "expr": "up"}]}
+            ]
+        }, "folder-2")
+
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4, resources=["folders", "dashboards", "datasources", "library_panels"])
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        with open(archive, "rb") as file:
+            grafana_restore.restore_selected(restore.iter_stream(file), tags=["lib"])
+
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(set(self.target.dashboards), {"dash-lib"})
+        self.assertEqual(set(self.target.folders), {"folder-1", "folder-2"})
+        self.assertEqual(set(self.target.datasources), {"ds-1"})
+        self.assertEqual(set(self.target.library_panels), {"lib-folder-1"})
+
+        grafana_restore.restore_selected(restore.iter_directory(data_dir), folders=["Folder 0"])
+        folder_dashboards = [uid for (uid, item) in self.source.dashboards.items() if item["meta"]["folderUid"] == "folder-0"]
+        self.assertEqual(set(self.target.dashboards), {"dash-lib"} | set(folder_dashboards))
+
+        # An existing library panel is updated with its current version.
+        self.target.library_panels["lib-folder-1"]["model"] = {"type": "stat", "title": "Edited"}
+        with open(archive, "rb") as file:
+            grafana_restore.restore_selected(restore.iter_stream(file), tags=["lib"])
+
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(self.target.library_panels["lib-folder-1"]["model"], self.source.library_panels["lib-folder-1"]["model"])
+        self.assertEqual(self.target.library_panels["lib-folder-1"]["version"], 2)
+
+    def test_raw_references(self) -> None:
+        dashboards = [item for item in self.source.dashboards.values()] + [{"meta": {}, "dashboard": {
+            "rows": [{"panels": [{"datasource": "Datasource 1", "targets": [{"datasource": {"uid": "ds-0"}, "expr": "{\"datasource\": \"quoted\"}"}]}]}],
+            "panels": [{"type": "row", "panels": [{"libraryPanel": {"uid": "lib-folder-1", "name": "Library panel"}}]}]
+        }}]
+
+        # References are found in the text as in the decoded model.
+        for item in dashboards:
+            text = json.dumps(item)
+            self.assertEqual(graph.get_raw_references(text), graph.get_references(item["dashboard"]))
+            self.assertEqual(graph.get_raw_references(json.dumps(item, indent=2)), graph.get_references(item["dashboard"]))
+
+    def test_pipeline(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        grafana_backup = backup.Backup(self.client, data_dir, concurrency=4)
+        grafana_backup.open_pipeline(queue_size=4)
+        grafana_backup.open_journal()
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+        grafana_backup.close_journal()
+        grafana_backup.close_pipeline()
+
+        report = dict(map(lambda item: (item["stage"], item), grafana_backup.pipeline.report()))
+        self.assertEqual(report["list"]["items"], 3 + 20 + 2)
+        self.assertEqual(report["fetch"]["items"], 3 + 20 + 2)
+        self.assertGreater(report["write"]["bytes"], 0)
+        self.assertEqual(len(open(os.path.join(data_dir, "journal.jsonl")).read().splitlines()), 3 + 20 + 2)
+
+        grafana_restore = restore.Restore(self.target_client, concurrency=4)
+        with open(archive, "rb") as file:
+            grafana_restore.restore_stream(restore.iter_stream(file))
+
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(len(self.target.dashboards), 20)
+
+        content_store = store.ContentStore(os.path.join(self.base_dir, "store"))
+        grafana_backup = backup.Backup(self.client, "data", concurrency=4)
+        grafana_backup.open_pipeline()
+        grafana_backup.open_store(content_store)
+        grafana_backup.backup_all()
+        name = grafana_backup.create_archive()
+        grafana_backup.close_pipeline()
+
+        self.assertEqual(len([path for path in content_store.get_manifest(name) if "/dashboards/" in path]), 20)
+
+    def test_pipeline_without_graph(self) -> None:
+        # The manifest is the last queued write, it must be stored before the archive is closed.
+        def get_names(mode: str) -> list:
+            grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, mode), concurrency=4, with_graph=False)
+            grafana_backup.open_pipeline(queue_size=4)
+
+            if mode == "stream":
+                grafana_backup.open_stream("backups")
+
+            elif mode == "store":
+                grafana_backup.open_store(content_store)
+
+            grafana_backup.backup_all()
+            name = grafana_backup.create_archive()
+            grafana_backup.close_pipeline()
+
+            if mode == "stream":
+                return [item for (item, _) in restore.iter_stream(io.BytesIO(s3_client.objects[name]))]
+
+            if mode == "store":
+                return list(content_store.get_manifest(name))
+
+            with open(name, "rb") as file:
+                return [item for (item, _) in restore.iter_stream(file)]
+
+        (s3_client, content_store) = (StubS3(), store.ContentStore(os.path.join(self.base_dir, "store")))
+        with mock.patch.object(backup, "get_s3_client", return_value=s3_client):
+            for mode in ("local", "stream", "store"):
+                with self.subTest(mode=mode):
+                    names = list(map(lambda item: pathlib.PurePosixPath(item).name, get_names(mode)))
+                    self.assertIn("manifest.json", names)
+                    self.assertNotIn("graph.json", names)
+                    self.assertEqual(len([item for item in names if item.startswith("dash-")]), 20)
+
+    def test_compressed_transfer(self) -> None:
+        self.source_server.RequestHandlerClass.compress = True
+        self.target_server.RequestHandlerClass.compress = True
+        collector = metrics.MetricsCollector()
+        source_client = grafana.Grafana("http://127.0.0.1:{}/".format(self.source_server.server_port), "", hooks=[collector])
+        target_client = grafana.Grafana("http://127.0.0.1:{}/".format(self.target_server.server_port), "", compress_min_size=256)
+
+        grafana_backup = backup.Backup(source_client, os.path.join(self.base_dir, "data"), concurrency=4)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        collector.received_bytes.clear()
+        data = source_client.get_dashboard_by_uid_raw("dash-1")
+        self.assertEqual(json.loads(data), self.source.dashboards["dash-1"])
+        self.assertLess(sum(collector.received_bytes.values()), len(data))
+
+        grafana_restore = restore.Restore(target_client, concurrency=4)
+        with open(archive, "rb") as file:
+            grafana_restore.restore_stream(restore.iter_stream(file))
+
+        self.assertFalse(grafana_restore.failed_items)
+        self.assertEqual(len(self.target.dashboards), 20)
+        source_client.close()
+        target_client.close()
+
+    def test_endpoints(self) -> None:
+        self.assertEqual(metrics.get_endpoint("/api/folders/abc/permissions"), "/api/folders/:uid/permissions")
+        self.assertEqual(metrics.get_endpoint("/api/library-elements/lib-1"), "/api/library-elements/:uid")
+        self.assertEqual(metrics.get_endpoint("/api/v1/provisioning/alert-rules/rule-1"), "/api/v1/provisioning/alert-rules/:uid")
+        self.assertEqual(metrics.get_endpoint("/api/dashboards/uid/dash-1/versions?limit=1"), "/api/dashboards/uid/:uid/versions")
+        self.assertEqual(metrics.get_endpoint("/api/dashboards/db"), "/api/dashboards/db")
+        self.assertEqual(metrics.get_endpoint("/api/datasources/12"), "/api/datasources/:id")
+
+    def test_verify(self) -> None:
+        data_dir = os.path.join(self.base_dir, "data")
+        backup.Backup(self.client, data_dir, concurrency=4).backup_all()
+
+        self.source.add_dashboard(dict(self.source.dashboards["dash-1"]["dashboard"], title="Edited"), self.source.dashboards["dash-1"]["meta"]["folderUid"])
+        self.source.add_dashboard(self.source.dashboards["dash-2"]["dashboard"], self.source.dashboards["dash-2"]["meta"]["folderUid"])
+        del self.source.dashboards["dash-3"]
+
+        report = verify.Verify(self.client, 4).compare(verify.index_backup(restore.iter_directory(data_dir)))
+        self.assertEqual(report["added"], [])
+        self.assertEqual(list(map(lambda item: item["key"], report["removed"])), ["dash-3"])
+        self.assertEqual(list(map(lambda item: item["key"], report["changed"])), ["dash-1"])
+        self.assertEqual(report["removed"][0]["title"], "Dashboard dash-3")
+
+    def test_verify_incremental(self) -> None:
+        manifest = os.path.join(self.base_dir, "manifest.json")
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run1"), incremental=True)
+        grafana_backup.backup_all()
+        grafana_backup.create_archive()
+        grafana_backup.save_manifest(manifest)
+
+        self.source.add_dashboard(dict(self.source.dashboards["dash-1"]["dashboard"], title="Edited"), self.source.dashboards["dash-1"]["meta"]["folderUid"])
+        grafana_backup = backup.Backup(self.client, os.path.join(self.base_dir, "run2"), incremental=True)
+        grafana_backup.load_manifest(manifest)
+        grafana_backup.backup_all()
+        archive = grafana_backup.create_archive()
+
+        # Unchanged dashboards are not in the archive, they are indexed by its manifest.
+        with open(archive, "rb") as file:
+            index = verify.index_backup(restore.iter_stream(file))
+
+        self.assertEqual(len(index["dashboards"]), 20)
+        self.assertEqual(index["dashboards"]["dash-1"]["title"], "Edited")
+        self.assertEqual(index["dashboards"]["dash-2"]["title"], "Dashboard dash-2")
+
+        self.source.add_dashboard(self.source.dashboards["dash-2"]["dashboard"], self.source.dashboards["dash-2"]["meta"]["folderUid"])
+        report = verify.Verify(self.client, 4).compare(index)
+        self.assertEqual((report["added"], report["removed"]), ([], []))
+        self.assertEqual(list(map(lambda item: (item["key"], item["reason"]), report["changed"])), [("dash-2", "version: 1 -> 2")])
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = fake_grafana.State(folders=1, dashboards=5, panels=2, datasources=1)
+        self.server = fake_grafana.start(self.state)
+        self.client = grafana.Grafana("http://127.0.0.1:{}/".format(self.server.server_port), "")
+        self.reused = []
+
+        acquire = self.client._pool.acquire
+
+        def track(key: tuple) -> tuple:
+            item = acquire(key)
+            self.reused.append(item[1])
+            return item
+
+        self.client._pool.acquire = track
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self) -> None:
+        for uid in self.state.dashboards:
+            self.assertTrue(self.client.get_dashboard_by_uid_raw(uid))
+
+        self.assertEqual(self.reused, [False] + [True] * (len(self.state.dashboards) - 1))
+
+    def test_stale_connection(self) -> None:
+        # The server closes keep-alive connections idle for longer than the handler timeout.
+        self.server.RequestHandlerClass.timeout = 0.2
+        self.assertTrue(self.client.get_dashboard_by_uid_raw("dash-0"))
+
+        time.sleep(0.5)
+        self.assertTrue(self.client.get_dashboard_by_uid_raw("dash-1"))
+        self.assertTrue(self.client.get_dashboard_by_uid_raw("dash-2"))
+
+        # The closed connection is retried once on a new one, which is reused by the next request.
+        self.assertEqual(self.reused, [False, True, False, True])
+
+
+class TestRetry(unittest.TestCase):
+    def test_backoff(self) -> None:
+        policy = grafana.RetryPolicy(backoff=0.5, max_backoff=4.0)
+        random.seed(1)
+
+        for attempt in range(6):
+            delays = [policy.get_delay(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= item <= min(4.0, 0.5 * (2 ** attempt)) for item in delays))
+
+            # Full jitter spreads delays over the whole interval.
+            self.assertGreater(max(delays) - min(delays), min(4.0, 0.5 * (2 ** attempt)) / 2)
+
+    def test_retry_after(self) -> None:
+        policy = grafana.RetryPolicy(max_backoff=30.0, max_retry_after=300.0)
+        self.assertEqual(policy.get_delay(0, "3"), 3.0)
+        self.assertEqual(policy.get_delay(0, "120"), 120.0)
+        self.assertEqual(policy.get_delay(0, "3600"), 300.0)
+        self.assertEqual(policy.get_delay(0, "-1"), 0.0)
+
+        with mock.patch("time.time", return_value=1700000000.0):
+            self.assertEqual(policy.get_delay(0, email.formatdate(1700000010, usegmt=True)), 10.0)
+            self.assertEqual(policy.get_delay(0, email.formatdate(1699999990, usegmt=True)), 0.0)
+
+        # An invalid value falls back to the backoff.
+        self.assertLessEqual(policy.get_delay(0, "soon"), policy.backoff)
+
+        client = grafana.Grafana("http://127.0.0.1/", "")
+        req = grafana.Request("GET", "http://127.0.0.1/api/folders")
+        self.assertEqual(client._get_retry_delay(req, 0, grafana.Response(429, "", {"Retry-After": "2"}, b"")), 2.0)
+        self.assertIsNone(client._get_retry_delay(req, 3, grafana.Response(429, "", {"Retry-After": "2"}, b"")))
+        self.assertIsNone(client._get_retry_delay(req, 0, grafana.Response(404, "", {}, b"")))
+
+    def test_methods(self) -> None:
+        state = fake_grafana.State(0, 0, 0, 0)
+        server = fake_grafana.start(state, error_rate=1.0)
+        collector = metrics.MetricsCollector()
+        client = grafana.Grafana("http://127.0.0.1:{}/".format(server.server_port), "", hooks=[collector], retry=grafana.RetryPolicy(3, backoff=0.001))
+
+        try:
+            self.assertRaises(errors.HTTPError, client.create_folder, "Folder")
+            self.assertRaises(errors.HTTPError, client.list_folders)
+
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        # POST is not idempotent and is sent once, GET is sent with 3 retries.
+        self.assertEqual(collector.latency[("POST", "/api/folders")].count, 1)
+        self.assertEqual(collector.retries[("POST", "/api/folders")], 0)
+        self.assertEqual(collector.latency[("GET", "/api/folders")].count, 4)
+        self.assertEqual(collector.retries[("GET", "/api/folders")], 3)
+
+    def test_rate_limiter(self) -> None:
+        clock = [100.0]
+
+        with mock.patch("time.monotonic", side_effect=lambda: clock[0]):
+            limiter = grafana.RateLimiter(10.0, burst=5)
+
+            # The burst is sent at once, the next requests wait 1 / rate each.
+            self.assertEqual([limiter.reserve() for _ in range(5)], [0.0] * 5)
+            self.assertAlmostEqual(limiter.reserve(), 0.1)
+            self.assertAlmostEqual(limiter.reserve(), 0.2)
+
+            # The bucket is refilled at the rate and holds at most the burst.
+            clock[0] += 10.0
+            self.assertEqual([limiter.reserve() for _ in range(5)], [0.0] * 5)
+            self.assertAlmostEqual(limiter.reserve(), 0.1)
+
+            limiter.throttle()
+            self.assertEqual(limiter.rate, 5.0)
+            for _ in range(100):
+                limiter.throttle()
+
+            self.assertEqual(limiter.rate, 1.0)
+            limiter.recover()
+            self.assertEqual(limiter.rate, 1.5)
+
+
+class ClearCache(grafana.RequestHook):
+    '''
+    Evict all cache entries after the lookup of every request, as a concurrent request filling the cache would.
+    '''
+    def __init__(self, cache: grafana.ResponseCache) -> None:
+        self.cache = cache
+
+    def before_request(self, method: str, url: str, data: bytes) -> None:
+        self.cache.clear()
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = fake_grafana.State(folders=1, dashboards=2, panels=2, datasources=1)
+        self.server = fake_grafana.start(self.state)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_port)
+        self.collector = metrics.MetricsCollector()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_statuses(self) -> list:
+        key = ("GET", "/api/dashboards/uid/:uid")
+        return [self.collector.statuses[key + (status, )] for status in (200, 304)]
+
+    def test_fresh(self) -> None:
+        client = grafana.Grafana(self.url, "", hooks=[self.collector], cache=grafana.ResponseCache(ttl=60))
+
+        for _ in range(3):
+            self.assertEqual(client.get_dashboard_by_uid("dash-1"), self.state.dashboards["dash-1"])
+
+        # Cache hits are counted as requests without received bytes.
+        key = ("GET", "/api/dashboards/uid/:uid")
+        self.assertEqual(self.get_statuses(), [3, 0])
+        self.assertEqual(self.collector.cache_hits[key], 2)
+        self.assertEqual(self.collector.received_bytes[key], len(client.cache.get(self.url + "api/dashboards/uid/dash-1")[0]))
+        self.assertIn("cached: 2", self.collector.summary())
+
+        # A write call clears the cache.
+        client.create_folder("Folder")
+        self.assertEqual(client.get_dashboard_by_uid("dash-1"), self.state.dashboards["dash-1"])
+        self.assertEqual(self.get_statuses(), [4, 0])
+        self.assertEqual(self.collector.cache_hits[key], 2)
+        client.close()
+
+    def test_failed_write(self) -> None:
+        client = grafana.Grafana(self.url, "", hooks=[self.collector], cache=grafana.ResponseCache(ttl=60))
+        client.get_dashboard_by_uid("dash-1")
+        request = client._pool.request
+
+        def fail_write(method: str, *args) -> grafana.Response:
+            if method != "GET":
+                raise ConnectionResetError("reset")
+
+            return request(method, *args)
+
+        # The write may have been applied before the connection failed.
+        with mock.patch.object(client._pool, "request", side_effect=fail_write), self.assertRaises(ConnectionResetError):
+            client.create_folder("Folder")
+
+        self.assertEqual(client.cache.size, 0)
+        client.get_dashboard_by_uid("dash-1")
+        self.assertEqual(self.collector.cache_hits[("GET", "/api/dashboards/uid/:uid")], 0)
+        client.close()
+
+    def test_revalidate(self) -> None:
+        cache = grafana.ResponseCache(ttl=0)
+        client = grafana.Grafana(self.url, "", hooks=[self.collector], cache=cache)
+
+        data = client.get_dashboard_by_uid_raw("dash-1")
+        self.assertEqual(client.get_dashboard_by_uid_raw("dash-1"), data)
+        self.assertEqual(self.get_statuses(), [1, 1])
+
+        self.state.add_dashboard(dict(self.state.dashboards["dash-1"]["dashboard"], title="Edited"))
+        self.assertEqual(json.loads(client.get_dashboard_by_uid_raw("dash-1"))["dashboard"]["title"], "Edited")
+        self.assertEqual(self.get_statuses(), [2, 1])
+
+        # The entry is evicted between the request with If-None-Match and the 304 response.
+        client.hooks.append(ClearCache(cache))
+        self.assertEqual(json.loads(client.get_dashboard_by_uid_raw("dash-1"))["dashboard"]["title"], "Edited")
+        self.assertEqual(self.get_statuses(), [2, 2])
+        self.assertEqual(cache.size, len(client.get_dashboard_by_uid_raw("dash-1")))
+        client.close()
+
+
+class StubS3:
+    '''
+    S3 client with the calls used by get_backup and MultipartUpload, "fail_after" breaks get_object after that number of calls.
+    "fail_part" breaks upload_part of that part number, parts are uploaded with a random delay to finish out of order.
+    '''
+    def __init__(self, objects: dict = None, page_size: int = 2, fail_after: int = 0, fail_part: int = 0) -> None:
+        self.objects = objects if objects is not None else {}
+        self.page_size = page_size
+        self.fail_after = fail_after
+        self.fail_part = fail_part
+        self.ranges = []
+        self.pages = 0
+        self.uploads = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket: str, Key: str) -> dict:
+        with self._lock:
+            upload_id = "upload-{}".format(len(self.uploads))
+            self.uploads[upload_id] = {}
+            self.calls.append(("CreateMultipartUpload", Key))
+
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> dict:
+        time.sleep(random.random() / 100)
+        if PartNumber == self.fail_part:
+            raise ConnectionError("injected error")
+
+        with self._lock:
+            self.uploads[UploadId][PartNumber] = Body
+
+        return {"ETag": '"{}-{}"'.format(UploadId, PartNumber)}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict) -> dict:
+        parts = self.uploads.pop(UploadId)
+        numbers = [item["PartNumber"] for item in MultipartUpload["Parts"]]
+
+        if numbers != list(range(1, len(parts) + 1)) or any(item["ETag"] != '"{}-{}"'.format(UploadId, item["PartNumber"]) for item in MultipartUpload["Parts"]):
+            raise Exception("InvalidPartOrder")
+
+        self.objects[Key] = b"".join(parts[number] for number in numbers)
+        self.calls.append(("CompleteMultipartUpload", Key))
+        return {}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str) -> None:
+        self.objects[Key] = pathlib.Path(Filename).read_bytes()
+        self.calls.append(("PutObject", Key))
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str) -> dict:
+        self.uploads.pop(UploadId)
+        self.calls.append(("AbortMultipartUpload", Key))
+        return {}
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {"ETag": '"{}"'.format(hash(self.objects[Key])), "ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket: str, Key: str, Range: str, IfMatch: str) -> dict:
+        with self._lock:
+            if self.fail_after and (len(self.ranges) >= self.fail_after):
+                raise ConnectionError("injected error")
+
+            self.ranges.append(Range)
+
+        (start, end) = map(int, Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.objects[Key][start:end + 1])}
+
+    def get_paginator(self, name: str) -> "StubS3":
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str, StartAfter: str = "") -> typing.Iterator[dict]:
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+
+        for index in range(0, len(keys), self.page_size):
+            self.pages += 1
+            yield {"Contents": [{"Key": key, "Size": len(self.objects[key])} for key in keys[index:index + self.page_size]]}
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.base_dir)
+
+    def test_resume(self) -> None:
+        data = os.urandom(10 * 1000 + 123)
+        path = os.path.join(self.base_dir, "202403052200.tgz")
+
+        # The download is interrupted after 5 of 11 parts.
+        client = StubS3({"202403052200.tgz": data}, fail_after=5)
+        download = get_backup.Download(client, "backups", "202403052200.tgz", path, part_size=1000, concurrency=2)
+        self.assertRaises(ConnectionError, download.run)
+
+        done = json.loads(open("{}.part.json".format(path)).read())["done"]
+        self.assertEqual(len(done), 5)
+        self.assertFalse(os.path.exists(path))
+
+        # Only the missing parts are requested again.
+        client = StubS3({"202403052200.tgz": data})
+        get_backup.Download(client, "backups", "202403052200.tgz", path, part_size=1000, concurrency=2).run()
+
+        self.assertEqual(len(client.ranges), 11 - 5)
+        self.assertFalse(set(client.ranges) & set("bytes={}-{}".format(index * 1000, index * 1000 + 999) for index in done))
+        self.assertEqual(open(path, "rb").read(), data)
+        self.assertFalse(os.path.exists("{}.part".format(path)) or os.path.exists("{}.part.json".format(path)))
+
+    def test_iter_objects(self) -> None:
+        keys = ["prod/2024{:02d}{:02d}2200.tgz".format(month, day) for month in range(1, 7) for day in (1, 15)]
+        client = StubS3(dict.fromkeys(keys, b"data"))
+
+        items = list(get_backup.iter_objects(client, "backups", "prod/", since="202403", until="202404"))
+        self.assertEqual([item["Key"] for item in items], keys[4:8])
+
+        # Listing starts after "since" and stops at the first page after "until".
+        self.assertEqual(client.pages, 3)
+        self.assertEqual(get_backup.get_latest(client, "backups", "prod/", months=1200)["Key"], keys[-1])
+        self.assertEqual(get_backup.get_latest(client, "backups", "dev/"), None)
+
+
+class TestMultipartUpload(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.base_dir)
+
+    def test_parts(self) -> None:
+        data = os.urandom(10 * 1000 + 123)
+        stage = pipeline.Stage("upload", workers=4, stop_on_error=True)
+        stage.start()
+
+        # Parts finish out of order, they are completed sorted by number.
+        client = StubS3()
+        with backup.MultipartUpload(client, "backups", "202403052200.tgz", part_size=1000, executor=stage) as upload:
+            for index in range(0, len(data), 777):
+                upload.write(data[index:index + 777])
+
+        stage.close()
+        self.assertEqual(client.objects["202403052200.tgz"], data)
+        self.assertEqual(client.calls, [("CreateMultipartUpload", "202403052200.tgz"), ("CompleteMultipartUpload", "202403052200.tgz")])
+
+    def test_abort(self) -> None:
+        stage = pipeline.Stage("upload", workers=4, stop_on_error=True)
+        stage.start()
+
+        client = StubS3(fail_part=3)
+        upload = backup.MultipartUpload(client, "backups", "202403052200.tgz", part_size=1000, executor=stage)
+        upload.write(os.urandom(10 * 1000))
+        self.assertRaises(ConnectionError, upload.close)
+
+        upload.abort()
+        stage.close()
+        self.assertEqual(client.calls, [("CreateMultipartUpload", "202403052200.tgz"), ("AbortMultipartUpload", "202403052200.tgz")])
+        self.assertEqual((client.objects, client.uploads), ({}, {}))
+
+    def test_abort_stream(self) -> None:
+        state = fake_grafana.State(folders=2, dashboards=10, panels=2, datasources=1)
+        server = fake_grafana.start(state)
+        client = grafana.Grafana("http://127.0.0.1:{}/".format(server.server_port), "")
+        (s3_client, data_dir) = (StubS3(), os.path.join(self.base_dir, "data"))
+
+        try:
+            grafana_backup = backup.Backup(client, data_dir, concurrency=4)
+            grafana_backup.open_pipeline(queue_size=2)
+
+            with mock.patch.object(backup, "get_s3_client", return_value=s3_client):
+                name = grafana_backup.open_stream("backups")
+
+            grafana_backup.backup_all()
+            grafana_backup.abort_stream()
+
+            # Writes after the abort fail instead of storing files in the local directory.
+            grafana_backup.write_file(pathlib.Path(data_dir, "late.json"), b"{}")
+            self.assertRaises(Exception, grafana_backup.flush_pipeline)
+            grafana_backup.close_pipeline()
+
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(s3_client.calls, [("CreateMultipartUpload", name), ("AbortMultipartUpload", name)])
+        self.assertFalse(os.path.exists(data_dir))
+
+
+class TestOrchestrator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.base_dir = tempfile.mkdtemp()
+        self.state = fake_grafana.State(folders=2, dashboards=10, panels=2, datasources=1)
+        self.server = fake_grafana.start(self.state)
+
+        # The port of a stopped server refuses connections, as an instance that is down.
+        down_server = fake_grafana.start(fake_grafana.State(0, 0, 0, 0))
+        down_server.shutdown()
+        down_server.server_close()
+
+        self.instances = [
+            {"name": "up", "url": "http://127.0.0.1:{}/".format(self.server.server_port), "concurrency": 2},
+            {"name": "down", "url": "http://127.0.0.1:{}/".format(down_server.server_port)}
+        ]
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.base_dir)
+
+    def test_run(self) -> None:
+        s3_client = StubS3()
+        grafana_orchestrator = orchestrator.Orchestrator(self.instances, "backups", base_dir=os.path.join(self.base_dir, "data"))
+
+        with mock.patch.object(backup, "get_s3_client", return_value=s3_client):
+            results = dict(map(lambda item: (item["name"], item), grafana_orchestrator.run()))
+
+        self.assertEqual((results["up"]["error"], results["up"]["failed_items"]), (None, []))
+        self.assertEqual(list(s3_client.objects), [results["up"]["key"]])
+        self.assertTrue(results["up"]["key"].startswith("up/"))
+
+        self.assertEqual(results["down"]["key"], None)
+        self.assertTrue(results["down"]["error"])
+        self.assertTrue(grafana_orchestrator.is_failed())
+        self.assertIn("down: failure", grafana_orchestrator.get_message())
+
+    def test_exit_status(self) -> None:
+        config = os.path.join(self.base_dir, "instances.json")
+        pathlib.Path(config).write_text(json.dumps({"instances": self.instances}))
+        environ = {"BACKUP_CONFIG": config, "AWS_S3_BUCKET": "backups", "SLACK_API_URL": "", "BACKUP_METRICS_FILE": ""}
+        (s3_client, cwd) = (StubS3(), os.getcwd())
+
+        # Archives of the command are stored in "./data".
+        os.chdir(self.base_dir)
+        try:
+            with mock.patch.dict(os.environ, environ), mock.patch.object(backup, "get_s3_client", return_value=s3_client):
+                with self.assertRaises(SystemExit) as context:
+                    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "orchestrator.py"), run_name="__main__")
+
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(context.exception.code, 1)
+        self.assertEqual(len(s3_client.objects), 1)
+
+
+class TestAsyncGrafana(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = fake_grafana.State(folders=2, dashboards=10, panels=20, datasources=2)
+        self.server = fake_grafana.start(self.state)
+        self.url = "http://127.0.0.1:{}/".format(self.server.server_port)
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_client(self, handler: typing.Callable, **kwargs) -> typing.Any:
+        async def run() -> typing.Any:
+            client = grafana_async.AsyncGrafana(self.url, "", **kwargs)
+            try:
+                return await handler(client)
+
+            finally:
+                await client.close()
+
+        return asyncio.run(run())
+
+    def test_gather(self) -> None:
+        async def handler(client: grafana_async.AsyncGrafana) -> list:
+            return await asyncio.gather(*map(client.get_dashboard_by_uid, self.state.dashboards))
+
+        items = self.run_client(handler, limit_per_host=4)
+        self.assertEqual(items, list(self.state.dashboards.values()))
+
+    def test_chunked(self) -> None:
+        self.server.RequestHandlerClass.chunk_size = 100
+
+        for compression in (False, True):
+            with self.subTest(compression=compression):
+                self.server.RequestHandlerClass.compress = compression
+                data = self.run_client(lambda client: client.get_dashboard_by_uid_raw("dash-1"), compression=compression)
+                self.assertEqual(json.loads(data), self.state.dashboards["dash-1"])
+
+    def test_keep_alive(self) -> None:
+        reused = []
+
+        async def handler(client: grafana_async.AsyncGrafana) -> None:
+            acquire = client._pool.acquire
+
+            async def track(key: tuple) -> tuple:
+                item = await acquire(key)
+                reused.append(item[2])
+                return item
+
+            client._pool.acquire = track
+            for uid in self.state.dashboards:
+                await client.get_dashboard_by_uid_raw(uid)
+
+        self.run_client(handler)
+        self.assertEqual(reused, [False] + [True] * (len(self.state.dashboards) - 1))
+
+    def test_not_found(self) -> None:
+        self.assertEqual(self.run_client(lambda client: client.get_dashboard_by_uid("missing")), {})
+
+        with self.assertRaises(errors.HTTPError) as context:
+            self.run_client(lambda client: client.get_datasource_by_id(999))
+
+        self.assertEqual(context.exception.code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import shutil
+import backup
+import restore
+import grafana
+import logging
+import argparse
+import tempfile
+import fake_grafana
+
+
+def run_size(dashboards: int, args: argparse.Namespace) -> dict:
+    '''
+    Backup a fake instance with "dashboards" items, archive it and restore it into an empty instance.
+    '''
+    source = fake_grafana.State(args.folders, dashboards, args.panels, args.datasources)
+    source_server = fake_grafana.start(source, latency=args.latency, error_rate=args.error_rate)
+    target = fake_grafana.State(0, 0, 0, 0)
+    target_server = fake_grafana.start(target, latency=args.latency)
+    base_dir = tempfile.mkdtemp(prefix="grafana-bench-")
+    result = {"dashboards": dashboards, "concurrency": args.concurrency, "codec": args.codec}
+
+    try:
+        client = grafana.Grafana("http://127.0.0.1:{}/".format(source_server.server_port), "", pool_size=max(10, args.concurrency))
+        grafana_backup = backup.Backup(client, os.path.join(base_dir, "data"), args.concurrency, codec=args.codec)
+
+        start = time.perf_counter()
+        grafana_backup.backup_all()
+        result["backup_seconds"] = round(time.perf_counter() - start, 3)
+        result["failed_items"] = len(grafana_backup.failed_items)
+
+        start = time.perf_counter()
+        archive = grafana_backup.create_archive()
+        result["archive_seconds"] = round(time.perf_counter() - start, 3)
+        result["archive_bytes"] = os.path.getsize(archive)
+
+        client = grafana.Grafana("http://127.0.0.1:{}/".format(target_server.server_port), "", pool_size=max(10, args.concurrency))
+        grafana_restore = restore.Restore(client, args.concurrency, check=False)
+
+        start = time.perf_counter()
+        with open(archive, "rb") as file:
+            grafana_restore.restore_stream(restore.iter_stream(file))
+
+        result["restore_seconds"] = round(time.perf_counter() - start, 3)
+        result["restore_failed_items"] = len(grafana_restore.failed_items)
+        result["restored_dashboards"] = len(target.dashboards)
+        result["dashboards_per_second"] = round(dashboards / max(result["backup_seconds"], 1e-6), 1)
+
+    finally:
+        source_server.shutdown()
+        target_server.shutdown()
+        source_server.server_close()
+        target_server.server_close()
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+    return result
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", dest="sizes", default="100,1000,10000", help="Set comma separated numbers of dashboards.")
+    parser.add_argument("--folders", dest="folders", default="20", type=int, help="Set number of folders.")
+    parser.add_argument("--panels", dest="panels", default="10", type=int, help="Set number of panels per dashboard.")
+    parser.add_argument("--datasources", dest="datasources", default="5", type=int, help="Set number of datasources.")
+    parser.add_argument("--latency", dest="latency", default="0", type=float, help="Set fake server latency in seconds.")
+    parser.add_argument("--error-rate", dest="error_rate", default="0", type=float, help="Set share of requests answered with 503.")
+    parser.add_argument("--concurrency", dest="concurrency", default="8", type=int, help="Set number of parallel workers.")
+    parser.add_argument("--codec", dest="codec", default="gzip", help="Set archive codec.")
+    parser.add_argument("--output", dest="output", default="", help="Set path for JSON results.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.WARNING
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    args = parse_args()
+    results = []
+
+    for size in map(int, args.sizes.split(",")):
+        results.append(run_size(size, args))
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    data = json.dumps({"python": sys.version.split()[0], "created": int(time.time()), "results": results}, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(data)
+
+    else:
+        print(data)
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import time
+import graph
+import typing
+import sqlite3
+import logging
+import pathlib
+import argparse
+import threading
+import traceback
+
+# DEBUG_MODE
+# BACKUP_CATALOG
+# AWS_ENDPOINT_URL
+# AWS_ACCESS_KEY_ID
+# AWS_SECRET_ACCESS_KEY
+
+# https://www.sqlite.org/fts5.html
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL, archive TEXT, created INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY, uid TEXT NOT NULL, version INTEGER, title TEXT, folder_uid TEXT,
+    folder_title TEXT, tags TEXT, updated TEXT, UNIQUE (uid, version)
+);
+CREATE TABLE IF NOT EXISTS snapshot_dashboards (
+    snapshot_id INTEGER NOT NULL, version_id INTEGER NOT NULL, file TEXT, PRIMARY KEY (snapshot_id, version_id)
+);
+CREATE INDEX IF NOT EXISTS snapshot_dashboards_version ON snapshot_dashboards (version_id);
+CREATE TABLE IF NOT EXISTS panels (
+    version_id INTEGER NOT NULL, panel_id INTEGER, title TEXT, query TEXT
+);
+CREATE INDEX IF NOT EXISTS panels_version ON panels (version_id);
+CREATE TABLE IF NOT EXISTS refs (
+    version_id INTEGER NOT NULL, panel_id INTEGER, datasource TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_datasource ON refs (datasource);
+CREATE TABLE IF NOT EXISTS items (
+    snapshot_id INTEGER NOT NULL, type TEXT NOT NULL, key TEXT NOT NULL, title TEXT, data TEXT,
+    PRIMARY KEY (snapshot_id, type, key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (title, tags, panels, queries);
+'''
+
+# Query text of the common datasources: Prometheus, SQL, Loki, InfluxDB, Graphite, Elasticsearch and expressions.
+QUERY_FIELDS = ("expr", "rawSql", "sql", "query", "rawQuery", "target", "expression")
+
+
+def get_query(target: dict) -> str:
+    return "\n".join(filter(lambda item: isinstance(item, str) and item, map(target.get, QUERY_FIELDS)))
+
+
+class Catalog:
+    '''
+    SQLite catalog of backup snapshots: dashboards, datasource references and panel queries with full-text search.
+    A dashboard version is stored once, every snapshot refers to the versions it contains.
+    The location is a local path or "s3://bucket/key", an S3 catalog is copied to "path" and uploaded by close().
+    '''
+    def __init__(self, location: str, path: str = "./catalog.db") -> None:
+        self._location = location
+        self._path = path if location.startswith("s3://") else location
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._pending = 0
+        self.commit_size = 100
+
+        if location.startswith("s3://"):
+            self.download()
+
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/download_file.html
+    def download(self) -> None:
+        import boto3
+
+        (bucket, key) = self._location[5:].split("/", 1)
+        try:
+            boto3.client("s3").download_file(bucket, key, self._path)
+            logging.info("Loaded catalog: {}".format(self._location))
+
+        except Exception as error:
+            logging.warning("Catalog is not loaded, create a new one: {} ({}: {})".format(self._location, error.__class__.__name__, error))
+            pathlib.Path(self._path).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+        if self._location.startswith("s3://"):
+            import boto3
+
+            (bucket, key) = self._location[5:].split("/", 1)
+            boto3.client("s3").upload_file(self._path, bucket, key)
+            logging.info("Saved catalog: {}".format(self._location))
+
+    def open_snapshot(self, name: str) -> int:
+        '''
+        Start a snapshot, snapshots of interrupted runs are removed. Dashboard versions are kept for the next run.
+        '''
+        with self._lock:
+            for table in ("items", "snapshot_dashboards"):
+                self._db.execute("DELETE FROM {} WHERE snapshot_id IN (SELECT id FROM snapshots WHERE archive IS NULL)".format(table))
+
+            self._db.execute("DELETE FROM snapshots WHERE archive IS NULL")
+            self._snapshot = self._db.execute("INSERT INTO snapshots (name, created) VALUES (?, ?)", (name, int(time.time()))).lastrowid
+            self._db.commit()
+
+        return self._snapshot
+
+    def close_snapshot(self, archive: str, dashboards: dict) -> None:
+        '''
+        Link dashboard versions of the manifest ({uid: {"version", "file"}}) to the snapshot and set its archive.
+        '''
+        with self._lock:
+            for (uid, item) in dashboards.items():
+                row = self._db.execute("SELECT id FROM versions WHERE uid = ? AND version IS ?", (uid, item.get("version"))).fetchone()
+
+                # Unchanged dashboards of an incremental run are linked only if an earlier run has indexed them.
+                if not row:
+                    logging.debug("Dashboard is not in catalog: {} (version: {})".format(uid, item.get("version")))
+                    continue
+
+                self._db.execute(
+                    "INSERT OR REPLACE INTO snapshot_dashboards (snapshot_id, version_id, file) VALUES (?, ?, ?)",
+                    (self._snapshot, row["id"], item.get("file"))
+                )
+
+            self._db.execute("UPDATE snapshots SET archive = ? WHERE id = ?", (archive, self._snapshot))
+            self._db.commit()
+            self._pending = 0
+
+        logging.info("Stored catalog snapshot: {} ({} dashboards)".format(archive, len(dashboards)))
+
+    def commit(self) -> None:
+        '''
+        Commit every "commit_size" changes, indexed versions of an interrupted run are kept.
+        '''
+        self._pending += 1
+        if self._pending >= self.commit_size:
+            self._db.commit()
+            self._pending = 0
+
+    def add_item(self, kind: str, key: str, title: str, data: dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO items (snapshot_id, type, key, title, data) VALUES (?, ?, ?, ?, ?)",
+                (self._snapshot, kind, key, title, json.dumps(data))
+            )
+            self.commit()
+
+    def add_dashboard(self, data: typing.Union[bytes, dict]) -> None:
+        '''
+        Index a dashboard response ({"meta", "dashboard"}), raw or already decoded.
+        '''
+        item = json.loads(data) if isinstance(data, (bytes, str)) else data
+        (meta, dashboard) = (item.get("meta", {}), item.get("dashboard", {}))
+        (uid, version) = (dashboard.get("uid"), meta.get("version", dashboard.get("version")))
+
+        (panels, refs) = ([], set())
+        for panel in graph.iter_panels(dashboard):
+            queries = []
+
+            for target in (panel.get("targets") or []):
+                queries.append(get_query(target))
+                refs.add((panel.get("id"), graph.get_datasource(target.get("datasource"))))
+
+            refs.add((panel.get("id"), graph.get_datasource(panel.get("datasource"))))
+            panels.append((panel.get("id"), panel.get("title", ""), "\n".join(filter(None, queries))))
+
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO versions (uid, version, title, folder_uid, folder_title, tags, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (uid, version, dashboard.get("title", ""), meta.get("folderUid", ""), meta.get("folderTitle"),
+                 json.dumps(dashboard.get("tags") or []), meta.get("updated"))
+            )
+
+            if not cursor.rowcount:
+                return
+
+            version_id = cursor.lastrowid
+            self._db.executemany("INSERT INTO panels (version_id, panel_id, title, query) VALUES (?, ?, ?, ?)", [(version_id, ) + panel for panel in panels])
+            self._db.executemany("INSERT INTO refs (version_id, panel_id, datasource) VALUES (?, ?, ?)", [(version_id, ) + ref for ref in refs if ref[1]])
+            self._db.execute(
+                "INSERT INTO search (rowid, title, tags, panels, queries) VALUES (?, ?, ?, ?, ?)",
+                (version_id, dashboard.get("title", ""), " ".join(dashboard.get("tags") or []),
+                 "\n".join(map(lambda panel: panel[1], panels)), "\n".join(map(lambda panel: panel[2], panels)))
+            )
+            self.commit()
+
+    def get_snapshot(self, name: str = "") -> sqlite3.Row:
+        '''
+        Return the snapshot by name or archive, the latest one if "name" is empty.
+        '''
+        if name:
+            query = "SELECT * FROM snapshots WHERE archive IS NOT NULL AND (name = ? OR archive = ?) ORDER BY id DESC"
+            row = self._db.execute(query, (name, name)).fetchone()
+
+        else:
+            row = self._db.execute("SELECT * FROM snapshots WHERE archive IS NOT NULL ORDER BY id DESC").fetchone()
+
+        if not row:
+            raise Exception("Snapshot is not found: {}".format(name or "latest"))
+
+        return row
+
+    def list_snapshots(self) -> list:
+        query = '''
+            SELECT s.name, s.archive, s.created, COUNT(d.version_id) AS dashboards FROM snapshots s
+            LEFT JOIN snapshot_dashboards d ON d.snapshot_id = s.id WHERE s.archive IS NOT NULL GROUP BY s.id ORDER BY s.id
+        '''
+        return list(map(dict, self._db.execute(query)))
+
+    def _select_dashboards(self, where: str, params: tuple, snapshot: sqlite3.Row, limit: int) -> list:
+        query = '''
+            SELECT v.uid, v.version, v.title, v.folder_uid, COALESCE(v.folder_title, f.title, '') AS folder_title, d.file, ? AS archive
+            FROM snapshot_dashboards d JOIN versions v ON v.id = d.version_id
+            LEFT JOIN items f ON f.snapshot_id = d.snapshot_id AND f.type = 'folders' AND f.key = v.folder_uid
+            WHERE d.snapshot_id = ? AND {} ORDER BY v.title LIMIT ?
+        '''.format(where)
+        return list(map(dict, self._db.execute(query, (snapshot["archive"], snapshot["id"]) + params + (limit, ))))
+
+    def search(self, text: str, snapshot: str = "", limit: int = 50) -> list:
+        '''
+        Full-text search over titles, tags, panel titles and queries, e.g. 'queries: "http_requests_total"'.
+        '''
+        return self._select_dashboards("v.id IN (SELECT rowid FROM search WHERE search MATCH ?)", (text, ), self.get_snapshot(snapshot), limit)
+
+    def find_title(self, text: str, snapshot: str = "", limit: int = 50) -> list:
+        return self._select_dashboards("v.title LIKE ?", ("%{}%".format(text), ), self.get_snapshot(snapshot), limit)
+
+    def find_datasource(self, name: str, snapshot: str = "", limit: int = 50) -> list:
+        '''
+        Return dashboards that refer to the datasource by uid, name or type.
+        '''
+        row = self.get_snapshot(snapshot)
+        query = '''
+            SELECT json_extract(data, '$.uid') AS uid, json_extract(data, '$.name') AS name FROM items
+            WHERE snapshot_id = ? AND type = 'datasources' AND (json_extract(data, '$.uid') = ? OR json_extract(data, '$.name') = ?)
+        '''
+        names = {name}
+        for item in self._db.execute(query, (row["id"], name, name)):
+            names.update(filter(None, (item["uid"], item["name"])))
+
+        where = "v.id IN (SELECT version_id FROM refs WHERE datasource IN ({}))".format(", ".join("?" * len(names)))
+        return self._select_dashboards(where, tuple(sorted(names)), row, limit)
+
+    def history(self, uid: str, panel_id: int = None) -> list:
+        '''
+        Return versions of the dashboard with the first snapshot that contains them and panels with a changed query.
+        '''
+        query = '''
+            SELECT v.id, v.version, v.title, v.updated, s.name AS snapshot, s.archive FROM versions v
+            JOIN snapshots s ON s.id = (SELECT MIN(snapshot_id) FROM snapshot_dashboards WHERE version_id = v.id)
+            WHERE v.uid = ? ORDER BY s.id, v.version
+        '''
+        (items, prev) = ([], {})
+
+        for row in self._db.execute(query, (uid, )).fetchall():
+            panels = {}
+            for panel in self._db.execute("SELECT panel_id, title, query FROM panels WHERE version_id = ?", (row["id"], )):
+                if panel_id is None or panel["panel_id"] == panel_id:
+                    panels[panel["panel_id"]] = dict(panel)
+
+            changed = [panel for (key, panel) in sorted(panels.items(), key=lambda item: str(item[0])) if prev.get(key, {}).get("query") != panel["query"]]
+            removed = sorted(set(prev) - set(panels), key=str)
+
+            item = dict(row)
+            item.pop("id")
+            items.append(dict(item, changed=changed, removed=removed))
+            prev = panels
+
+        return items
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--search", dest="search", default="", help="Full-text search over titles, tags, panel titles and queries.")
+    group.add_argument("--title", dest="title", default="", help="Find dashboards by title.")
+    group.add_argument("--datasource", dest="datasource", default="", help="Find dashboards that use a datasource (uid, name or type).")
+    group.add_argument("--history", dest="history", default="", help="Show versions and changed panel queries of a dashboard uid.")
+    group.add_argument("--snapshots", dest="snapshots", action="store_true", help="List snapshots.")
+    parser.add_argument("--catalog", dest="catalog", default="", help="Set catalog path or s3://bucket/key (default: BACKUP_CATALOG or ./catalog.db).")
+    parser.add_argument("--snapshot", dest="snapshot", default="", help="Set snapshot name or archive (default: latest).")
+    parser.add_argument("--panel", dest="panel", default=None, type=int, help="Show history of one panel id.")
+    parser.add_argument("--limit", dest="limit", default="50", type=int, help="Set items output limit.")
+    parser.add_argument("--json", dest="json", action="store_true", help="Print results as JSON.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.WARNING
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    try:
+        args = parse_args()
+        catalog = Catalog(args.catalog or os.environ.get("BACKUP_CATALOG", "") or "./catalog.db")
+
+        if args.snapshots:
+            items = catalog.list_snapshots()
+            lines = map(lambda item: "{} {} ({} dashboards)".format(item["name"], item["archive"], item["dashboards"]), items)
+
+        elif args.history:
+            items = catalog.history(args.history, args.panel)
+            lines = []
+
+            for item in items:
+                lines.append("{} version {} ({}): {}".format(item["snapshot"], item["version"], item["archive"], item["title"]))
+                lines.extend(map(lambda panel: "  ~ panel {} {}: {}".format(panel["panel_id"], panel["title"], panel["query"].replace("\n", " | ")), item["changed"]))
+                lines.extend(map(lambda key: "  - panel {}".format(key), item["removed"]))
+
+        else:
+            if args.search:
+                items = catalog.search(args.search, args.snapshot, args.limit)
+
+            elif args.title:
+                items = catalog.find_title(args.title, args.snapshot, args.limit)
+
+            else:
+                items = catalog.find_datasource(args.datasource, args.snapshot, args.limit)
+
+            lines = map(lambda item: "{} {} [{}] version {} ({}: {})".format(
+                item["uid"], item["title"], item["folder_title"] or "General", item["version"], item["archive"], item["file"]
+            ), items)
+
+        if args.json:
+            print(json.dumps(items, indent=2))
+
+        else:
+            for line in lines:
+                print(line)
+
+    except Exception:
+        logging.error(traceback.format_exc())
+        sys.exit(1)
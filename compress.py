@@ -0,0 +1,134 @@
+import io
+import os
+import gzip
+import typing
+import importlib.util
+import collections
+
+from concurrent import futures
+
+CODECS = ["gzip", "pgzip", "xz", "zstd"]
+EXTENSIONS = {"gzip": "tgz", "pgzip": "tgz", "xz": "txz", "zstd": "tar.zst"}
+# https://python-zstandard.readthedocs.io/en/latest/
+MODULES = {"xz": "lzma", "zstd": "zstandard"}
+
+
+def is_available(codec: str) -> bool:
+    return (codec not in MODULES) or (importlib.util.find_spec(MODULES[codec]) is not None)
+
+
+def get_codec(codec: str) -> typing.Any:
+    '''
+    Return the module of the xz or zstd codec, it is imported on first use so a run with gzip doesn't load it.
+    '''
+    try:
+        return importlib.import_module(MODULES[codec])
+
+    except ImportError:
+        raise Exception("The {} codec requires the {} module!".format(codec, MODULES[codec]))
+
+
+class ParallelGzipFile(io.RawIOBase):
+    '''
+    Compress blocks of "block_size" bytes on a thread pool.
+    Every block is written as a separate gzip member, so the output stays a valid gzip stream.
+    '''
+    def __init__(self, fileobj: io.RawIOBase, level: int = 9, threads: int = 0, block_size: int = 1024 * 1024) -> None:
+        self._fileobj = fileobj
+        self._level = level
+        self._threads = threads or os.cpu_count() or 1
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._executor = futures.ThreadPoolExecutor(max_workers=self._threads)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+
+        return len(data)
+
+    def _submit(self, data: bytes) -> None:
+        self._pending.append(self._executor.submit(gzip.compress, data, self._level, mtime=0))
+
+        # Blocks are written in order, the number of blocks in flight is bounded.
+        while len(self._pending) > (self._threads * 2):
+            self._fileobj.write(self._pending.popleft().result())
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        if self._buffer or not self._pending:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+
+        while self._pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+        self._executor.shutdown()
+        super().close()
+
+
+class StreamReader(io.RawIOBase):
+    '''
+    Raw stream over any object with read(size), for example a boto3 StreamingBody.
+    '''
+    def __init__(self, fileobj: typing.Any) -> None:
+        self._fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: memoryview) -> int:
+        data = self._fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_writer(fileobj: io.RawIOBase, codec: str = "gzip", level: int = None, threads: int = 0) -> io.RawIOBase:
+    '''
+    Return a writable stream that compresses data into "fileobj".
+    Closing the stream does not close "fileobj".
+    '''
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=9 if level is None else level)
+
+    if codec == "pgzip":
+        return ParallelGzipFile(fileobj, 9 if level is None else level, threads)
+
+    if codec == "xz":
+        return get_codec(codec).LZMAFile(fileobj, mode="wb", preset=level)
+
+    if codec == "zstd":
+        # threads=-1 uses all logical CPUs.
+        ctx = get_codec(codec).ZstdCompressor(level=3 if level is None else level, threads=threads or -1)
+        return ctx.stream_writer(fileobj, closefd=False)
+
+    raise Exception("Unknown codec: {}".format(codec))
+
+
+def open_reader(fileobj: typing.Any) -> io.RawIOBase:
+    '''
+    Return a readable stream with data decompressed from "fileobj".
+    The codec is detected by the magic bytes.
+    '''
+    fileobj = io.BufferedReader(StreamReader(fileobj))
+    magic = fileobj.peek(6)[:6]
+
+    if magic.startswith(b"\x1f\x8b"):
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+
+    if magic.startswith(b"\xfd7zXZ\x00"):
+        return get_codec("xz").LZMAFile(fileobj, mode="rb")
+
+    if magic.startswith(b"\x28\xb5\x2f\xfd"):
+        return get_codec("zstd").ZstdDecompressor().stream_reader(fileobj, closefd=False)
+
+    return fileobj
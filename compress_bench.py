@@ -0,0 +1,89 @@
+import io
+import sys
+import json
+import time
+import random
+import tarfile
+import argparse
+import compress
+
+
+def make_dashboard(uid: str, panels: int) -> dict:
+    return {
+        "meta": {"type": "db", "folderId": 1, "version": random.randint(1, 100)},
+        "dashboard": {
+            "uid": uid, "title": "Dashboard {}".format(uid), "tags": ["bench"],
+            "panels": [{
+                "id": index, "type": random.choice(["timeseries", "stat", "table"]),
+                "title": "Panel {}".format(index),
+                "gridPos": {"h": 8, "w": 12, "x": (index % 2) * 12, "y": index * 8},
+                "datasource": {"type": "prometheus", "uid": "prometheus"},
+                "targets": [{
+                    "refId": "A",
+                    "expr": "sum(rate(http_requests_total{{job=\"job-{}\", code=~\"5..\"}}[5m])) by (instance)".format(random.randint(1, 50))
+                }]
+            } for index in range(panels)]
+        }
+    }
+
+
+def make_corpus(dashboards: int, panels: int) -> bytes:
+    file = io.BytesIO()
+
+    with tarfile.open(fileobj=file, mode="w|") as archive_file:
+        for index in range(dashboards):
+            data = json.dumps(make_dashboard("dash-{}".format(index), panels)).encode()
+            info = tarfile.TarInfo("data/1/dashboards/dash-{}.json".format(index))
+            info.size = len(data)
+            archive_file.addfile(info, io.BytesIO(data))
+
+    return file.getvalue()
+
+
+def run_codec(codec: str, data: bytes, level: int = None) -> dict:
+    file = io.BytesIO()
+    start = time.perf_counter()
+
+    with compress.open_writer(file, codec, level) as writer:
+        writer.write(data)
+
+    elapsed = time.perf_counter() - start
+    size = len(file.getvalue())
+
+    return {
+        "codec": codec, "input_bytes": len(data), "output_bytes": size,
+        "ratio": round(len(data) / size, 2), "seconds": round(elapsed, 4),
+        "mb_per_second": round(len(data) / elapsed / 1024 / 1024, 2)
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dashboards", dest="dashboards", default="1000", type=int, help="Set number of dashboards.")
+    parser.add_argument("--panels", dest="panels", default="20", type=int, help="Set number of panels per dashboard.")
+    parser.add_argument("--level", dest="level", default=None, type=int, help="Set compression level.")
+    parser.add_argument("--json", dest="json", action="store_true", help="Print results as JSON.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(0)
+    data = make_corpus(args.dashboards, args.panels)
+
+    results = []
+    for codec in compress.CODECS:
+        if not compress.is_available(codec):
+            print("Skip codec: {} ({} module is not installed)".format(codec, compress.MODULES[codec]), file=sys.stderr)
+            continue
+
+        results.append(run_codec(codec, data, args.level))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    else:
+        print("{:<8}{:>14}{:>14}{:>8}{:>10}{:>10}".format("codec", "input", "output", "ratio", "seconds", "MB/s"))
+
+        for item in results:
+            print("{codec:<8}{input_bytes:>14}{output_bytes:>14}{ratio:>8}{seconds:>10}{mb_per_second:>10}".format(**item))
@@ -0,0 +1,221 @@
+import json
+import typing
+import pathlib
+import logging
+import grafana
+
+EXPORTERS = {}
+
+
+def register(cls: type) -> type:
+    '''
+    Add an exporter class to the registry under its "name".
+    '''
+    EXPORTERS[cls.name] = cls
+    return cls
+
+
+def get_exporters(names: list = None) -> list:
+    '''
+    Return exporter instances in registry order, the default ones if "names" is empty.
+    '''
+    names = list(names or [name for (name, cls) in EXPORTERS.items() if cls.default])
+
+    for name in names:
+        if name not in EXPORTERS:
+            raise Exception("Unknown exporter: {} (available: {})".format(name, ", ".join(EXPORTERS.keys())))
+
+    return [cls() for (name, cls) in EXPORTERS.items() if name in names]
+
+
+class Exporter:
+    '''
+    A resource type: how items are listed, fetched and stored by the backup.
+    By default an item is stored as listed in "<name>/<key>.json".
+    Types without "default" are backed up only if they are selected by name.
+    '''
+    name = ""
+    default = False
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        raise NotImplementedError
+
+    def get_key(self, item: dict) -> str:
+        return str(item.get("uid") or item.get("id"))
+
+    def get_title(self, item: dict) -> str:
+        return item.get("title") or item.get("name") or self.get_key(item)
+
+    def get_path(self, item: dict) -> pathlib.PurePath:
+        return pathlib.PurePath(self.name, "{}.json".format(self.get_key(item)))
+
+    def fetch(self, client: grafana.Grafana, item: dict) -> bytes:
+        return json.dumps(item).encode()
+
+    def export(self, grafana_backup: typing.Any, item: dict) -> pathlib.Path:
+        '''
+        Store the item and return the path for items.txt or None if nothing is stored.
+        '''
+        path = grafana_backup.base_path.joinpath(self.get_path(item))
+        data = self.fetch(grafana_backup.client, item)
+
+        logging.info("Store {} data: {}".format(self.name, path))
+        grafana_backup.write_file(path, data)
+        return path
+
+    def on_failure(self, grafana_backup: typing.Any, item: dict) -> None:
+        pass
+
+    def get_checkpoint(self, grafana_backup: typing.Any, item: dict) -> typing.Any:
+        '''
+        Return the state of a stored item kept in the backup journal.
+        '''
+        return None
+
+    def resume(self, grafana_backup: typing.Any, item: dict, state: typing.Any) -> None:
+        '''
+        Apply the journal state of an item stored by an interrupted run.
+        '''
+        pass
+
+
+@register
+class FolderExporter(Exporter):
+    name = "folders"
+    default = True
+    data_file = "data.json"
+    access_file = "access.json"
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        return client.list_folders()
+
+    def get_path(self, item: dict) -> pathlib.PurePath:
+        return pathlib.PurePath(str(item["id"]))
+
+    def export(self, grafana_backup: typing.Any, item: dict) -> pathlib.Path:
+        folder_path = grafana_backup.base_path.joinpath(self.get_path(item))
+        client = grafana_backup.client
+
+        logging.debug("Run get_folder_by_uid_raw({})".format(item["uid"]))
+        folder_data = folder_path.joinpath(self.data_file)
+        tmp = client.get_folder_by_uid_raw(item["uid"]) or b"{}"
+
+        logging.info("Store folder data: {}".format(folder_data))
+        grafana_backup.write_file(folder_data, tmp)
+
+        logging.debug("Run get_folder_permissions_raw({})".format(item["uid"]))
+        folder_access = folder_path.joinpath(self.access_file)
+        tmp = client.get_folder_permissions_raw(item["uid"])
+
+        logging.info("Store folder access: {}".format(folder_access))
+        grafana_backup.write_file(folder_access, tmp)
+        return folder_path
+
+
+@register
+class LibraryPanelExporter(Exporter):
+    '''
+    Library panels are listed before dashboards, so they are stored before the dashboards that use them.
+    '''
+    name = "library_panels"
+    page_size = 100
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        page = 1
+
+        while True:
+            items = client.list_library_elements(page, self.page_size).get("result", {}).get("elements") or []
+            yield from items
+
+            if len(items) < self.page_size:
+                break
+
+            page += 1
+
+
+@register
+class DashboardExporter(Exporter):
+    '''
+    Dashboards of all folders including General (folderId: 0), stored in "<folderId>/dashboards/<uid>.json".
+    '''
+    name = "dashboards"
+    default = True
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        return client.iter_dashboards()
+
+    def export(self, grafana_backup: typing.Any, item: dict) -> pathlib.Path:
+        return grafana_backup.backup_dashboard(item)
+
+    def on_failure(self, grafana_backup: typing.Any, item: dict) -> None:
+        grafana_backup.keep_manifest(item["uid"])
+
+    def get_checkpoint(self, grafana_backup: typing.Any, item: dict) -> typing.Any:
+        return grafana_backup.get_manifest_item(item["uid"])
+
+    def resume(self, grafana_backup: typing.Any, item: dict, state: typing.Any) -> None:
+        if state:
+            grafana_backup.update_manifest(item["uid"], state)
+            grafana_backup.index_dashboard(state["file"])
+
+
+@register
+class DatasourceExporter(Exporter):
+    name = "datasources"
+    default = True
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        return client.list_datasources()
+
+    def get_key(self, item: dict) -> str:
+        return str(item["id"])
+
+
+@register
+class AlertRuleExporter(Exporter):
+    name = "alert_rules"
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        return client.list_alert_rules()
+
+
+@register
+class ContactPointExporter(Exporter):
+    name = "contact_points"
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        return client.list_contact_points()
+
+
+@register
+class AnnotationExporter(Exporter):
+    '''
+    Annotations are listed from the newest one, the next page ends at the oldest item of the previous page.
+    '''
+    name = "annotations"
+    page_size = 1000
+
+    def list_items(self, client: grafana.Grafana) -> typing.Iterable[dict]:
+        (seen, to_time) = (set(), None)
+
+        while True:
+            items = client.list_annotations(self.page_size, to_time)
+            new_items = [item for item in items if item["id"] not in seen]
+            yield from new_items
+
+            if len(items) < self.page_size:
+                break
+
+            to_time = min(map(lambda item: item.get("time", 0), items))
+
+            # A full page with one time can't be split by "to", the other items of that time are skipped.
+            if not new_items:
+                logging.warning("More than {} annotations at time: {}".format(self.page_size, to_time))
+                (to_time, seen) = (to_time - 1, set())
+                continue
+
+            # Items with the same time as the page boundary are listed again and skipped by id.
+            seen = set(map(lambda item: item["id"], filter(lambda item: item.get("time", 0) == to_time, items)))
+
+    def get_title(self, item: dict) -> str:
+        return "Annotation {}".format(item["id"])
@@ -0,0 +1,429 @@
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import typing
+import hashlib
+import logging
+import argparse
+import threading
+
+from urllib import parse as urllib
+from http import server
+
+
+class State:
+    '''
+    In-memory Grafana objects: folders, dashboards, permissions, datasources, library panels,
+    alert rules, contact points and annotations.
+    '''
+    def __init__(self, folders: int = 10, dashboards: int = 100, panels: int = 10, datasources: int = 5) -> None:
+        self.lock = threading.Lock()
+        self.folders = {}
+        self.permissions = {}
+        self.dashboards = {}
+        self.datasources = {}
+        self.library_panels = {}
+        self.alert_rules = {}
+        self.contact_points = {}
+        self.annotations = {}
+        self.next_id = 1
+
+        for index in range(datasources):
+            self.add_datasource({
+                "uid": "ds-{}".format(index), "name": "Datasource {}".format(index),
+                "type": "prometheus", "access": "proxy", "url": "http://prometheus:9090"
+            })
+
+        for index in range(folders):
+            self.add_folder({"uid": "folder-{}".format(index), "title": "Folder {}".format(index)})
+
+        folder_uids = [""] + list(self.folders.keys())
+        for index in range(dashboards):
+            self.add_dashboard(make_dashboard("dash-{}".format(index), panels, datasources), folder_uids[index % len(folder_uids)])
+
+        for folder_uid in list(self.folders.keys()):
+            self.library_panels["lib-{}".format(folder_uid)] = {
+                "uid": "lib-{}".format(folder_uid), "name": "Library panel {}".format(folder_uid), "kind": 1,
+                "folderUid": folder_uid, "model": {"type": "timeseries", "title": "Library panel"}
+            }
+            self.alert_rules["rule-{}".format(folder_uid)] = {
+                "uid": "rule-{}".format(folder_uid), "title": "Alert rule {}".format(folder_uid),
+                "folderUID": folder_uid, "ruleGroup": "default", "condition": "A", "for": "5m"
+            }
+
+        if folders:
+            self.contact_points["cp-0"] = {"uid": "cp-0", "name": "Email", "type": "email", "settings": {"addresses": "ops@example.com"}}
+
+        for index in range(0, dashboards, 10):
+            item_id = self.get_id()
+            self.annotations[item_id] = {
+                "id": item_id, "dashboardUID": "dash-{}".format(index), "time": 1700000000000 + index * 1000,
+                "text": "Deploy {}".format(index), "tags": ["deploy"]
+            }
+
+    def get_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    def add_datasource(self, data: dict) -> dict:
+        data = dict(data, id=self.get_id())
+        data.setdefault("uid", "ds-{}".format(data["id"]))
+        self.datasources[data["uid"]] = data
+        return data
+
+    def add_folder(self, data: dict) -> dict:
+        data = {
+            "id": self.get_id(), "uid": data.get("uid") or "folder-{}".format(self.next_id),
+            "title": data.get("title", ""), "version": 1
+        }
+
+        self.folders[data["uid"]] = data
+        self.permissions[data["uid"]] = [{"role": "Viewer", "permission": 1}, {"role": "Editor", "permission": 2}]
+        return data
+
+    def add_dashboard(self, data: dict, folder_uid: str = "") -> dict:
+        folder = self.folders.get(folder_uid or "", {"id": 0, "uid": ""})
+        data = dict(data)
+        prev = self.dashboards.get(data.get("uid"))
+
+        data["uid"] = data.get("uid") or "dash-{}".format(self.next_id)
+        data["id"] = prev["dashboard"]["id"] if prev else self.get_id()
+        data["version"] = (prev["meta"]["version"] + 1) if prev else 1
+
+        self.dashboards[data["uid"]] = {
+            "meta": {
+                "type": "db", "slug": data["uid"], "folderId": folder["id"], "folderUid": folder["uid"],
+                "version": data["version"], "updated": time.strftime(r"%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            },
+            "dashboard": data
+        }
+
+        return self.dashboards[data["uid"]]
+
+
+def make_dashboard(uid: str, panels: int = 10, datasources: int = 1) -> dict:
+    return {
+        "uid": uid, "title": "Dashboard {}".format(uid), "tags": ["team-{}".format(len(uid) % 3)],
+        "timezone": "browser", "schemaVersion": 39, "refresh": "30s",
+        "panels": [{
+            "id": index, "type": "timeseries", "title": "Panel {}".format(index),
+            "gridPos": {"h": 8, "w": 12, "x": (index % 2) * 12, "y": index * 8},
+            "datasource": {"type": "prometheus", "uid": "ds-{}".format(index % max(1, datasources))},
+            "targets": [{"refId": "A", "expr": "sum(rate(http_requests_total{{job=\"{}\"}}[5m]))".format(uid)}]
+        } for index in range(panels)]
+    }
+
+
+class Handler(server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = None
+    latency = 0.0
+    error_rate = 0.0
+    token = ""
+    compress = False
+    chunk_size = 0
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(format, *args)
+
+    def send_json(self, status: int, data: typing.Any) -> None:
+        body = json.dumps(data).encode()
+
+        # https://www.rfc-editor.org/rfc/rfc9110#name-if-none-match
+        if (self.command == "GET") and (status == 200):
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header("ETag", etag)
+
+        else:
+            self.send_response(status)
+
+        self.send_header("Content-Type", "application/json")
+
+        if self.compress and ("gzip" in self.headers.get("Accept-Encoding", "")):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+
+        if not self.chunk_size:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # https://www.rfc-editor.org/rfc/rfc9112#name-chunked-transfer-coding
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for index in range(0, len(body), self.chunk_size):
+            chunk = body[index:index + self.chunk_size]
+            self.wfile.write("{:x}\r\n".format(len(chunk)).encode() + chunk + b"\r\n")
+
+        self.wfile.write(b"0\r\n\r\n")
+
+    def read_json(self) -> typing.Any:
+        size = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(size)
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+
+        return json.loads(data or b"null")
+
+    def handle_request(self, method: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = urllib.urlsplit(self.path)
+        data = self.read_json() if method in ("POST", "PUT", "PATCH") else None
+
+        if self.error_rate and (random.random() < self.error_rate):
+            return self.send_json(503, {"message": "injected error"})
+
+        if self.token and (self.headers.get("Authorization") != "Bearer {}".format(self.token)):
+            return self.send_json(401, {"message": "invalid API key"})
+
+        with self.state.lock:
+            (status, resp) = self.route(method, parts.path, urllib.parse_qs(parts.query), data)
+
+        self.send_json(status, resp)
+
+    def do_GET(self) -> None:
+        self.handle_request("GET")
+
+    def do_POST(self) -> None:
+        self.handle_request("POST")
+
+    def do_PUT(self) -> None:
+        self.handle_request("PUT")
+
+    def do_PATCH(self) -> None:
+        self.handle_request("PATCH")
+
+    def do_DELETE(self) -> None:
+        self.handle_request("DELETE")
+
+    def route(self, method: str, path: str, query: dict, data: typing.Any) -> tuple:
+        state = self.state
+        not_found = (404, {"message": "not found"})
+
+        if path == "/api/folders":
+            if method == "POST":
+                if data.get("uid") in state.folders:
+                    return (409, {"message": "a folder with the same uid already exists"})
+
+                return (200, state.add_folder(data))
+
+            return (200, [{"id": item["id"], "uid": item["uid"], "title": item["title"]} for item in state.folders.values()])
+
+        match = re.match(r"^/api/folders/id/(\d+)$", path)
+        if match:
+            items = [item for item in state.folders.values() if item["id"] == int(match.group(1))]
+            return (200, items[0]) if items else not_found
+
+        match = re.match(r"^/api/folders/([^/]+)/permissions$", path)
+        if match:
+            if match.group(1) not in state.folders:
+                return not_found
+
+            if method == "POST":
+                state.permissions[match.group(1)] = data["items"]
+                return (200, {"message": "Folder permissions updated"})
+
+            return (200, state.permissions[match.group(1)])
+
+        match = re.match(r"^/api/folders/([^/]+)$", path)
+        if match:
+            folder = state.folders.get(match.group(1))
+
+            if not folder:
+                return not_found
+
+            if method == "PUT":
+                folder.update(title=data.get("title", folder["title"]), version=folder["version"] + 1)
+
+            elif method == "DELETE":
+                del state.folders[folder["uid"]]
+                return (200, {"message": "Folder deleted"})
+
+            return (200, folder)
+
+        if path == "/api/search":
+            limit = int(query.get("limit", ["1000"])[0])
+            page = int(query.get("page", ["1"])[0])
+            folder_ids = query.get("folderIds", [""])[0]
+
+            items = [{
+                "uid": item["dashboard"]["uid"], "title": item["dashboard"]["title"], "type": "dash-db",
+                "tags": item["dashboard"].get("tags", []), "folderId": item["meta"]["folderId"],
+                "folderUid": item["meta"]["folderUid"]
+            } for item in state.dashboards.values()]
+
+            if folder_ids:
+                folder_ids = folder_ids.split(",")
+                items = [item for item in items if str(item["folderId"]) in folder_ids]
+
+            return (200, items[(page - 1) * limit:page * limit])
+
+        if path == "/api/dashboards/db" and method == "POST":
+            panels = filter(lambda panel: isinstance(panel.get("libraryPanel"), dict), data["dashboard"].get("panels") or [])
+            if any(panel["libraryPanel"].get("uid") not in state.library_panels for panel in panels):
+                return (400, {"message": "library element could not be found"})
+
+            item = state.add_dashboard(data["dashboard"], data.get("folderUid", ""))
+            return (200, {"status": "success", "uid": item["dashboard"]["uid"], "version": item["meta"]["version"]})
+
+        match = re.match(r"^/api/dashboards/uid/([^/]+)(/versions)?$", path)
+        if match:
+            item = state.dashboards.get(match.group(1))
+
+            if not item:
+                return not_found
+
+            if match.group(2):
+                return (200, [{"version": item["meta"]["version"], "created": item["meta"]["updated"]}])
+
+            if method == "DELETE":
+                del state.dashboards[match.group(1)]
+                return (200, {"title": item["dashboard"]["title"]})
+
+            return (200, item)
+
+        if path == "/api/library-elements" and method == "POST":
+            if data.get("uid") in state.library_panels:
+                return (400, {"message": "library element with that name or UID already exists"})
+
+            item = dict(data, uid=data.get("uid") or "lib-{}".format(state.get_id()), version=1)
+            state.library_panels[item["uid"]] = item
+            return (200, {"result": item})
+
+        match = re.match(r"^/api/library-elements/([^/]+)$", path)
+        if match:
+            item = state.library_panels.get(match.group(1))
+
+            if not item:
+                return not_found
+
+            if method == "PATCH":
+                if data.get("version") != item.get("version", 1):
+                    return (412, {"message": "the library element has been changed by someone else"})
+
+                item.update(data, uid=item["uid"], version=item.get("version", 1) + 1)
+
+            return (200, {"result": item})
+
+        if path == "/api/library-elements":
+            per_page = int(query.get("perPage", ["100"])[0])
+            page = int(query.get("page", ["1"])[0])
+            items = list(state.library_panels.values())
+
+            return (200, {"result": {
+                "totalCount": len(items), "page": page, "perPage": per_page,
+                "elements": items[(page - 1) * per_page:page * per_page]
+            }})
+
+        if path == "/api/v1/provisioning/alert-rules":
+            return (200, list(state.alert_rules.values()))
+
+        if path == "/api/v1/provisioning/contact-points":
+            return (200, list(state.contact_points.values()))
+
+        if path == "/api/annotations":
+            limit = int(query.get("limit", ["100"])[0])
+            to_time = int(query.get("to", ["0"])[0])
+
+            items = sorted(state.annotations.values(), key=lambda item: item["time"], reverse=True)
+            if to_time:
+                items = [item for item in items if item["time"] <= to_time]
+
+            return (200, items[:limit])
+
+        if path == "/api/datasources":
+            if method == "POST":
+                return (200, {"message": "Datasource added", "id": state.add_datasource(data)["id"]})
+
+            return (200, list(state.datasources.values()))
+
+        match = re.match(r"^/api/datasources/(uid/|name/)?([^/]+)$", path)
+        if match:
+            key = {"uid/": "uid", "name/": "name"}.get(match.group(1), "id")
+            value = match.group(2) if key != "id" else int(match.group(2))
+            items = [item for item in state.datasources.values() if item[key] == value]
+
+            if not items:
+                return not_found
+
+            if method == "PUT":
+                items[0].update(data, id=items[0]["id"], uid=items[0]["uid"])
+                return (200, {"message": "Datasource updated"})
+
+            if method == "DELETE":
+                del state.datasources[items[0]["uid"]]
+                return (200, {"message": "Data source deleted"})
+
+            return (200, items[0])
+
+        return not_found
+
+
+def start(state: State, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0, compress: bool = False,
+          chunk_size: int = 0, token: str = "") -> server.ThreadingHTTPServer:
+    '''
+    Run the server in a background thread, the URL is "http://{host}:{server.server_port}/".
+    With "token" requests without the "Bearer <token>" authorization are answered with 401.
+    With "compress" responses are sent with gzip encoding if the client accepts it.
+    With "chunk_size" responses are sent with chunked transfer encoding in chunks of that size.
+    '''
+    handler = type("Handler", (Handler, ), {
+        "state": state, "latency": latency, "error_rate": error_rate, "compress": compress, "chunk_size": chunk_size,
+        "token": token
+    })
+    http_server = server.ThreadingHTTPServer((host, port), handler)
+    http_server.daemon_threads = True
+
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return http_server
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", dest="port", default="3000", type=int, help="Set listen port.")
+    parser.add_argument("--folders", dest="folders", default="10", type=int, help="Set number of folders.")
+    parser.add_argument("--dashboards", dest="dashboards", default="100", type=int, help="Set number of dashboards.")
+    parser.add_argument("--panels", dest="panels", default="10", type=int, help="Set number of panels per dashboard.")
+    parser.add_argument("--datasources", dest="datasources", default="5", type=int, help="Set number of datasources.")
+    parser.add_argument("--latency", dest="latency", default="0", type=float, help="Set response latency in seconds.")
+    parser.add_argument("--error-rate", dest="error_rate", default="0", type=float, help="Set share of requests answered with 503.")
+    parser.add_argument("--gzip", dest="gzip", action="store_true", help="Compress responses if the client accepts gzip.")
+    parser.add_argument("--chunk-size", dest="chunk_size", default="0", type=int, help="Send responses with chunked encoding in chunks of this size.")
+    parser.add_argument("--token", dest="token", default="", help="Answer requests without this bearer token with 401.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=logging.INFO
+    )
+
+    args = parse_args()
+    state = State(args.folders, args.dashboards, args.panels, args.datasources)
+    http_server = start(state, "127.0.0.1", args.port, args.latency, args.error_rate, args.gzip, args.chunk_size, args.token)
+
+    logging.info("Listen: http://127.0.0.1:{}/".format(http_server.server_port))
+    try:
+        threading.Event().wait()
+
+    except KeyboardInterrupt:
+        http_server.shutdown()
+        sys.exit(0)
@@ -1,67 +1,214 @@
 import os
 import sys
-import boto3
+import json
+import typing
+import store
 import pathlib
 import logging
 import argparse
+import datetime
 import traceback
 
+from concurrent import futures
+
 # DEBUG_MODE
 # AWS_ENDPOINT_URL
 # AWS_ACCESS_KEY_ID
 # AWS_SECRET_ACCESS_KEY
 
 
-def list_objects(client: any, bucket: str, prefix: str = "", items: int = 200) -> list:
-    response = client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=items)
-    return (response["IsTruncated"], response["Contents"])
+# https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/paginator/ListObjectsV2.html
+def iter_objects(client: typing.Any, bucket: str, prefix: str = "", since: str = "", until: str = "") -> typing.Iterator[dict]:
+    '''
+    Yield objects in key order, "since" and "until" are date prefixes of archive names (%Y%m%d%H%M).
+    Listing starts at "since" and stops after "until", so only the selected range is requested.
+    '''
+    paginator = client.get_paginator("list_objects_v2")
+    start_after = "{}{}".format(prefix, since) if since else ""
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, StartAfter=start_after):
+        for item in page.get("Contents", []):
+            if until and (item["Key"][len(prefix):len(prefix) + len(until)] > until):
+                return
+
+            yield item
+
+
+def get_latest(client: typing.Any, bucket: str, prefix: str = "", months: int = 120) -> dict:
+    '''
+    Return the newest archive, months are listed from the current one back in time.
+    '''
+    date = datetime.date.today().replace(day=1)
+
+    for _ in range(months):
+        items = list(iter_objects(client, bucket, "{}{}".format(prefix, date.strftime(r"%Y%m"))))
+        if items:
+            return max(items, key=lambda item: item["Key"])
+
+        date = (date - datetime.timedelta(days=1)).replace(day=1)
+
+    # Archives without a date prefix, e.g. custom names.
+    items = list(iter_objects(client, bucket, prefix))
+    return max(items, key=lambda item: item["Key"]) if items else None
+
+
+class Download:
+    '''
+    Ranged parallel download of an S3 object to "<path>.part".
+    Finished parts are recorded in "<path>.part.json", so an interrupted download is resumed.
+    '''
+    def __init__(self, client: typing.Any, bucket: str, key: str, path: str, part_size: int = 8 * 1024 * 1024, concurrency: int = 4) -> None:
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._path = pathlib.Path(path)
+        self._part_size = part_size
+        self._concurrency = max(1, concurrency)
+        self._tmp_path = self._path.with_name("{}.part".format(self._path.name))
+        self._state_path = self._path.with_name("{}.part.json".format(self._path.name))
+        self._chunk_size = 1024 * 1024
+
+    def load_state(self, etag: str, size: int) -> set:
+        if not (self._tmp_path.exists() and self._state_path.exists()):
+            return set()
+
+        state = json.loads(self._state_path.read_text())
+        if (state["etag"], state["size"], state["part_size"]) != (etag, size, self._part_size):
+            logging.warning("Object is changed, download from start: {}".format(self._key))
+            return set()
+
+        return set(state["done"])
+
+    def save_state(self, etag: str, size: int, done: set) -> None:
+        tmp = self._state_path.with_name("{}.tmp".format(self._state_path.name))
+        tmp.write_text(json.dumps({"etag": etag, "size": size, "part_size": self._part_size, "done": sorted(done)}))
+        os.replace(tmp, self._state_path)
+
+    # https://docs.aws.amazon.com/AmazonS3/latest/userguide/optimizing-performance-guidelines.html#optimizing-performance-guidelines-get-range
+    def get_part(self, etag: str, index: int, size: int) -> int:
+        start = index * self._part_size
+        end = min(start + self._part_size, size) - 1
+        response = self._client.get_object(Bucket=self._bucket, Key=self._key, Range="bytes={}-{}".format(start, end), IfMatch=etag)
+
+        # The body is copied in chunks, so memory is bounded by the chunk size per worker.
+        with open(self._tmp_path, "r+b") as file:
+            file.seek(start)
+
+            while True:
+                data = response["Body"].read(self._chunk_size)
+                if not data:
+                    break
+
+                file.write(data)
 
+        return index
 
-def get_object_data(client: any, bucket: str, file: str) -> bytes:
-    response = client.get_object(Bucket=bucket, Key=file)
-    return response["Body"].read()
+    def run(self) -> str:
+        response = self._client.head_object(Bucket=self._bucket, Key=self._key)
+        (etag, size) = (response["ETag"], response["ContentLength"])
+        done = self.load_state(etag, size)
 
+        if not done:
+            with open(self._tmp_path, "wb") as file:
+                file.truncate(size)
 
-def put_file_data(file_name: str, data: bytes) -> None:
-    file = pathlib.Path(file_name)
-    file.touch(exist_ok=True)
-    file.write_bytes(data)
+        count = -(-size // self._part_size)
+        parts = [index for index in range(count) if index not in done]
+        logging.info("Download parts: {} of {} ({} bytes)".format(len(parts), count, size))
+
+        executor = futures.ThreadPoolExecutor(max_workers=self._concurrency)
+        tasks = [executor.submit(self.get_part, etag, index, size) for index in parts]
+
+        try:
+            for task in futures.as_completed(tasks):
+                done.add(task.result())
+                self.save_state(etag, size, done)
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            # Parts finished by running workers are kept for the next run.
+            executor.shutdown(wait=True)
+            done.update(map(lambda task: task.result(), filter(lambda task: not (task.cancelled() or task.exception()), tasks)))
+            self.save_state(etag, size, done)
+
+        os.replace(self._tmp_path, self._path)
+        self._state_path.unlink()
+        return str(self._path)
+
+
+def put_snapshot(content_store: store.ContentStore, name: str) -> None:
+    for (path, item) in content_store.get_manifest(name).items():
+        logging.debug("Restore file: {}".format(path))
+        file = pathlib.Path(path)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_bytes(content_store.get(item["digest"]))
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("bucket", help="Set bucket name.")
     parser.add_argument("--path", dest="path", default="", help="Set destination file path.")
-    parser.add_argument("--limit", dest="limit", default="200", type=int, help="Set items output limit.")
+    parser.add_argument("--prefix", dest="prefix", default="", help="Set key prefix, e.g. an orchestrator instance name with trailing slash.")
+    parser.add_argument("--since", dest="since", default="", help="List archives from date prefix (%%Y%%m%%d%%H%%M).")
+    parser.add_argument("--until", dest="until", default="", help="List archives up to date prefix (%%Y%%m%%d%%H%%M).")
+    parser.add_argument("--latest", dest="latest", action="store_true", help="Download the newest archive.")
+    parser.add_argument("--limit", dest="limit", default="200", type=int, help="Set items output limit, 0 lists all items.")
+    parser.add_argument("--concurrency", dest="concurrency", default="4", type=int, help="Set number of parallel ranged requests.")
+    parser.add_argument("--part-size", dest="part_size", default="8", type=int, help="Set size of ranged requests in MiB.")
+    parser.add_argument("--store", dest="store", default=None, help="Set content store prefix, the path is a snapshot manifest.")
     return parser.parse_args()
 
 
-try:
+if __name__ == "__main__":
     log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.INFO
     logging.basicConfig(
         format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
         datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
     )
 
-    args = parse_args()
-    client = boto3.client("s3")
-    file_name = pathlib.Path(args.path).name
+    try:
+        import boto3
+
+        args = parse_args()
+        client = boto3.client("s3")
+
+        if args.store is not None:
+            content_store = store.ContentStore("s3://{}/{}".format(args.bucket, args.store))
+
+            if args.path:
+                logging.info("Get snapshot s3://{}/{}/{} -> ./".format(args.bucket, args.store, args.path))
+                put_snapshot(content_store, args.path)
+
+            else:
+                for item in content_store.list_manifests():
+                    logging.info("Snapshot: {}".format(item))
+
+        elif args.path or args.latest:
+            key = args.path
+
+            if args.latest:
+                item = get_latest(client, args.bucket, args.prefix)
+                if not item:
+                    raise Exception("Archive is not found: s3://{}/{}".format(args.bucket, args.prefix))
+
+                key = item["Key"]
 
-    if args.path:
-        logging.info("Get s3://{}/{} -> ./{}".format(args.bucket, args.path, file_name))
-        data = get_object_data(client, args.bucket, args.path)
-        put_file_data(file_name, data)
+            file_name = pathlib.Path(key).name
+            logging.info("Get s3://{}/{} -> ./{}".format(args.bucket, key, file_name))
+            Download(client, args.bucket, key, file_name, args.part_size * 1024 * 1024, args.concurrency).run()
 
-    else:
-        logging.info("List s3://{}/".format(args.bucket))
-        (truncated, items) = list_objects(client, args.bucket, "", args.limit)
+        else:
+            logging.info("List s3://{}/{}".format(args.bucket, args.prefix))
 
-        if truncated:
-            logging.warning("Output is truncated!")
+            for (index, item) in enumerate(iter_objects(client, args.bucket, args.prefix, args.since, args.until)):
+                if args.limit and (index >= args.limit):
+                    logging.warning("Output is truncated!")
+                    break
 
-        for item in items:
-            logging.info("File: {}".format(item["Key"]))
+                logging.info("File: {} ({} bytes)".format(item["Key"], item["Size"]))
 
-except Exception:
-    logging.error(traceback.format_exc())
-    sys.exit(1)
+    except Exception:
+        logging.error(traceback.format_exc())
+        sys.exit(1)
@@ -1,15 +1,329 @@
+import io
 import ssl
 import json
-import uuid
-
-from urllib import request
-from urllib import error as errors
+import time
+import zlib
+import random
+import typing
+import threading
+import collections
+
+from http import client as http
+from email import utils as email
 from urllib import parse as urllib
 
 
+class Request:
+    '''
+    The part of urllib.request.Request used by the client, urllib.request is slow to import.
+    "cached" is the (data, etag) of a stale cache entry revalidated by the request.
+    '''
+    def __init__(self, method: str = "GET", url: str = "", data: bytes = None, headers: dict = None) -> None:
+        self.method = method
+        self.full_url = url
+        self.data = data
+        self.headers = headers or {}
+        self.cached = None
+
+    def get_method(self) -> str:
+        return self.method
+
+
+class Response:
+    '''
+    "size" is the number of body bytes received, it is smaller than the data for compressed responses.
+    '''
+    def __init__(self, status: int, reason: str, headers: http.HTTPMessage, data: bytes, size: int = None) -> None:
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+        self.size = len(data) if size is None else size
+
+
+# https://www.rfc-editor.org/rfc/rfc9110#name-content-encoding
+def get_decoder(headers: http.HTTPMessage) -> typing.Any:
+    '''
+    Return a streaming decompressor for gzip and deflate bodies or None.
+    '''
+    encoding = (headers.get("Content-Encoding") or "").strip().lower()
+
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        # 32 + MAX_WBITS accepts both gzip and zlib headers.
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    return None
+
+
+class ConnectionPool:
+    '''
+    Keep-alive connections grouped by (scheme, host, port).
+    Up to "size" idle connections are kept per host and dropped after "idle_timeout" seconds.
+    '''
+    def __init__(self, size: int = 10, idle_timeout: float = 60.0, context: ssl.SSLContext = None) -> None:
+        self._size = size
+        self._idle_timeout = idle_timeout
+        self._context = context
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.chunk_size = 64 * 1024
+
+    def _connect(self, key: tuple) -> http.HTTPConnection:
+        (scheme, host, port) = key
+
+        if scheme == "https":
+            return http.HTTPSConnection(host, port, context=self._context)
+
+        return http.HTTPConnection(host, port)
+
+    def acquire(self, key: tuple) -> tuple:
+        '''
+        Return (connection, is_reused).
+        '''
+        now = time.monotonic()
+
+        with self._lock:
+            items = self._idle.get(key, [])
+
+            while items:
+                (conn, stamp) = items.pop()
+                if (now - stamp) < self._idle_timeout:
+                    return (conn, True)
+
+                conn.close()
+
+        return (self._connect(key), False)
+
+    def release(self, key: tuple, conn: http.HTTPConnection) -> None:
+        with self._lock:
+            items = self._idle.setdefault(key, [])
+
+            if len(items) < self._size:
+                items.append((conn, time.monotonic()))
+                return
+
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for items in self._idle.values():
+                for (conn, _) in items:
+                    conn.close()
+
+            self._idle.clear()
+
+    def request(self, method: str, url: str, data: bytes = None, headers: dict = None) -> Response:
+        parts = urllib.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+
+        if parts.query:
+            path = "{}?{}".format(path, parts.query)
+
+        while True:
+            (conn, is_reused) = self.acquire(key)
+
+            try:
+                conn.request(method, path, body=data, headers=headers or {})
+                resp = conn.getresponse()
+                (body, size) = self._read(resp)
+
+            except (http.HTTPException, ConnectionError):
+                conn.close()
+
+                # The server may close an idle keep-alive connection at any time.
+                if is_reused:
+                    continue
+
+                raise
+
+            except Exception:
+                conn.close()
+                raise
+
+            if resp.will_close:
+                conn.close()
+
+            else:
+                self.release(key, conn)
+
+            return Response(resp.status, resp.reason, resp.headers, body, size)
+
+    def _read(self, resp: http.HTTPResponse) -> tuple:
+        '''
+        Return (body, received bytes), a compressed body is decoded while it is read.
+        '''
+        decoder = get_decoder(resp.headers)
+        if not decoder:
+            body = resp.read()
+            return (body, len(body))
+
+        (body, size) = (bytearray(), 0)
+        while True:
+            chunk = resp.read(self.chunk_size)
+            if not chunk:
+                break
+
+            size += len(chunk)
+            body += decoder.decompress(chunk)
+
+        body += decoder.flush()
+        return (body, size)
+
+
+class RetryPolicy:
+    '''
+    Retry idempotent requests on transient errors with exponential backoff and full jitter.
+    The Retry-After header of the response has priority over the backoff, it is capped only by "max_retry_after".
+    '''
+    def __init__(self, attempts: int = 3, backoff: float = 0.5, max_backoff: float = 30.0, max_retry_after: float = 600.0,
+                 statuses: tuple = (429, 502, 503, 504), methods: tuple = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")) -> None:
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+        self.methods = methods
+
+    def is_retryable(self, method: str, status: int = 0, error: Exception = None) -> bool:
+        if method not in self.methods:
+            return False
+
+        if error:
+            return isinstance(error, (ConnectionError, TimeoutError, http.HTTPException))
+
+        return status in self.statuses
+
+    def get_delay(self, attempt: int, retry_after: str = None) -> float:
+        if retry_after:
+            try:
+                return min(self.max_retry_after, max(0.0, float(retry_after)))
+
+            except ValueError:
+                try:
+                    stamp = email.parsedate_to_datetime(retry_after).timestamp()
+                    return min(self.max_retry_after, max(0.0, stamp - time.time()))
+
+                except (TypeError, ValueError):
+                    pass
+
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+class RateLimiter:
+    '''
+    Token bucket shared by all threads of the client.
+    The rate is halved when the server throttles requests and restored step by step after successful ones.
+    '''
+    def __init__(self, rate: float, burst: int = None, min_rate: float = 1.0) -> None:
+        self.max_rate = rate
+        self.min_rate = min(rate, min_rate)
+        self.rate = rate
+        self._burst = burst or max(1, int(rate))
+        self._tokens = float(self._burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        '''
+        Take a token and return the number of seconds to wait before the request.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1
+
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self) -> None:
+        time.sleep(self.reserve())
+
+    def throttle(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + (self.max_rate / 20))
+
+
+class ResponseCache:
+    '''
+    LRU cache of GET responses with TTL and size limits.
+    Stale entries with an ETag are revalidated with If-None-Match.
+    '''
+    def __init__(self, ttl: float = 60.0, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._items = collections.OrderedDict()
+
+    def get(self, url: str) -> tuple:
+        '''
+        Return (data, etag, is_fresh) or None.
+        '''
+        with self._lock:
+            item = self._items.get(url)
+
+            if item is None:
+                return None
+
+            self._items.move_to_end(url)
+            (data, etag, expires) = item
+
+            if (expires <= time.monotonic()) and not etag:
+                self._remove(url)
+                return None
+
+            return (data, etag, expires > time.monotonic())
+
+    def put(self, url: str, data: bytes, etag: str = None) -> None:
+        with self._lock:
+            if url in self._items:
+                self._remove(url)
+
+            if len(data) > self.max_bytes:
+                return
+
+            self._items[url] = (data, etag, time.monotonic() + self.ttl)
+            self.size += len(data)
+
+            while (len(self._items) > self.max_entries) or (self.size > self.max_bytes):
+                self._remove(next(iter(self._items)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def _remove(self, url: str) -> None:
+        (data, _, _) = self._items.pop(url)
+        self.size -= len(data)
+
+
+class RequestHook:
+    '''
+    Base class for request hooks. Both methods are called for every API request, "cached" is set for fresh cache hits.
+    '''
+    def before_request(self, method: str, url: str, data: bytes) -> None:
+        pass
+
+    def after_request(self, method: str, url: str, status: int, elapsed: float, sent: int, received: int, error: Exception = None,
+                      cached: bool = False) -> None:
+        pass
+
+    def on_retry(self, method: str, url: str, attempt: int, delay: float, status: int, error: Exception = None) -> None:
+        pass
+
+
 class Grafana:
     # https://grafana.com/docs/grafana/latest/developers/http_api/#basic-auth
-    def __init__(self, url: str, token: str, verify: bool = False) -> None:
+    def __init__(self, url: str, token: str, verify: bool = False, pool_size: int = 10, idle_timeout: float = 60.0, hooks: list = None,
+                 retry: RetryPolicy = None, rate_limiter: RateLimiter = None, cache: ResponseCache = None, org_id: int = 0,
+                 compression: bool = True, compress_min_size: int = 0) -> None:
         self._url = url
         self._verify = verify
         self._headers = {
@@ -18,26 +332,174 @@ class Grafana:
             "Authorization": "Bearer {}".format(token)
         }
 
+        # https://grafana.com/docs/grafana/latest/developers/http_api/auth/#x-grafana-org-id-header
+        if org_id:
+            self._headers["X-Grafana-Org-Id"] = str(org_id)
+
+        # Grafana compresses responses with "enable_gzip = true" in the server section.
+        if compression:
+            self._headers["Accept-Encoding"] = "gzip, deflate"
+
+        self._context = ssl.create_default_context() if verify else ssl._create_unverified_context()
+        self._pool = ConnectionPool(pool_size, idle_timeout, self._context)
+
+        self.hooks = list(hooks or [])
+        self.retry = retry or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.compress_min_size = compress_min_size
         self.last_status = 0
 
     def _mkurl(self, path: str) -> str:
         return str(urllib.urljoin(self._url, path))
 
-    def _request(self, req: request.Request, ignore_status: int = 0) -> dict:
-        req.headers = self._headers
-        ctx = None if self._verify else ssl._create_unverified_context()
+    def _request(self, req: Request, ignore_status: int = 0) -> dict:
+        data = self._request_raw(req, ignore_status)
+        return json.loads(data) if data is not None else {}
+
+    def _request_raw(self, req: Request, ignore_status: int = 0) -> bytes:
+        '''
+        Return the response body unparsed or None if the status is ignore_status.
+        '''
+        resp = self._cache_lookup(req)
+        if resp:
+            self._after_request(req, self._before_request(req), resp, cached=True)
+            return self._response_raw(req, resp, ignore_status)
+
+        self._encode_request(req)
+        attempt = 0
 
         try:
-            with request.urlopen(url=req, context=ctx) as client:
-                self.last_status = client.status
-                return json.loads(client.read())
+            while True:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+
+                start = self._before_request(req)
+                (resp, error) = (None, None)
+
+                try:
+                    resp = self._pool.request(req.get_method(), req.full_url, req.data, req.headers)
+
+                except Exception as err:
+                    error = err
+
+                self._after_request(req, start, resp, error)
+                delay = self._get_retry_delay(req, attempt, resp, error)
+
+                if delay is None:
+                    break
+
+                time.sleep(delay)
+                attempt += 1
+
+        finally:
+            self._cache_invalidate(req)
+
+        if error:
+            raise error
+
+        return self._response_raw(req, self._cache_store(req, resp), ignore_status)
+
+    def _cache_lookup(self, req: Request) -> Response:
+        '''
+        Set request headers and return a fresh cached response if there is one.
+        '''
+        req.headers = self._headers
+        item = self.cache.get(req.full_url) if (self.cache and req.get_method() == "GET") else None
+
+        if item:
+            (data, etag, is_fresh) = item
+
+            if is_fresh:
+                self.last_status = 200
+                return Response(200, "OK", None, data, 0)
+
+            # The entry is pinned, it may be evicted before the response arrives.
+            req.headers = dict(self._headers, **{"If-None-Match": etag})
+            req.cached = (data, etag)
+
+        return None
+
+    def _encode_request(self, req: Request) -> None:
+        '''
+        Send bodies of at least "compress_min_size" bytes with gzip encoding, 0 disables it.
+        '''
+        if not (self.compress_min_size and req.data and (len(req.data) >= self.compress_min_size)):
+            return
+
+        encoder = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        req.data = encoder.compress(req.data) + encoder.flush()
+        req.headers = dict(req.headers, **{"Content-Encoding": "gzip"})
+
+    def _cache_invalidate(self, req: Request) -> None:
+        # Any write call may change cached resources, even if it failed or raised.
+        if self.cache and req.get_method() != "GET":
+            self.cache.clear()
+
+    def _cache_store(self, req: Request, resp: Response) -> Response:
+        if not (self.cache and req.get_method() == "GET"):
+            return resp
+
+        if (resp.status == 304) and req.cached:
+            (data, etag) = req.cached
+            self.cache.put(req.full_url, data, resp.headers.get("ETag") or etag)
+            return Response(200, "OK", resp.headers, data, resp.size)
+
+        elif 200 <= resp.status < 300:
+            self.cache.put(req.full_url, resp.data, resp.headers.get("ETag"))
+
+        return resp
+
+    def _get_retry_delay(self, req: Request, attempt: int, resp: Response = None, error: Exception = None) -> float:
+        '''
+        Return seconds to wait before the next attempt or None if the request is not retried.
+        '''
+        status = resp.status if resp else 0
+
+        if self.rate_limiter:
+            if status == 429:
+                self.rate_limiter.throttle()
+
+            elif resp and (status < 500):
+                self.rate_limiter.recover()
+
+        if (attempt >= self.retry.attempts) or not self.retry.is_retryable(req.get_method(), status, error):
+            return None
 
-        except errors.HTTPError as error:
-            if error.status != ignore_status:
-                raise error
+        delay = self.retry.get_delay(attempt, resp.headers.get("Retry-After") if resp else None)
+        for hook in self.hooks:
+            hook.on_retry(req.get_method(), req.full_url, attempt + 1, delay, status, error)
 
-            self.last_status = error.status
-            return {}
+        return delay
+
+    def _before_request(self, req: Request) -> float:
+        for hook in self.hooks:
+            hook.before_request(req.get_method(), req.full_url, req.data)
+
+        return time.perf_counter()
+
+    def _after_request(self, req: Request, start: float, resp: Response = None, error: Exception = None, cached: bool = False) -> None:
+        elapsed = time.perf_counter() - start
+        status = resp.status if resp else 0
+        received = resp.size if resp else 0
+
+        for hook in self.hooks:
+            hook.after_request(req.get_method(), req.full_url, status, elapsed, len(req.data or b""), received, error, cached)
+
+    def _response_raw(self, req: Request, resp: Response, ignore_status: int = 0) -> bytes:
+        self.last_status = resp.status
+
+        if not (200 <= resp.status < 300):
+            if resp.status != ignore_status:
+                from urllib import error as errors
+                raise errors.HTTPError(req.full_url, resp.status, resp.reason, resp.headers, io.BytesIO(resp.data))
+
+            return None
+
+        return resp.data
+
+    def close(self) -> None:
+        self._pool.close()
 
     @property
     def url(self) -> urllib.ParseResult:
@@ -45,25 +507,35 @@ class Grafana:
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder/#get-all-folders
     def list_folders(self) -> list:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/folders")
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder/#get-folder-by-id
     def get_folder_by_id(self, folder_id: int) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/folders/id/{}".format(folder_id))
         ), ignore_status=404)
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder/#get-folder-by-uid
     def get_folder_by_uid(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/folders/{}".format(uid))
+        ), ignore_status=404)
+
+    def get_folder_by_uid_raw(self, uid: str) -> bytes:
+        return self._request_raw(Request(
             method="GET", url=self._mkurl("/api/folders/{}".format(uid))
         ), ignore_status=404)
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder_permissions/#get-permissions-for-a-folder
     def get_folder_permissions(self, uid: str) -> list:
-        return self._request(request.Request(
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/folders/{}/permissions".format(uid))
+        ))
+
+    def get_folder_permissions_raw(self, uid: str) -> bytes:
+        return self._request_raw(Request(
             method="GET", url=self._mkurl("/api/folders/{}/permissions".format(uid))
         ))
 
@@ -71,7 +543,7 @@ class Grafana:
     def update_folder_permissions(self, uid: str, data: dict) -> dict:
         tmp = json.dumps({"items": data})
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="POST", url=self._mkurl("/api/folders/{}/permissions".format(uid)), data=tmp.encode()
         ))
 
@@ -79,11 +551,13 @@ class Grafana:
     def create_folder_by_raw(self, data: dict) -> dict:
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="POST", url=self._mkurl("/api/folders"), data=tmp.encode()
         ))
 
     def create_folder(self, name: str, uid: str = None) -> dict:
+        import uuid
+
         uid = uid if uid else str(uuid.uuid1())
 
         return self.create_folder_by_raw({
@@ -95,7 +569,7 @@ class Grafana:
         data["overwrite"] = True
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="PUT", url=self._mkurl("/api/folders/{}".format(uid)), data=tmp.encode()
         ))
 
@@ -104,32 +578,73 @@ class Grafana:
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder/#delete-folder
     def delete_folder(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="DELETE", url=self._mkurl("/api/folders/{}".format(uid))
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/folder_dashboard_search/#search-folders-and-dashboards
-    def list_dashboards(self, folder_ids: list, page: int = 1, limit: int = 1000) -> list:
-        data = urllib.urlencode({
-            "type": "dash-db", "limit": limit, "page": page, "folderIds": ",".join(map(str, folder_ids))
-        })
+    def list_dashboards(self, folder_ids: list = None, page: int = 1, limit: int = 1000) -> list:
+        data = {"type": "dash-db", "limit": limit, "page": page}
 
-        return self._request(request.Request(
-            method="GET", url=self._mkurl("/api/search?{}".format(data))
+        if folder_ids is not None:
+            data["folderIds"] = ",".join(map(str, folder_ids))
+
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/search?{}".format(urllib.urlencode(data)))
         ))
 
+    def iter_dashboards(self, folder_ids: list = None, page_size: int = 1000) -> typing.Iterator[dict]:
+        '''
+        Yield dashboards from all search pages.
+        The next page is requested while the current one is consumed.
+        '''
+        from concurrent import futures
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            task = executor.submit(self.list_dashboards, folder_ids, page, page_size)
+
+            while task:
+                items = task.result()
+                task = None
+
+                if len(items) >= page_size:
+                    page += 1
+                    task = executor.submit(self.list_dashboards, folder_ids, page, page_size)
+
+                yield from items
+
     # https://grafana.com/docs/grafana/latest/developers/http_api/dashboard/#get-dashboard-by-uid
     def get_dashboard_by_uid(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/dashboards/uid/{}".format(uid))
+        ), ignore_status=404)
+
+    def get_dashboard_by_uid_raw(self, uid: str) -> bytes:
+        '''
+        Same as get_dashboard_by_uid, the body is returned as bytes without parsing.
+        '''
+        return self._request_raw(Request(
             method="GET", url=self._mkurl("/api/dashboards/uid/{}".format(uid))
         ), ignore_status=404)
 
+    # https://grafana.com/docs/grafana/latest/developers/http_api/dashboard_versions/#get-all-dashboards-versions-using-uid
+    def get_dashboard_versions(self, uid: str, limit: int = 1) -> list:
+        data = urllib.urlencode({"limit": limit})
+
+        resp = self._request(Request(
+            method="GET", url=self._mkurl("/api/dashboards/uid/{}/versions?{}".format(uid, data))
+        ), ignore_status=404)
+
+        # Grafana 11 wraps the list: {"continueToken": "", "versions": []}
+        return resp.get("versions", []) if isinstance(resp, dict) else resp
+
     # https://grafana.com/docs/grafana/latest/developers/http_api/dashboard/#create--update-dashboard
     def update_dashboard(self, data: dict) -> dict:
         data["overwrite"] = True
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="POST", url=self._mkurl("/api/dashboards/db"), data=tmp.encode()
         ))
 
@@ -140,31 +655,31 @@ class Grafana:
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/dashboard/#delete-dashboard-by-uid
     def delete_dashboard(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="DELETE", url=self._mkurl("/api/dashboards/uid/{}".format(uid))
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#get-all-data-sources
     def list_datasources(self) -> list:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/datasources")
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#get-a-single-data-source-by-id
     def get_datasource_by_id(self, ds_id: int) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/datasources/{}".format(ds_id))
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#get-a-single-data-source-by-uid
     def get_datasource_by_uid(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/datasources/uid/{}".format(uid))
         ), ignore_status=404)
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#get-a-single-data-source-by-name
     def get_datasource_by_name(self, name: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="GET", url=self._mkurl("/api/datasources/name/{}".format(name))
         ), ignore_status=404)
 
@@ -172,7 +687,7 @@ class Grafana:
     def create_datasource(self, data: dict) -> dict:
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="POST", url=self._mkurl("/api/datasources"), data=tmp.encode()
         ))
 
@@ -180,7 +695,7 @@ class Grafana:
     def update_datasource(self, uid: str, data: dict) -> dict:
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="PUT", url=self._mkurl("/api/datasources/uid/{}".format(uid)), data=tmp.encode()
         ))
 
@@ -188,24 +703,77 @@ class Grafana:
     def update_datasource_by_id(self, ds_id: int, data: dict) -> dict:
         tmp = json.dumps(data)
 
-        return self._request(request.Request(
+        return self._request(Request(
             method="PUT", url=self._mkurl("/api/datasources/{}".format(ds_id)), data=tmp.encode()
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#delete-an-existing-data-source-by-id
     def delete_datasource_by_id(self, ds_id: int) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="DELETE", url=self._mkurl("/api/datasources/{}".format(ds_id))
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#delete-an-existing-data-source-by-uid
     def delete_datasource_by_uid(self, uid: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="DELETE", url=self._mkurl("/api/datasources/uid/{}".format(uid))
         ))
 
     # https://grafana.com/docs/grafana/latest/developers/http_api/data_source/#delete-an-existing-data-source-by-name
     def delete_datasource_by_name(self, name: str) -> dict:
-        return self._request(request.Request(
+        return self._request(Request(
             method="DELETE", url=self._mkurl("/api/datasources/name/{}".format(name))
         ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/library_element/#get-all-library-elements
+    def list_library_elements(self, page: int = 1, per_page: int = 100) -> dict:
+        data = urllib.urlencode({"page": page, "perPage": per_page})
+
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/library-elements?{}".format(data))
+        ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/library_element/#get-library-element-by-uid
+    def get_library_element_by_uid(self, uid: str) -> dict:
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/library-elements/{}".format(uid))
+        ), ignore_status=404)
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/library_element/#create-library-element
+    def create_library_element(self, data: dict) -> dict:
+        tmp = json.dumps(data)
+
+        return self._request(Request(
+            method="POST", url=self._mkurl("/api/library-elements"), data=tmp.encode()
+        ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/library_element/#update-library-element
+    def update_library_element(self, uid: str, data: dict) -> dict:
+        tmp = json.dumps(data)
+
+        return self._request(Request(
+            method="PATCH", url=self._mkurl("/api/library-elements/{}".format(uid)), data=tmp.encode()
+        ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/alerting_provisioning/#get-alert-rules
+    def list_alert_rules(self) -> list:
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/v1/provisioning/alert-rules")
+        ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/alerting_provisioning/#get-contact-points
+    def list_contact_points(self) -> list:
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/v1/provisioning/contact-points")
+        ))
+
+    # https://grafana.com/docs/grafana/latest/developers/http_api/annotations/#find-annotations
+    def list_annotations(self, limit: int = 100, to_time: int = None) -> list:
+        data = {"limit": limit}
+
+        if to_time is not None:
+            data["to"] = to_time
+
+        return self._request(Request(
+            method="GET", url=self._mkurl("/api/annotations?{}".format(urllib.urlencode(data)))
+        ))
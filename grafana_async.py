@@ -0,0 +1,288 @@
+import ssl
+import json
+import time
+import typing
+import asyncio
+import grafana
+
+from http import client as http
+from email import parser
+from urllib import parse as urllib
+
+
+class Body:
+    '''
+    Response body buffer, a compressed body is decoded chunk by chunk as it arrives.
+    '''
+    def __init__(self, decoder: typing.Any = None) -> None:
+        self._decoder = decoder
+        self._data = bytearray()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._data += self._decoder.decompress(chunk) if self._decoder else chunk
+
+    def getvalue(self) -> bytes:
+        if self._decoder:
+            self._data += self._decoder.flush()
+
+        return self._data
+
+
+class AsyncConnectionPool:
+    '''
+    Keep-alive connections on asyncio streams grouped by (scheme, host, port).
+    At most "limit" requests per host run at the same time.
+    '''
+    def __init__(self, limit: int = 10, idle_timeout: float = 60.0, context: ssl.SSLContext = None) -> None:
+        self._limit = limit
+        self._idle_timeout = idle_timeout
+        self._context = context
+        self._idle = {}
+        self._semaphores = {}
+        self.chunk_size = 64 * 1024
+
+    async def acquire(self, key: tuple) -> tuple:
+        '''
+        Return (reader, writer, is_reused).
+        '''
+        now = time.monotonic()
+        items = self._idle.get(key, [])
+
+        while items:
+            (reader, writer, stamp) = items.pop()
+            if ((now - stamp) < self._idle_timeout) and not reader.at_eof():
+                return (reader, writer, True)
+
+            writer.close()
+
+        (scheme, host, port) = key
+        ctx = self._context if scheme == "https" else None
+        port = port or (443 if scheme == "https" else 80)
+
+        (reader, writer) = await asyncio.open_connection(host, port, ssl=ctx)
+        return (reader, writer, False)
+
+    def release(self, key: tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        items = self._idle.setdefault(key, [])
+
+        if len(items) < self._limit:
+            items.append((reader, writer, time.monotonic()))
+            return
+
+        writer.close()
+
+    async def close(self) -> None:
+        for items in self._idle.values():
+            for (_, writer, _) in items:
+                writer.close()
+
+        self._idle.clear()
+
+    async def request(self, method: str, url: str, data: bytes = None, headers: dict = None) -> grafana.Response:
+        parts = urllib.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+
+        if parts.query:
+            path = "{}?{}".format(path, parts.query)
+
+        if key not in self._semaphores:
+            self._semaphores[key] = asyncio.Semaphore(self._limit)
+
+        async with self._semaphores[key]:
+            while True:
+                (reader, writer, is_reused) = await self.acquire(key)
+
+                try:
+                    (resp, keep_alive) = await self._send(reader, writer, method, path, parts.netloc, data, headers or {})
+
+                except (http.HTTPException, ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+
+                    # The server may close an idle keep-alive connection at any time.
+                    if is_reused:
+                        continue
+
+                    raise
+
+                except BaseException:
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    self.release(key, reader, writer)
+
+                else:
+                    writer.close()
+
+                return resp
+
+    # https://www.rfc-editor.org/rfc/rfc9112
+    async def _send(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str, host: str, data: bytes, headers: dict) -> tuple:
+        lines = ["{} {} HTTP/1.1".format(method, path), "Host: {}".format(host)]
+        lines.extend(map(lambda item: "{}: {}".format(*item), headers.items()))
+
+        if data is not None:
+            lines.append("Content-Length: {}".format(len(data)))
+
+        writer.write("\r\n".join(lines).encode("latin-1") + b"\r\n\r\n" + (data or b""))
+        await writer.drain()
+
+        line = await reader.readline()
+        if not line:
+            raise http.RemoteDisconnected("Remote end closed connection without response")
+
+        (version, status, *reason) = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+        if not version.startswith("HTTP/"):
+            raise http.BadStatusLine(line)
+
+        raw = b""
+        while True:
+            line = await reader.readline()
+            raw += line
+
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+        resp_headers = parser.BytesParser(_class=http.HTTPMessage).parsebytes(raw)
+        status = int(status)
+        keep_alive = (version == "HTTP/1.1") and (resp_headers.get("Connection", "").lower() != "close")
+
+        body = Body(grafana.get_decoder(resp_headers))
+
+        if (method == "HEAD") or (status in (204, 304)) or (100 <= status < 200):
+            pass
+
+        elif resp_headers.get("Transfer-Encoding", "").lower() == "chunked":
+            await self._read_chunked(reader, body)
+
+        elif resp_headers.get("Content-Length") is not None:
+            size = int(resp_headers["Content-Length"])
+
+            while size:
+                chunk = await reader.readexactly(min(size, self.chunk_size))
+                body.write(chunk)
+                size -= len(chunk)
+
+        else:
+            while not reader.at_eof():
+                body.write(await reader.read(self.chunk_size))
+
+            keep_alive = False
+
+        return (grafana.Response(status, reason[0] if reason else "", resp_headers, body.getvalue(), body.size), keep_alive)
+
+    async def _read_chunked(self, reader: asyncio.StreamReader, body: Body) -> None:
+        while True:
+            line = await reader.readline()
+            size = int(line.split(b";", 1)[0].strip(), 16)
+
+            if not size:
+                break
+
+            while size:
+                chunk = await reader.readexactly(min(size, self.chunk_size))
+                body.write(chunk)
+                size -= len(chunk)
+
+            await reader.readline()
+
+        # Skip trailer fields.
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+
+class AsyncGrafana(grafana.Grafana):
+    '''
+    Same methods as grafana.Grafana, every API call returns a coroutine.
+    '''
+    def __init__(self, url: str, token: str, verify: bool = False, limit_per_host: int = 10, idle_timeout: float = 60.0, hooks: list = None,
+                 retry: grafana.RetryPolicy = None, rate_limiter: grafana.RateLimiter = None, cache: grafana.ResponseCache = None,
+                 org_id: int = 0, compression: bool = True, compress_min_size: int = 0) -> None:
+        super().__init__(url, token, verify, limit_per_host, idle_timeout, hooks, retry, rate_limiter, cache, org_id, compression, compress_min_size)
+        self._pool = AsyncConnectionPool(limit_per_host, idle_timeout, self._context)
+
+    async def _request(self, req: grafana.Request, ignore_status: int = 0) -> dict:
+        data = await self._request_raw(req, ignore_status)
+        return json.loads(data) if data is not None else {}
+
+    async def _request_raw(self, req: grafana.Request, ignore_status: int = 0) -> bytes:
+        '''
+        Return the response body unparsed or None if the status is ignore_status.
+        '''
+        resp = self._cache_lookup(req)
+        if resp:
+            self._after_request(req, self._before_request(req), resp, cached=True)
+            return self._response_raw(req, resp, ignore_status)
+
+        self._encode_request(req)
+        attempt = 0
+
+        try:
+            while True:
+                if self.rate_limiter:
+                    await asyncio.sleep(self.rate_limiter.reserve())
+
+                start = self._before_request(req)
+                (resp, error) = (None, None)
+
+                try:
+                    resp = await self._pool.request(req.get_method(), req.full_url, req.data, req.headers)
+
+                except Exception as err:
+                    error = err
+
+                self._after_request(req, start, resp, error)
+                delay = self._get_retry_delay(req, attempt, resp, error)
+
+                if delay is None:
+                    break
+
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        finally:
+            self._cache_invalidate(req)
+
+        if error:
+            raise error
+
+        return self._response_raw(req, self._cache_store(req, resp), ignore_status)
+
+    async def close(self) -> None:
+        await self._pool.close()
+
+    async def get_dashboard_versions(self, uid: str, limit: int = 1) -> list:
+        data = urllib.urlencode({"limit": limit})
+
+        resp = await self._request(grafana.Request(
+            method="GET", url=self._mkurl("/api/dashboards/uid/{}/versions?{}".format(uid, data))
+        ), ignore_status=404)
+
+        return resp.get("versions", []) if isinstance(resp, dict) else resp
+
+    async def iter_dashboards(self, folder_ids: list = None, page_size: int = 1000) -> typing.AsyncIterator[dict]:
+        '''
+        Yield dashboards from all search pages.
+        The next page is requested while the current one is consumed.
+        '''
+        page = 1
+        task = asyncio.ensure_future(self.list_dashboards(folder_ids, page, page_size))
+
+        try:
+            while task:
+                items = await task
+                task = None
+
+                if len(items) >= page_size:
+                    page += 1
+                    task = asyncio.ensure_future(self.list_dashboards(folder_ids, page, page_size))
+
+                for item in items:
+                    yield item
+
+        finally:
+            if task:
+                task.cancel()
@@ -64,6 +64,11 @@ class TestGrafanaAPI(unittest.TestCase):
         self.assertIsNot(resp, list)
         self.assertTrue(resp)
 
+    def test_iter_dashboards(self) -> None:
+        resp = list(self.client.iter_dashboards(page_size=1))
+        self.assertTrue(resp)
+        self.assertIn(self.data_dashboard_uid, map(lambda item: item.get("uid"), resp))
+
     def test_get_dashboard(self) -> None:
         resp = self.client.get_dashboard_by_uid(self.data_dashboard_uid)
         self.assertIsNot(resp, dict)
@@ -0,0 +1,199 @@
+import re
+import json
+import typing
+import collections
+
+# A "datasource" or "libraryPanel" key of an object, keys inside strings have escaped quotes.
+REFERENCE = re.compile(r'[{,]\s*"(datasource|libraryPanel)"\s*:\s*')
+
+
+def iter_panels(item: dict) -> typing.Iterator[dict]:
+    '''
+    Yield panels of the dashboard including panels of collapsed rows and of the old "rows" schema.
+    '''
+    for panel in (item.get("panels") or []):
+        yield panel
+        yield from iter_panels(panel)
+
+    for row in (item.get("rows") or []):
+        yield from iter_panels(row)
+
+
+def get_datasource(value: typing.Any) -> str:
+    '''
+    Return uid or name of a datasource reference, it is an object since Grafana 8.3 and a name before.
+    '''
+    if isinstance(value, dict):
+        return value.get("uid") or value.get("type")
+
+    return value if isinstance(value, str) else None
+
+
+def get_references(dashboard: dict) -> dict:
+    '''
+    Return datasources (uid or name) and library panels (uid) used by panels and targets of the dashboard.
+    '''
+    (datasources, library_panels) = (set(), set())
+
+    for panel in iter_panels(dashboard):
+        datasources.add(get_datasource(panel.get("datasource")))
+        datasources.update(map(lambda target: get_datasource(target.get("datasource")), panel.get("targets") or []))
+
+        if isinstance(panel.get("libraryPanel"), dict):
+            library_panels.add(panel["libraryPanel"].get("uid"))
+
+    return {"datasources": sorted(filter(None, datasources)), "library_panels": sorted(filter(None, library_panels))}
+
+
+def get_raw_references(text: str) -> dict:
+    '''
+    Return references as get_references() from the JSON text of a dashboard, only the referenced values are decoded.
+    Datasources of template variables and annotations are included, the dashboard needs them as well.
+    '''
+    (datasources, library_panels) = (set(), set())
+    decoder = json.JSONDecoder()
+
+    for match in REFERENCE.finditer(text):
+        (value, _) = decoder.raw_decode(text, match.end())
+
+        if match.group(1) == "datasource":
+            datasources.add(get_datasource(value))
+
+        elif isinstance(value, dict):
+            library_panels.add(value.get("uid"))
+
+    return {"datasources": sorted(filter(None, datasources)), "library_panels": sorted(filter(None, library_panels))}
+
+
+class Graph:
+    '''
+    Dependencies of backup items, nodes are "<type>/<key>" with the stored file relative to the backup directory.
+    An edge points from an item to an item that must exist before it is restored.
+    '''
+    def __init__(self, nodes: dict = None, edges: dict = None) -> None:
+        self.nodes = nodes or {}
+        self.edges = collections.defaultdict(list, edges or {})
+
+    @classmethod
+    def loads(cls, data: typing.Union[bytes, str]) -> "Graph":
+        data = json.loads(data)
+        return cls(data.get("nodes"), data.get("edges"))
+
+    def dumps(self) -> str:
+        return json.dumps({"nodes": self.nodes, "edges": dict(self.edges)})
+
+    def add_node(self, key: str, **kwargs) -> None:
+        self.nodes[key] = kwargs
+
+    def add_edge(self, source: str, target: str) -> None:
+        if target not in self.edges[source]:
+            self.edges[source].append(target)
+
+    def select(self, folders: list = None, tags: list = None) -> set:
+        '''
+        Return dashboards of the folders (uid or title) and dashboards with any of the tags.
+        '''
+        (folders, tags) = (set(folders or []), set(tags or []))
+        folder_uids = set()
+
+        for (key, node) in self.nodes.items():
+            if key.startswith("folders/") and ({node.get("uid"), node.get("title")} & folders):
+                folder_uids.add(node["uid"])
+
+        items = set(map(lambda uid: "folders/{}".format(uid), folder_uids))
+        for (key, node) in self.nodes.items():
+            if key.startswith("dashboards/") and ((node.get("folder") in folder_uids) or (set(node.get("tags", [])) & tags)):
+                items.add(key)
+
+        return items
+
+    def get_closure(self, keys: typing.Iterable) -> set:
+        '''
+        Return the keys with everything they depend on.
+        '''
+        (items, stack) = (set(), list(keys))
+
+        while stack:
+            key = stack.pop()
+            if key in items:
+                continue
+
+            items.add(key)
+            stack.extend(filter(lambda item: item in self.nodes, self.edges.get(key, [])))
+
+        return items
+
+    def get_levels(self, keys: typing.Iterable) -> list:
+        '''
+        Return keys in topological order as levels, items of a level don't depend on each other.
+        '''
+        keys = set(keys)
+        deps = {key: set(filter(lambda item: item in keys, self.edges.get(key, []))) for key in keys}
+        levels = []
+
+        while deps:
+            level = sorted(key for (key, items) in deps.items() if not items)
+            if not level:
+                raise Exception("Dependency cycle: {}".format(", ".join(sorted(deps))))
+
+            levels.append(level)
+            for key in level:
+                del deps[key]
+
+            for items in deps.values():
+                items.difference_update(level)
+
+        return levels
+
+
+def build_graph(items: list, dashboards: dict) -> Graph:
+    '''
+    Return the graph of stored (type, key, item, file) items and manifest dashboards.
+    Dashboard nodes keep the archive of their file, an incremental archive has only files of changed dashboards.
+    Datasource references are resolved by uid and by name, unknown ones (e.g. template variables) are skipped.
+    '''
+    result = Graph()
+    datasources = {}
+    library_panels = {}
+
+    for (kind, key, item, file) in items:
+        if kind == "folders":
+            result.add_node("folders/{}".format(item["uid"]), file=file, uid=item["uid"], title=item.get("title", ""))
+
+        elif kind == "datasources":
+            node = "datasources/{}".format(key)
+            result.add_node(node, file=file, uid=item.get("uid"), title=item.get("name", ""))
+            datasources.update({item.get("uid"): node, item.get("name"): node})
+
+        elif kind == "library_panels":
+            node = "library_panels/{}".format(key)
+            result.add_node(node, file=file, uid=item["uid"], title=item.get("name", ""), folder=item.get("folderUid", ""))
+            library_panels[item["uid"]] = (node, item)
+
+    for (node, item) in library_panels.values():
+        if item.get("folderUid"):
+            result.add_edge(node, "folders/{}".format(item["folderUid"]))
+
+        for name in get_references({"panels": [item.get("model") or {}]})["datasources"]:
+            if name in datasources:
+                result.add_edge(node, datasources[name])
+
+    for (uid, item) in dashboards.items():
+        node = "dashboards/{}".format(uid)
+        result.add_node(
+            node, file=item.get("file"), uid=uid, title=item.get("title", ""), folder=item.get("folderUid", ""), tags=item.get("tags", []),
+            archive=item.get("archive")
+        )
+
+        if item.get("folderUid"):
+            result.add_edge(node, "folders/{}".format(item["folderUid"]))
+
+        for name in item.get("datasources", []):
+            if name in datasources:
+                result.add_edge(node, datasources[name])
+
+        for name in item.get("library_panels", []):
+            if name in library_panels:
+                result.add_edge(node, library_panels[name][0])
+
+    return result
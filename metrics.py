@@ -0,0 +1,151 @@
+import bisect
+import grafana
+import threading
+import collections
+
+from urllib import parse as urllib
+
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+# Collections of the API, the segment after a collection is an identifier unless it is a sub-resource.
+COLLECTIONS = (
+    "folders", "dashboards", "datasources", "library-elements", "alert-rules", "contact-points", "annotations",
+    "teams", "users", "orgs", "playlists", "snapshots", "mute-timings", "templates", "policies"
+)
+SUB_RESOURCES = ("id", "uid", "name", "db", "home", "tags", "import", "search", "proxy", "lookup")
+
+
+def get_endpoint(url: str) -> str:
+    '''
+    Replace identifiers in the API path: /api/folders/abc/permissions -> /api/folders/:uid/permissions
+    '''
+    parts = urllib.urlsplit(url).path.strip("/").split("/")
+
+    for (index, item) in enumerate(parts):
+        prev_item = parts[index - 1] if index else ""
+
+        if prev_item in ("uid", "id", "name"):
+            parts[index] = ":{}".format(prev_item)
+
+        elif item.isdigit():
+            parts[index] = ":id"
+
+        elif (prev_item in COLLECTIONS) and (item not in SUB_RESOURCES):
+            parts[index] = ":uid"
+
+    return "/{}".format("/".join(parts))
+
+
+class Histogram:
+    def __init__(self, buckets: list = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsCollector(grafana.RequestHook):
+    '''
+    Collect per-endpoint latency histograms, payload sizes and status codes.
+    '''
+    def __init__(self, buckets: list = BUCKETS) -> None:
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self.latency = collections.defaultdict(lambda: Histogram(self._buckets))
+        self.statuses = collections.Counter()
+        self.errors = collections.Counter()
+        self.retries = collections.Counter()
+        self.sent_bytes = collections.Counter()
+        self.received_bytes = collections.Counter()
+        self.cache_hits = collections.Counter()
+
+    def after_request(self, method: str, url: str, status: int, elapsed: float, sent: int, received: int, error: Exception = None,
+                      cached: bool = False) -> None:
+        key = (method, get_endpoint(url))
+
+        with self._lock:
+            self.latency[key].observe(elapsed)
+            self.statuses[key + (status, )] += 1
+            self.sent_bytes[key] += sent
+            self.received_bytes[key] += received
+
+            if cached:
+                self.cache_hits[key] += 1
+
+            if error:
+                self.errors[key + (error.__class__.__name__, )] += 1
+
+    def on_retry(self, method: str, url: str, attempt: int, delay: float, status: int, error: Exception = None) -> None:
+        with self._lock:
+            self.retries[(method, get_endpoint(url))] += 1
+
+    def summary(self, limit: int = 5) -> str:
+        '''
+        Return totals and the endpoints with the largest total latency.
+        '''
+        with self._lock:
+            items = sorted(self.latency.items(), key=lambda item: item[1].sum, reverse=True)
+            requests = sum(map(lambda item: item.count, self.latency.values()))
+            elapsed = sum(map(lambda item: item.sum, self.latency.values()))
+            received = sum(self.received_bytes.values())
+            retries = sum(self.retries.values())
+            cached = sum(self.cache_hits.values())
+            failed = sum(map(lambda item: item[1], filter(lambda item: item[0][2] >= 400 or not item[0][2], self.statuses.items())))
+
+        lines = ["Requests: {} (failed: {}, retries: {}, cached: {}), time: {:.2f}s, received: {} bytes".format(
+            requests, failed, retries, cached, elapsed, received
+        )]
+        for ((method, endpoint), value) in items[:limit]:
+            lines.append("{} {}: {} requests, {:.2f}s total, {:.1f}ms avg".format(
+                method, endpoint, value.count, value.sum, value.sum / value.count * 1000
+            ))
+
+        return "\n".join(lines)
+
+    # https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+    def prometheus(self, prefix: str = "grafana_client") -> str:
+        lines = []
+
+        with self._lock:
+            lines.append("# TYPE {}_request_duration_seconds histogram".format(prefix))
+            for ((method, endpoint), value) in sorted(self.latency.items()):
+                labels = 'method="{}",endpoint="{}"'.format(method, endpoint)
+                total = 0
+
+                for (bound, count) in zip(self._buckets + ["+Inf"], value.counts):
+                    total += count
+                    lines.append('{}_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(prefix, labels, bound, total))
+
+                lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(prefix, labels, value.sum))
+                lines.append("{}_request_duration_seconds_count{{{}}} {}".format(prefix, labels, value.count))
+
+            lines.append("# TYPE {}_requests_total counter".format(prefix))
+            for ((method, endpoint, status), value) in sorted(self.statuses.items()):
+                lines.append('{}_requests_total{{method="{}",endpoint="{}",status="{}"}} {}'.format(prefix, method, endpoint, status, value))
+
+            lines.append("# TYPE {}_request_errors_total counter".format(prefix))
+            for ((method, endpoint, error), value) in sorted(self.errors.items()):
+                lines.append('{}_request_errors_total{{method="{}",endpoint="{}",error="{}"}} {}'.format(prefix, method, endpoint, error, value))
+
+            lines.append("# TYPE {}_request_retries_total counter".format(prefix))
+            for ((method, endpoint), value) in sorted(self.retries.items()):
+                lines.append('{}_request_retries_total{{method="{}",endpoint="{}"}} {}'.format(prefix, method, endpoint, value))
+
+            lines.append("# TYPE {}_cache_hits_total counter".format(prefix))
+            for ((method, endpoint), value) in sorted(self.cache_hits.items()):
+                lines.append('{}_cache_hits_total{{method="{}",endpoint="{}"}} {}'.format(prefix, method, endpoint, value))
+
+            for (name, counter) in (("sent", self.sent_bytes), ("received", self.received_bytes)):
+                lines.append("# TYPE {}_{}_bytes_total counter".format(prefix, name))
+
+                for ((method, endpoint), value) in sorted(counter.items()):
+                    lines.append('{}_{}_bytes_total{{method="{}",endpoint="{}"}} {}'.format(prefix, name, method, endpoint, value))
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import backup
+import pathlib
+import logging
+import grafana
+import metrics
+import traceback
+
+from concurrent import futures
+
+# DEBUG_MODE
+# BACKUP_CONFIG
+# BACKUP_CODEC
+# BACKUP_INSTANCES_CONCURRENCY
+# BACKUP_UPLOAD_CONCURRENCY
+# BACKUP_METRICS_FILE
+# SLACK_API_URL
+# SLACK_CHANNEL
+# AWS_S3_BUCKET
+# AWS_ENDPOINT_URL
+# AWS_ACCESS_KEY_ID
+# AWS_SECRET_ACCESS_KEY
+
+
+def load_config(path: str) -> list:
+    '''
+    Return instances of the config, "defaults" are merged into every instance.
+    The token is read from "token" or from the environment variable named by "token_env".
+    '''
+    data = json.loads(pathlib.Path(path).read_text())
+    defaults = data.get("defaults", {})
+    instances = []
+
+    for item in data.get("instances", []):
+        item = dict(defaults, **item)
+
+        if not (item.get("name") and item.get("url")):
+            raise Exception("Instance requires name and url: {}".format(item.get("name") or item.get("url")))
+
+        if item["name"] in map(lambda instance: instance["name"], instances):
+            raise Exception("Duplicate instance name: {}".format(item["name"]))
+
+        if item.get("token_env"):
+            item["token"] = os.environ.get(item["token_env"], "")
+
+        instances.append(item)
+
+    return instances
+
+
+class Orchestrator:
+    '''
+    Back up many Grafana instances and orgs from one process.
+    Instances run in parallel, archives go through one shared upload pool under the "<name>/" key prefix.
+    '''
+    def __init__(self, instances: list, bucket: str, base_dir: str = "./data", concurrency: int = 4, upload_concurrency: int = 4,
+                 codec: str = "gzip", hooks: list = None) -> None:
+        self._instances = instances
+        self._bucket = bucket
+        self._base_path = pathlib.Path(base_dir)
+        self._concurrency = max(1, concurrency)
+        self._upload_concurrency = max(1, upload_concurrency)
+        self._codec = codec
+        self._hooks = list(hooks or [])
+        self.results = []
+
+    def get_client(self, instance: dict) -> grafana.Grafana:
+        concurrency = int(instance.get("concurrency", 1))
+        rate_limit = float(instance.get("rate_limit", 0))
+        cache_ttl = float(instance.get("cache_ttl", 0))
+
+        return grafana.Grafana(
+            url=instance["url"], token=instance.get("token", ""),
+            verify=bool(instance.get("verify", False)),
+            pool_size=max(10, concurrency), hooks=self._hooks,
+            rate_limiter=grafana.RateLimiter(rate_limit) if rate_limit else None,
+            cache=grafana.ResponseCache(cache_ttl) if cache_ttl > 0 else None,
+            org_id=int(instance.get("org_id", 0))
+        )
+
+    def backup_instance(self, instance: dict) -> tuple:
+        '''
+        Return (backup, path to the archive) of the instance.
+        '''
+        logging.info("Backup instance: {} ({})".format(instance["name"], instance["url"]))
+        client = self.get_client(instance)
+
+        try:
+            grafana_backup = backup.Backup(
+                client, str(self._base_path.joinpath(instance["name"])),
+                int(instance.get("concurrency", 1)), codec=instance.get("codec", self._codec),
+                resources=instance.get("exporters"), with_graph=instance.get("graph", True)
+            )
+
+            grafana_backup.backup_all()
+            return (grafana_backup, grafana_backup.create_archive())
+
+        finally:
+            client.close()
+
+    def run(self) -> list:
+        '''
+        Return {"name", "key", "failed_items", "error"} for every instance.
+        A failed instance does not stop the others.
+        '''
+        s3_client = backup.get_s3_client()
+        self.results = list(map(lambda item: {"name": item["name"], "key": None, "failed_items": [], "error": None}, self._instances))
+        uploads = []
+
+        with futures.ThreadPoolExecutor(max_workers=self._upload_concurrency) as upload_executor:
+            with futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+                tasks = {}
+                for (instance, result) in zip(self._instances, self.results):
+                    tasks[executor.submit(self.backup_instance, instance)] = (instance, result)
+
+                for task in futures.as_completed(tasks):
+                    (instance, result) = tasks[task]
+
+                    try:
+                        (grafana_backup, archive) = task.result()
+
+                    except Exception as error:
+                        logging.error("Failed instance: {}\n{}".format(instance["name"], traceback.format_exc()))
+                        result["error"] = "{}: {}".format(error.__class__.__name__, error)
+                        continue
+
+                    # Uploads of finished instances overlap with backups of the others.
+                    result["failed_items"] = grafana_backup.failed_items
+                    uploads.append((result, upload_executor.submit(
+                        grafana_backup.upload_archive, archive, self._bucket, instance["name"], s3_client
+                    )))
+
+            for (result, task) in uploads:
+                try:
+                    result["key"] = task.result()
+
+                except Exception as error:
+                    logging.error("Failed upload: {}\n{}".format(result["name"], traceback.format_exc()))
+                    result["error"] = "{}: {}".format(error.__class__.__name__, error)
+
+        return self.results
+
+    def get_message(self) -> str:
+        lines = []
+
+        for result in self.results:
+            if result["error"]:
+                lines.append("{}: failure ({})".format(result["name"], result["error"]))
+
+            elif result["failed_items"]:
+                lines.append("{}: uploaded s3://{}/{}, failed items: {}".format(
+                    result["name"], self._bucket, result["key"], ", ".join(result["failed_items"])
+                ))
+
+            else:
+                lines.append("{}: uploaded s3://{}/{}".format(result["name"], self._bucket, result["key"]))
+
+        return "\n".join(lines)
+
+    def is_failed(self) -> bool:
+        return any(map(lambda item: item["error"] or item["failed_items"], self.results))
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.INFO
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    collector = metrics.MetricsCollector()
+    api_url = os.environ.get("SLACK_API_URL", "")
+    channel = os.environ.get("SLACK_CHANNEL", "")
+    title = "Backup data from Grafana instances"
+
+    try:
+        orchestrator = Orchestrator(
+            instances=load_config(os.environ.get("BACKUP_CONFIG", "") or "./instances.json"),
+            bucket=os.environ.get("AWS_S3_BUCKET", ""),
+            concurrency=int(os.environ.get("BACKUP_INSTANCES_CONCURRENCY", "") or 4),
+            upload_concurrency=int(os.environ.get("BACKUP_UPLOAD_CONCURRENCY", "") or 4),
+            codec=os.environ.get("BACKUP_CODEC", "") or "gzip", hooks=[collector]
+        )
+
+        orchestrator.run()
+        message = orchestrator.get_message()
+        logging.info("Backup results:\n{}".format(message))
+        backup.send_notification(api_url, channel, title, message, orchestrator.is_failed())
+
+        if any(map(lambda item: item["error"], orchestrator.results)):
+            sys.exit(1)
+
+    except Exception as error:
+        logging.error(traceback.format_exc())
+        backup.send_notification(api_url, channel, title, "Failure: ({}: {})".format(error.__class__.__name__, error), True)
+        sys.exit(1)
+
+    finally:
+        logging.info("Requests summary:\n{}".format(collector.summary()))
+
+        if os.environ.get("BACKUP_METRICS_FILE", ""):
+            pathlib.Path(os.environ["BACKUP_METRICS_FILE"]).write_text(collector.prometheus())
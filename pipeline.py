@@ -0,0 +1,215 @@
+import time
+import queue
+import typing
+import logging
+import threading
+
+from concurrent import futures
+
+# The stage of the current thread, time blocked on a full queue is added to it.
+CURRENT = threading.local()
+
+
+def get_current() -> "Stage":
+    return getattr(CURRENT, "stage", None)
+
+
+def add_blocked(seconds: float) -> None:
+    CURRENT.blocked = getattr(CURRENT, "blocked", 0.0) + seconds
+    stage = get_current()
+
+    if stage:
+        stage.record(blocked=seconds)
+
+
+class Stage:
+    '''
+    Bounded executor of a pipeline stage, "submit" blocks while the queue is full.
+    Busy time excludes time blocked on the next stage, idle time is spent waiting for input.
+    '''
+    def __init__(self, name: str, workers: int = 1, queue_size: int = 0, stop_on_error: bool = False) -> None:
+        self.name = name
+        self.workers = workers
+        self.queue_size = queue_size or max(1, workers) * 2
+        self.stop_on_error = stop_on_error
+        self.error = None
+        self.items = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name="{}-{}".format(self.name, index), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def record(self, items: int = 0, size: int = 0, busy: float = 0.0, idle: float = 0.0, blocked: float = 0.0) -> None:
+        with self._lock:
+            self.items += items
+            self.bytes += size
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+
+    def submit(self, handler: typing.Callable, *args, size: int = 0) -> futures.Future:
+        task = futures.Future()
+        start = time.perf_counter()
+
+        self._queue.put((task, handler, args, size))
+        add_blocked(time.perf_counter() - start)
+        return task
+
+    def _run(self) -> None:
+        CURRENT.stage = self
+
+        while True:
+            start = time.perf_counter()
+            entry = self._queue.get()
+            self.record(idle=time.perf_counter() - start)
+
+            if entry is None:
+                self._queue.task_done()
+                break
+
+            (task, handler, args, size) = entry
+            (start, blocked) = (time.perf_counter(), getattr(CURRENT, "blocked", 0.0))
+
+            if not task.set_running_or_notify_cancel():
+                self._queue.task_done()
+                continue
+
+            try:
+                # A failed write stops the stage, so no later item is recorded as stored.
+                if self.error and self.stop_on_error:
+                    raise Exception("Stage is stopped: {} ({}: {})".format(self.name, self.error.__class__.__name__, self.error))
+
+                task.set_result(handler(*args))
+
+            except Exception as error:
+                task.set_exception(error)
+                if self.stop_on_error:
+                    self.error = self.error or error
+
+            finally:
+                elapsed = time.perf_counter() - start
+                self.record(items=1, size=size, busy=elapsed - (getattr(CURRENT, "blocked", 0.0) - blocked))
+                self._queue.task_done()
+
+    def join(self) -> None:
+        '''
+        Wait for all submitted items, raise the error of a stopped stage.
+        '''
+        self._queue.join()
+
+        if self.error:
+            raise self.error
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads = []
+
+
+class Pipeline:
+    '''
+    Stages connected by bounded queues: a full queue blocks the stage before it, so memory is capped by queue sizes.
+    The report shows per-stage throughput and utilization, the busiest stage is the bottleneck.
+    '''
+    def __init__(self) -> None:
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._finished = None
+
+    def add_stage(self, name: str, workers: int = 1, queue_size: int = 0, stop_on_error: bool = False) -> Stage:
+        '''
+        A stage without workers is run by the caller, e.g. the source of items.
+        '''
+        stage = Stage(name, workers, queue_size, stop_on_error)
+        stage.start()
+
+        self.stages[name] = stage
+        return stage
+
+    def iter_source(self, name: str, items: typing.Iterable) -> typing.Iterator:
+        '''
+        Yield items in the current thread, time spent in the iterator is busy time of the stage.
+        '''
+        stage = self.stages[name]
+        self.set_current(name)
+        iterator = iter(items)
+
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = next(iterator)
+
+            except StopIteration:
+                stage.record(busy=time.perf_counter() - start)
+                break
+
+            stage.record(items=1, busy=time.perf_counter() - start)
+            yield item
+
+    def set_current(self, name: str = None) -> None:
+        CURRENT.stage = self.stages.get(name)
+
+    def wait(self, task: futures.Future) -> None:
+        '''
+        Wait for the result of the next stage, the time is blocked time of the current one.
+        '''
+        start = time.perf_counter()
+        futures.wait([task])
+        add_blocked(time.perf_counter() - start)
+
+    def add_bytes(self, size: int) -> None:
+        stage = get_current()
+
+        if stage:
+            stage.record(size=size)
+
+    def close(self) -> None:
+        for stage in self.stages.values():
+            stage.close()
+
+        self._finished = time.perf_counter()
+        self.set_current()
+
+    def report(self) -> list:
+        elapsed = max((self._finished or time.perf_counter()) - self._started, 1e-9)
+        items = []
+
+        for stage in self.stages.values():
+            workers = max(1, stage.workers)
+            items.append({
+                "stage": stage.name, "workers": stage.workers, "items": stage.items, "bytes": stage.bytes,
+                "busy": round(stage.busy, 3), "idle": round(stage.idle, 3), "blocked": round(stage.blocked, 3),
+                "utilization": round(stage.busy / (elapsed * workers), 3),
+                "items_per_second": round(stage.items / elapsed, 2), "bytes_per_second": round(stage.bytes / elapsed)
+            })
+
+        return items
+
+    def summary(self) -> str:
+        items = self.report()
+        lines = []
+
+        for item in items:
+            lines.append("{stage} (workers: {workers}): {items} items, {bytes} bytes, {items_per_second}/s, busy {busy}s, "
+                         "idle {idle}s, blocked {blocked}s, utilization {utilization:.0%}".format(**item))
+
+        if items:
+            bottleneck = max(items, key=lambda item: item["utilization"])
+            lines.append("Bottleneck: {} (utilization {:.0%})".format(bottleneck["stage"], bottleneck["utilization"]))
+
+        logging.debug("Pipeline report: {}".format(items))
+        return "\n".join(lines)
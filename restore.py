@@ -0,0 +1,577 @@
+import os
+import sys
+import json
+import graph
+import typing
+import pathlib
+import logging
+import tempfile
+import store
+import grafana
+import argparse
+import functools
+import traceback
+import collections
+
+from concurrent import futures
+
+# DEBUG_MODE
+# AWS_ENDPOINT_URL
+# AWS_ACCESS_KEY_ID
+# AWS_SECRET_ACCESS_KEY
+# GRAFANA_URL
+# GRAFANA_TOKEN
+
+
+class Restore:
+    def __init__(self, client: grafana.Grafana, concurrency: int = 1, check: bool = True) -> None:
+        self._grafana = client
+        self._concurrency = max(1, concurrency)
+        self._check = check
+        self._folder_data = "data.json"
+        self._folder_access = "access.json"
+        self._graph_file = "graph.json"
+        self._folder_uids = {}
+        self.failed_items = []
+
+    def restore_datasource(self, data: dict) -> dict:
+        ds_uid = data["uid"]
+
+        if self._check and self._grafana.get_datasource_by_uid(ds_uid):
+            logging.info("Update datasource: {}".format(ds_uid))
+            return self._grafana.update_datasource(ds_uid, data)
+
+        logging.info("Create datasource: {}".format(ds_uid))
+        return self._grafana.create_datasource(data)
+
+    def restore_folder(self, data: dict, access: list = None) -> dict:
+        folder_uid = data["uid"]
+
+        if self._check and self._grafana.get_folder_by_uid(folder_uid):
+            logging.info("Update folder: {}".format(folder_uid))
+            resp = self._grafana.update_folder_by_raw(folder_uid, data)
+
+        else:
+            logging.info("Create folder: {}".format(folder_uid))
+            resp = self._grafana.create_folder_by_raw(data)
+
+        if access is not None:
+            logging.info("Update folder permissions: {}".format(folder_uid))
+            self._grafana.update_folder_permissions(folder_uid, access)
+
+        return resp
+
+    def restore_library_panel(self, data: dict) -> dict:
+        uid = data["uid"]
+        item = {"uid": uid, "name": data["name"], "kind": data.get("kind", 1), "model": data.get("model", {})}
+
+        if data.get("folderUid"):
+            item["folderUid"] = data["folderUid"]
+
+        current = self._grafana.get_library_element_by_uid(uid) if self._check else None
+        if current:
+            logging.info("Update library panel: {}".format(uid))
+            return self._grafana.update_library_element(uid, dict(item, version=current["result"]["version"]))
+
+        logging.info("Create library panel: {}".format(uid))
+        return self._grafana.create_library_element(item)
+
+    def restore_dashboard(self, data: dict, folder_uid: str = "") -> dict:
+        dash_uid = data["dashboard"]["uid"]
+
+        if self._check and self._grafana.get_dashboard_by_uid(dash_uid):
+            logging.info("Update dashboard: {}".format(dash_uid))
+            data["folderUid"] = folder_uid
+            return self._grafana.update_dashboard(data)
+
+        # The dashboard is created with overwrite, so it also replaces an existing one.
+        logging.info("Create dashboard: {}".format(dash_uid))
+        return self._grafana.create_dashboard(data, folder_uid)
+
+    def restore_all(self, items: typing.Iterable) -> None:
+        '''
+        Restore (name, loader) items in dependency order: datasources, folders, library panels, dashboards.
+        '''
+        datasources = []
+        folders = collections.defaultdict(dict)
+        library_panels = []
+        dashboards = []
+
+        for (name, loader) in items:
+            path = pathlib.PurePosixPath(name)
+
+            if path.suffix != ".json":
+                continue
+
+            if path.parent.name == "datasources":
+                datasources.append((name, loader))
+
+            elif path.parent.name == "library_panels":
+                library_panels.append((name, loader))
+
+            elif path.parent.name == "dashboards":
+                dashboards.append((name, loader))
+
+            elif path.name in (self._folder_data, self._folder_access):
+                folders[str(path.parent)][path.name] = loader
+
+        logging.info("Restore {} datasources".format(len(datasources)))
+        self.run_tasks(datasources, lambda name, data: self.restore_datasource(json.loads(data)))
+
+        logging.info("Restore {} folders".format(len(folders)))
+        self.run_tasks(
+            [(key, lambda item=item: {k: v() for (k, v) in item.items()}) for (key, item) in folders.items() if self._folder_data in item],
+            self.restore_folder_item
+        )
+
+        logging.info("Restore {} library panels".format(len(library_panels)))
+        self.run_tasks(library_panels, lambda name, data: self.restore_library_panel(json.loads(data)))
+
+        logging.info("Restore {} dashboards".format(len(dashboards)))
+        self.run_tasks(dashboards, self.restore_dashboard_item)
+
+    def restore_selected(self, items: typing.Iterable, folders: list = None, tags: list = None, open_archive: typing.Callable = None) -> None:
+        '''
+        Restore dashboards of the folders or with the tags and everything they need, by graph.json of the backup.
+        Levels of the dependency graph are restored in order, items of a level in parallel.
+        Files of unchanged dashboards of an incremental backup are read from their archive by "open_archive" (name -> items).
+        '''
+        (result, prefix, files) = (None, None, {})
+
+        # Members read before graph.json are spilled to a temporary directory, only files of the selected items are kept.
+        with tempfile.TemporaryDirectory() as spill_dir:
+            for (name, data) in items:
+                path = pathlib.PurePosixPath(name)
+
+                if path.name == self._graph_file and result is None:
+                    result = graph.Graph.loads(get_data(data))
+                    prefix = path.parent
+                    keys = result.get_closure(result.select(folders, tags))
+                    needed = set(self.iter_node_files(result, keys))
+                    files = self.filter_files(files, lambda key: str(pathlib.PurePosixPath(key).relative_to(prefix)) in needed)
+
+                elif path.suffix == ".json" and (result is None or str(path.relative_to(prefix)) in needed):
+                    files[name] = spill_data(spill_dir, data)
+
+            if result is None:
+                raise Exception("Backup has no dependency graph: {}".format(self._graph_file))
+
+            files = {str(pathlib.PurePosixPath(key).relative_to(prefix)): value for (key, value) in files.items()}
+            self.read_archives(result, keys, files, open_archive, spill_dir)
+
+            levels = result.get_levels(keys)
+            logging.info("Restore {} items in {} levels".format(len(keys), len(levels)))
+
+            for level in levels:
+                tasks = []
+
+                for key in level:
+                    failed = set(result.edges.get(key, [])) & set(self.failed_items)
+                    if failed:
+                        logging.error("Skip item: {} (failed dependencies: {})".format(key, ", ".join(sorted(failed))))
+                        self.failed_items.append(key)
+                        continue
+
+                    tasks.append((key, lambda key=key: self.load_node(result.nodes[key], key, files)))
+
+                self.run_tasks(tasks, lambda key, data: self.restore_node(result.nodes[key], key, data))
+
+    def filter_files(self, files: dict, condition: typing.Callable) -> dict:
+        '''
+        Return files matching the condition, spilled files of the others are removed.
+        '''
+        for (key, value) in files.items():
+            if not condition(key) and isinstance(value, SpilledFile):
+                os.remove(value.path)
+
+        return {key: value for (key, value) in files.items() if condition(key)}
+
+    def read_archives(self, result: graph.Graph, keys: typing.Iterable, files: dict, open_archive: typing.Callable, spill_dir: str) -> None:
+        '''
+        Add files of the selected dashboards missing from the backup, they are read from the archive named by the graph node.
+        '''
+        archives = collections.defaultdict(dict)
+
+        for key in keys:
+            node = result.nodes[key]
+            if node.get("file") and node["file"] not in files and node.get("archive"):
+                # A file of another backup directory is relative to it by "..", it is matched without them.
+                parts = pathlib.PurePosixPath(node["file"]).parts
+                archives[node["archive"]][str(pathlib.PurePosixPath(*filter(lambda part: part != "..", parts)))] = node["file"]
+
+        for (archive, names) in sorted(archives.items()):
+            if open_archive is None:
+                logging.warning("Files of {} dashboards are stored in archive: {}".format(len(names), archive))
+                continue
+
+            logging.info("Read {} files from archive: {}".format(len(names), archive))
+            for (name, data) in open_archive(archive):
+                # Archives of other runs have their own directory prefix, members are matched by the relative path.
+                parts = pathlib.PurePosixPath(name).parts
+                matched = set(names) & set(map(lambda index: "/".join(parts[index:]), range(len(parts))))
+
+                for file in matched:
+                    files[names[file]] = spill_data(spill_dir, data)
+
+    def iter_node_files(self, result: graph.Graph, keys: typing.Iterable) -> typing.Iterator[str]:
+        for key in keys:
+            if key.startswith("folders/"):
+                yield str(pathlib.PurePosixPath(result.nodes[key]["file"], self._folder_data))
+                yield str(pathlib.PurePosixPath(result.nodes[key]["file"], self._folder_access))
+
+            elif result.nodes[key].get("file"):
+                yield result.nodes[key]["file"]
+
+    def load_node(self, node: dict, key: str, files: dict) -> typing.Any:
+        '''
+        Return file data of the graph node, {name: data} of a folder or None if the backup has no file.
+        '''
+        if key.startswith("folders/"):
+            names = map(lambda name: (name, str(pathlib.PurePosixPath(node["file"], name))), (self._folder_data, self._folder_access))
+            item = {name: get_data(files[file]) for (name, file) in names if file in files}
+            return item if self._folder_data in item else None
+
+        return get_data(files[node["file"]]) if node.get("file") in files else None
+
+    def restore_node(self, node: dict, key: str, data: typing.Any) -> None:
+        if data is None and node.get("archive"):
+            raise Exception("File is not found in backup: {} (archive: {})".format(node.get("file"), node["archive"]))
+
+        if data is None:
+            raise Exception("File is not found in backup: {}".format(node.get("file")))
+
+        if key.startswith("folders/"):
+            self.restore_folder_item(node["file"], data)
+
+        elif key.startswith("datasources/"):
+            self.restore_datasource(json.loads(data))
+
+        elif key.startswith("library_panels/"):
+            self.restore_library_panel(json.loads(data))
+
+        elif key.startswith("dashboards/"):
+            self.restore_dashboard(json.loads(data), node.get("folder", ""))
+
+    def restore_stream(self, items: typing.Iterable) -> None:
+        '''
+        Restore (name, data) items in archive order, each item is restored as soon as it is read.
+        Dashboards wait for the restore of their folder and library panels, library panels for their folder.
+        An item is kept until its dependencies are read, datasources are not required to create dashboards.
+        '''
+        folder_tasks = {}
+        folder_uid_tasks = {}
+        folder_access = {}
+        library_tasks = {}
+        deferred = collections.defaultdict(list)
+        tasks = collections.deque()
+
+        with futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            def submit(name: str, handler: typing.Callable, *args) -> futures.Future:
+                task = executor.submit(handler, *args)
+                tasks.append((name, task))
+
+                if len(tasks) >= (self._concurrency * 2):
+                    self.collect_task(*tasks.popleft())
+
+                return task
+
+            def submit_dashboard(name: str, data: bytes, folder_key: str, uids: list) -> None:
+                dependencies = [folder_tasks.get(folder_key)] + [library_tasks.get(uid) for uid in uids]
+                submit(name, self.restore_stream_dashboard, data, folder_key, list(filter(None, dependencies)))
+
+            def submit_library_panel(name: str, data: dict) -> None:
+                library_tasks[data["uid"]] = submit(name, self.restore_stream_library_panel, data, folder_uid_tasks.get(data.get("folderUid")))
+
+                for entry in deferred.pop("library_panels/{}".format(data["uid"]), []):
+                    release(entry, "library_panels/{}".format(data["uid"]))
+
+            def defer(entry: dict) -> None:
+                for key in entry["missing"]:
+                    deferred[key].append(entry)
+
+            def release(entry: dict, key: str) -> None:
+                entry["missing"].discard(key)
+
+                if not entry["missing"]:
+                    entry["submit"](*entry["args"])
+
+            for (name, data) in items:
+                path = pathlib.PurePosixPath(name)
+
+                if path.suffix != ".json":
+                    continue
+
+                if path.parent.name == "datasources":
+                    submit(name, lambda data: self.restore_datasource(json.loads(data)), data)
+
+                elif path.parent.name == "library_panels":
+                    data = json.loads(data)
+                    folder_uid = data.get("folderUid")
+
+                    if folder_uid and (folder_uid not in folder_uid_tasks):
+                        defer({"missing": {"folders/{}".format(folder_uid)}, "submit": submit_library_panel, "args": (name, data)})
+
+                    else:
+                        submit_library_panel(name, data)
+
+                elif path.parent.name == "dashboards":
+                    folder_key = str(path.parent.parent)
+                    uids = get_library_panels(data)
+                    missing = {"library_panels/{}".format(uid) for uid in uids if uid not in library_tasks}
+
+                    # The General folder (id: 0) always exists.
+                    if not (folder_key in folder_tasks or path.parent.parent.name == "0"):
+                        missing.add(folder_key)
+
+                    if missing:
+                        defer({"missing": missing, "submit": submit_dashboard, "args": (name, data, folder_key, uids)})
+
+                    else:
+                        submit_dashboard(name, data, folder_key, uids)
+
+                elif path.name == self._folder_data:
+                    folder_key = str(path.parent)
+                    folder_data = json.loads(data)
+
+                    self._folder_uids[folder_key] = folder_data["uid"]
+                    folder_tasks[folder_key] = folder_uid_tasks[folder_data["uid"]] = submit(name, self.restore_folder, folder_data)
+
+                    if folder_key in folder_access:
+                        access_name = str(path.with_name(self._folder_access))
+                        submit(access_name, self.restore_stream_access, folder_access.pop(folder_key), folder_key, folder_tasks[folder_key])
+
+                    for key in (folder_key, "folders/{}".format(folder_data["uid"])):
+                        for entry in deferred.pop(key, []):
+                            release(entry, key)
+
+                elif path.name == self._folder_access:
+                    folder_key = str(path.parent)
+
+                    if folder_key in folder_tasks:
+                        submit(name, self.restore_stream_access, data, folder_key, folder_tasks[folder_key])
+
+                    else:
+                        folder_access[folder_key] = data
+
+            # Items with dependencies missing from the archive are restored after the last member, library panels first.
+            entries = {}
+            for key in sorted(deferred, key=lambda key: not key.startswith("folders/")):
+                logging.warning("Dependency is not found: {} ({} items)".format(key, len(deferred[key])))
+                entries.update(map(lambda entry: (id(entry), entry), deferred[key]))
+
+            deferred.clear()
+            for entry in entries.values():
+                entry["submit"](*entry["args"])
+
+            while tasks:
+                self.collect_task(*tasks.popleft())
+
+    def restore_stream_access(self, data: bytes, folder_key: str, folder_task: futures.Future) -> None:
+        folder_task.result()
+
+        folder_uid = self._folder_uids[folder_key]
+        logging.info("Update folder permissions: {}".format(folder_uid))
+        self._grafana.update_folder_permissions(folder_uid, json.loads(data))
+
+    def restore_stream_library_panel(self, data: dict, folder_task: futures.Future = None) -> None:
+        # Tasks run in submit order, so the folder task is already started by a worker.
+        if folder_task:
+            folder_task.result()
+
+        self.restore_library_panel(data)
+
+    def restore_stream_dashboard(self, data: bytes, folder_key: str, dependencies: list = None) -> None:
+        # Tasks run in submit order, so the tasks of the folder and library panels are already started by a worker.
+        for task in (dependencies or []):
+            task.result()
+
+        self.restore_dashboard(json.loads(data), self._folder_uids.get(folder_key, ""))
+
+    def restore_folder_item(self, name: str, item: dict) -> None:
+        data = json.loads(item[self._folder_data])
+        access = json.loads(item[self._folder_access]) if self._folder_access in item else None
+
+        self._folder_uids[name] = data["uid"]
+        self.restore_folder(data, access)
+
+    def restore_dashboard_item(self, name: str, data: bytes) -> None:
+        # <base>/<folder_id>/dashboards/<uid>.json
+        folder_key = str(pathlib.PurePosixPath(name).parent.parent)
+        self.restore_dashboard(json.loads(data), self._folder_uids.get(folder_key, ""))
+
+    def run_tasks(self, items: list, handler: typing.Callable) -> None:
+        '''
+        Items are loaded in the current thread and restored on the worker pool.
+        '''
+        tasks = collections.deque()
+
+        with futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            for (name, loader) in items:
+                tasks.append((name, executor.submit(handler, name, loader())))
+
+                if len(tasks) >= (self._concurrency * 2):
+                    self.collect_task(*tasks.popleft())
+
+            while tasks:
+                self.collect_task(*tasks.popleft())
+
+    def collect_task(self, name: str, task: futures.Future) -> None:
+        try:
+            task.result()
+
+        except Exception as error:
+            logging.error("Failed item: {} ({}: {})".format(name, error.__class__.__name__, error))
+            self.failed_items.append(name)
+
+
+def get_data(data: typing.Union[bytes, typing.Callable]) -> bytes:
+    '''
+    Return data of a (name, data) item, directories and snapshots yield loaders instead of bytes.
+    '''
+    return data() if callable(data) else data
+
+
+class SpilledFile:
+    '''
+    Loader of archive member data stored in a temporary file.
+    '''
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __call__(self) -> bytes:
+        return pathlib.Path(self.path).read_bytes()
+
+
+def spill_data(spill_dir: str, data: typing.Union[bytes, typing.Callable]) -> typing.Callable:
+    '''
+    Return a loader of the data, bytes are written to the directory and loaders of a directory or store are kept.
+    '''
+    if callable(data):
+        return data
+
+    (handle, path) = tempfile.mkstemp(suffix=".json", dir=spill_dir)
+    with os.fdopen(handle, "wb") as file:
+        file.write(data)
+
+    return SpilledFile(path)
+
+
+def get_library_panels(data: bytes) -> list:
+    '''
+    Return uids of library panels used by the dashboard response, only dashboards that mention them are decoded.
+    '''
+    if b'"libraryPanel"' not in data:
+        return []
+
+    return graph.get_references(json.loads(data).get("dashboard", {}))["library_panels"]
+
+
+def iter_directory(path: str) -> typing.Iterator[tuple]:
+    for (root, _, files) in os.walk(path):
+        for file_item in sorted(files):
+            file = pathlib.Path(root).joinpath(file_item)
+            yield (file.as_posix(), file.read_bytes)
+
+
+def iter_manifest(content_store: store.ContentStore, name: str) -> typing.Iterator[tuple]:
+    for (path, item) in content_store.get_manifest(name).items():
+        yield (path, lambda digest=item["digest"]: content_store.get(digest))
+
+
+def iter_stream(fileobj: typing.Any) -> typing.Iterator[tuple]:
+    '''
+    Yield (name, data) of archive members in a single pass over a local file or S3 object body.
+    '''
+    import tarfile
+    import compress
+
+    with compress.open_reader(fileobj) as reader, tarfile.open(fileobj=reader, mode="r|") as archive_file:
+        for member in archive_file:
+            if member.isfile():
+                yield (member.name, archive_file.extractfile(member).read())
+
+
+def iter_archive(path: str, name: str) -> typing.Iterator[tuple]:
+    '''
+    Yield members of the archive stored next to the archive path.
+    '''
+    with open(os.path.join(os.path.dirname(path), name), "rb") as file:
+        yield from iter_stream(file)
+
+
+def iter_s3_archive(client: typing.Any, bucket: str, key: str, name: str) -> typing.Iterator[tuple]:
+    '''
+    Yield members of the archive stored in the bucket under the prefix of the archive key.
+    '''
+    name = "{}/{}".format(os.path.dirname(key), os.path.basename(name)).lstrip("/")
+    yield from iter_stream(client.get_object(Bucket=bucket, Key=name)["Body"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="Set backup directory, archive path or S3 object key.")
+    parser.add_argument("--bucket", dest="bucket", default="", help="Read the archive from S3 bucket.")
+    parser.add_argument("--store", dest="store", default="", help="Read the snapshot manifest from content store (path or s3://bucket/prefix).")
+    parser.add_argument("--concurrency", dest="concurrency", default="4", type=int, help="Set number of parallel workers.")
+    parser.add_argument("--folder", dest="folders", action="append", help="Restore dashboards of the folder (uid or title) and their dependencies.")
+    parser.add_argument("--tag", dest="tags", action="append", help="Restore dashboards with the tag and their dependencies.")
+    parser.add_argument("--no-check", dest="check", action="store_false", help="Skip existence checks, create every item.")
+    parser.add_argument("--compress-min-size", dest="compress_min_size", default="0", type=int, help="Send request bodies from this size with gzip encoding, 0 disables it.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.INFO
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    try:
+        args = parse_args()
+        grafana_client = grafana.Grafana(
+            url=os.environ.get("GRAFANA_URL", ""),
+            token=os.environ.get("GRAFANA_TOKEN", ""),
+            pool_size=max(10, args.concurrency), compress_min_size=args.compress_min_size
+        )
+
+        grafana_restore = Restore(grafana_client, args.concurrency, args.check)
+        (restore_items, restore_stream) = (grafana_restore.restore_all, grafana_restore.restore_stream)
+
+        if args.folders or args.tags:
+            restore_items = restore_stream = functools.partial(grafana_restore.restore_selected, folders=args.folders, tags=args.tags)
+
+        if args.store:
+            logging.info("Read snapshot {} from {}".format(args.path, args.store))
+            restore_items(iter_manifest(store.ContentStore(args.store), args.path))
+
+        elif args.bucket:
+            import boto3
+
+            logging.info("Read s3://{}/{}".format(args.bucket, args.path))
+            s3_client = boto3.client("s3")
+            response = s3_client.get_object(Bucket=args.bucket, Key=args.path)
+
+            # Unchanged dashboards of an incremental backup are read from earlier archives of the same prefix.
+            if args.folders or args.tags:
+                restore_stream = functools.partial(restore_stream, open_archive=functools.partial(iter_s3_archive, s3_client, args.bucket, args.path))
+
+            restore_stream(iter_stream(response["Body"]))
+
+        elif os.path.isdir(args.path):
+            restore_items(iter_directory(args.path))
+
+        else:
+            if args.folders or args.tags:
+                restore_stream = functools.partial(restore_stream, open_archive=functools.partial(iter_archive, args.path))
+
+            with open(args.path, "rb") as file:
+                restore_stream(iter_stream(file))
+
+        if grafana_restore.failed_items:
+            logging.error("Failed items: {}".format(len(grafana_restore.failed_items)))
+            sys.exit(1)
+
+    except Exception:
+        logging.error(traceback.format_exc())
+        sys.exit(1)
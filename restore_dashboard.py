@@ -19,8 +19,10 @@ try:
         token=os.environ.get("GRAFANA_TOKEN", "")
     )
 
-    data = json.loads(folder_path.read_text())
-    folder_uid = data["uid"]
+    # Dashboards of the General folder are stored in "0/dashboards" without data.json.
+    folder_uid = ""
+    if (folder_path.parent.name != "0") and folder_path.exists():
+        folder_uid = json.loads(folder_path.read_text())["uid"]
 
     data = json.loads(dashboard_path.read_text())
     dash_uid = data["dashboard"]["uid"]
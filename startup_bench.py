@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+
+# Modules loaded on the code path that needs them, an entry point must not import them.
+LAZY_MODULES = {
+    "grafana": ["boto3", "urllib.request", "concurrent.futures", "uuid"],
+    "restore": ["boto3", "tarfile", "compress"],
+    "backup": ["boto3", "urllib.request", "sqlite3", "zstandard"],
+    "get_backup": ["boto3"],
+    "orchestrator": ["boto3"],
+}
+
+
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+def get_import_times(module: str) -> dict:
+    '''
+    Return {imported module: cumulative microseconds} of "import <module>" in a new interpreter.
+    '''
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+
+    if proc.returncode:
+        raise Exception("Failed import: {}\n{}".format(module, proc.stderr))
+
+    items = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        (_, cumulative, name) = line[len("import time:"):].split("|")
+        items[name.strip()] = int(cumulative)
+
+    return items
+
+
+def get_process_time() -> float:
+    '''
+    Return seconds of an empty interpreter run, the part of startup no module can change.
+    '''
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def run_module(module: str, repeat: int) -> dict:
+    runs = [get_import_times(module) for _ in range(repeat)]
+    lazy = LAZY_MODULES.get(module, [])
+
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(map(lambda item: item[module], runs)) / 1000, 2),
+        "modules": len(runs[-1]),
+        "eager_imports": sorted(filter(lambda name: name in runs[-1], lazy))
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", dest="modules", default="grafana,restore,backup,get_backup,orchestrator", help="Set comma separated modules.")
+    parser.add_argument("--repeat", dest="repeat", default="5", type=int, help="Set number of runs per module, the median is reported.")
+    parser.add_argument("--max-ms", dest="max_ms", default="0", type=float, help="Fail if an import takes longer, 0 disables the check.")
+    parser.add_argument("--output", dest="output", default="", help="Set path for JSON results.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.WARNING
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    args = parse_args()
+    results = [run_module(module, max(1, args.repeat)) for module in args.modules.split(",")]
+    failed = False
+
+    for item in results:
+        if item["eager_imports"]:
+            logging.error("Module {} imports: {}".format(item["module"], ", ".join(item["eager_imports"])))
+            failed = True
+
+        if args.max_ms and (item["import_ms"] > args.max_ms):
+            logging.error("Module {} import takes {}ms (max: {}ms)".format(item["module"], item["import_ms"], args.max_ms))
+            failed = True
+
+    data = json.dumps({
+        "python": sys.version.split()[0], "created": int(time.time()),
+        "interpreter_ms": round(get_process_time() * 1000, 2), "results": results
+    }, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(data)
+
+    else:
+        print(data)
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+import pathlib
+import threading
+
+
+class ContentStore:
+    '''
+    Objects are stored once under their SHA-256 digest: objects/<ab>/<digest>.
+    Snapshots are manifests that map item paths to digests: manifests/<name>.json.
+    The location is a local directory or "s3://bucket/prefix".
+    '''
+    def __init__(self, location: str) -> None:
+        self._location = location
+        self._known = set()
+        self._lock = threading.Lock()
+
+        if location.startswith("s3://"):
+            import boto3
+
+            (self._bucket, _, self._prefix) = location[5:].partition("/")
+            self._client = boto3.client("s3")
+
+        else:
+            self._bucket = None
+            self._path = pathlib.Path(location)
+
+    def _key(self, name: str) -> str:
+        return "{}/{}".format(self._prefix.strip("/"), name).lstrip("/")
+
+    def _exists(self, name: str) -> bool:
+        if not self._bucket:
+            return self._path.joinpath(name).exists()
+
+        try:
+            self._client.head_object(Bucket=self._bucket, Key=self._key(name))
+            return True
+
+        except self._client.exceptions.ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return False
+
+            raise
+
+    def _write(self, name: str, data: bytes) -> None:
+        if self._bucket:
+            self._client.put_object(Bucket=self._bucket, Key=self._key(name), Body=data)
+            return
+
+        path = self._path.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write and rename, so a partial object is never visible.
+        tmp = path.with_name("{}.{}.tmp".format(path.name, threading.get_ident()))
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def _read(self, name: str) -> bytes:
+        if self._bucket:
+            return self._client.get_object(Bucket=self._bucket, Key=self._key(name))["Body"].read()
+
+        return self._path.joinpath(name).read_bytes()
+
+    def put(self, data: bytes) -> str:
+        '''
+        Store data if it is not stored yet and return the digest.
+        '''
+        digest = hashlib.sha256(data).hexdigest()
+        name = "objects/{}/{}".format(digest[:2], digest)
+
+        with self._lock:
+            if digest in self._known:
+                return digest
+
+        if not self._exists(name):
+            self._write(name, data)
+
+        with self._lock:
+            self._known.add(digest)
+
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        return self._read("objects/{}/{}".format(digest[:2], digest))
+
+    def put_manifest(self, name: str, items: dict) -> str:
+        '''
+        Store {path: {"digest": str, "title": str}} and return the manifest name.
+        '''
+        name = "manifests/{}.json".format(name)
+        self._write(name, json.dumps({"items": items}).encode())
+        return name
+
+    def get_manifest(self, name: str) -> dict:
+        data = json.loads(self._read(name))
+
+        # Digests of a stored manifest are known to exist.
+        with self._lock:
+            self._known.update(map(lambda item: item["digest"], data["items"].values()))
+
+        return data["items"]
+
+    def list_manifests(self) -> list:
+        if not self._bucket:
+            return sorted(map(lambda item: item.relative_to(self._path).as_posix(), self._path.glob("manifests/*.json")))
+
+        items = []
+        paginator = self._client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=self._key("manifests/")):
+            for item in page.get("Contents", []):
+                items.append(item["Key"][len(self._key("")):])
+
+        return sorted(items)
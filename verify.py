@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import store
+import backup
+import typing
+import hashlib
+import grafana
+import pathlib
+import restore
+import logging
+import argparse
+import exporters
+import traceback
+
+from concurrent import futures
+
+# DEBUG_MODE
+# GRAFANA_URL
+# GRAFANA_TOKEN
+
+
+def get_hash(data: dict, exclude: tuple = ("id", "version")) -> str:
+    '''
+    Return SHA-256 of the object with sorted keys, instance specific fields are excluded.
+    '''
+    data = {key: value for (key, value) in data.items() if key not in exclude}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def index_backup(items: typing.Iterable) -> dict:
+    '''
+    Return {type: {key: entry}} of backup (name, data or loader) items.
+    Dashboards are indexed by the "meta" object, the model hash is computed only for changed versions.
+    Dashboards of manifest.json missing from the backup (unchanged ones of an incremental archive) are indexed by the manifest.
+    '''
+    types = dict(map(lambda item: (item.name, item), exporters.get_exporters(list(exporters.EXPORTERS))))
+    index = {"folders": {}, "dashboards": {}}
+    manifest = {}
+
+    for (name, data) in items:
+        path = pathlib.PurePosixPath(name)
+        kind = path.parent.name
+
+        if path.suffix != ".json":
+            continue
+
+        if kind == "dashboards":
+            loader = data if callable(data) else None
+            data = loader() if loader else data
+            meta = backup.get_meta(data)
+            model = None if loader else json.loads(data).get("dashboard", {})
+
+            # Archive members are read once, so their hash is computed now instead of keeping the data.
+            index["dashboards"][path.stem] = {
+                "title": model.get("title", "") if model is not None else None, "version": meta.get("version"),
+                "folderUid": meta.get("folderUid", ""), "hash": get_hash(model) if model is not None else None, "loader": loader
+            }
+
+        elif path.name == exporters.FolderExporter.data_file:
+            data = json.loads(data() if callable(data) else data)
+            index["folders"][data["uid"]] = {"title": data.get("title", "")}
+
+        elif (kind in types) and (kind not in ("folders", "dashboards")):
+            data = json.loads(data() if callable(data) else data)
+            index.setdefault(kind, {})
+            index[kind][path.stem] = {"title": types[kind].get_title(data), "hash": get_hash(data, ("id", ))}
+
+        elif path.name == "manifest.json":
+            manifest = json.loads(data() if callable(data) else data).get("dashboards", {})
+
+    for (uid, item) in manifest.items():
+        index["dashboards"].setdefault(uid, {
+            "title": item.get("title", ""), "version": item.get("version"), "folderUid": item.get("folderUid", ""),
+            "hash": None, "loader": None
+        })
+
+    # Titles of stored files are read from the manifest, a backup without it decodes them.
+    for (uid, item) in index["dashboards"].items():
+        if item["title"] is None:
+            item["title"] = manifest[uid].get("title", "") if uid in manifest else json.loads(item["loader"]()).get("dashboard", {}).get("title", "")
+
+    return index
+
+
+class Verify:
+    '''
+    Compare a backup index with the live instance.
+    Dashboard versions are requested in parallel, full dashboards are fetched only when versions differ.
+    '''
+    def __init__(self, client: grafana.Grafana, concurrency: int = 8) -> None:
+        self._grafana = client
+        self._concurrency = max(1, concurrency)
+        self.added = []
+        self.removed = []
+        self.changed = []
+
+    def compare(self, index: dict) -> dict:
+        self.compare_folders(index["folders"])
+        self.compare_dashboards(index["dashboards"])
+
+        for exporter in exporters.get_exporters(list(exporters.EXPORTERS)):
+            if exporter.name in index and exporter.name not in ("folders", "dashboards"):
+                self.compare_items(exporter, index[exporter.name])
+
+        return {"added": self.added, "removed": self.removed, "changed": self.changed}
+
+    def compare_keys(self, kind: str, backup_items: dict, live_items: dict) -> list:
+        '''
+        Record added and removed items and return keys of both sides.
+        '''
+        for key in sorted(set(live_items) - set(backup_items)):
+            self.added.append({"type": kind, "key": key, "title": live_items[key]["title"]})
+
+        for key in sorted(set(backup_items) - set(live_items)):
+            self.removed.append({"type": kind, "key": key, "title": backup_items[key].get("title", "")})
+
+        return sorted(set(backup_items) & set(live_items))
+
+    def compare_folders(self, backup_items: dict) -> None:
+        live_items = dict(map(lambda item: (item["uid"], item), self._grafana.list_folders()))
+
+        for key in self.compare_keys("folders", backup_items, live_items):
+            if backup_items[key]["title"] != live_items[key]["title"]:
+                reason = "title: {} -> {}".format(backup_items[key]["title"], live_items[key]["title"])
+                self.changed.append({"type": "folders", "key": key, "title": live_items[key]["title"], "reason": reason})
+
+    def compare_dashboards(self, backup_items: dict) -> None:
+        live_items = dict(map(lambda item: (item["uid"], item), self._grafana.iter_dashboards()))
+        keys = self.compare_keys("dashboards", backup_items, live_items)
+
+        with futures.ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            tasks = [(key, executor.submit(self.compare_dashboard, backup_items[key], live_items[key])) for key in keys]
+
+            for (key, task) in tasks:
+                reason = task.result()
+                if reason:
+                    self.changed.append({"type": "dashboards", "key": key, "title": live_items[key]["title"], "reason": reason})
+
+    def compare_dashboard(self, backup_item: dict, live_item: dict) -> str:
+        '''
+        Return the reason of a difference or None.
+        '''
+        if backup_item["folderUid"] != live_item.get("folderUid", ""):
+            return "folder: {} -> {}".format(backup_item["folderUid"] or "General", live_item.get("folderUid") or "General")
+
+        versions = self._grafana.get_dashboard_versions(live_item["uid"])
+        version = versions[0].get("version") if versions else None
+
+        if version == backup_item["version"]:
+            return None
+
+        # A dashboard of the manifest without the file can be compared only by version.
+        if not (backup_item["hash"] or backup_item["loader"]):
+            return "version: {} -> {}".format(backup_item["version"], version)
+
+        data = json.loads(self._grafana.get_dashboard_by_uid_raw(live_item["uid"]) or b"{}")
+        backup_hash = backup_item["hash"] or get_hash(json.loads(backup_item["loader"]()).get("dashboard", {}))
+
+        # A new version with the same model is not a change, e.g. a dashboard saved without edits.
+        if get_hash(data.get("dashboard", {})) == backup_hash:
+            return None
+
+        return "version: {} -> {}".format(backup_item["version"], version)
+
+    def compare_items(self, exporter: exporters.Exporter, backup_items: dict) -> None:
+        live_items = {}
+        for item in exporter.list_items(self._grafana):
+            live_items[exporter.get_key(item)] = {"title": exporter.get_title(item), "hash": get_hash(item, ("id", ))}
+
+        for key in self.compare_keys(exporter.name, backup_items, live_items):
+            if backup_items[key]["hash"] != live_items[key]["hash"]:
+                self.changed.append({"type": exporter.name, "key": key, "title": live_items[key]["title"], "reason": "content"})
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="Set backup directory, archive path or S3 object key.")
+    parser.add_argument("--bucket", dest="bucket", default="", help="Read the archive from S3 bucket.")
+    parser.add_argument("--store", dest="store", default="", help="Read the snapshot manifest from content store (path or s3://bucket/prefix).")
+    parser.add_argument("--concurrency", dest="concurrency", default="8", type=int, help="Set number of parallel requests.")
+    parser.add_argument("--json", dest="json", action="store_true", help="Print the report as JSON.")
+    parser.add_argument("--exit-code", dest="exit_code", action="store_true", help="Exit with 1 if there are differences.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    log_level = logging.DEBUG if os.environ.get("DEBUG_MODE", "") else logging.INFO
+    logging.basicConfig(
+        format=r'%(levelname)s [%(asctime)s]: "%(message)s"',
+        datefmt=r'%Y-%m-%d %H:%M:%S', level=log_level
+    )
+
+    try:
+        args = parse_args()
+        grafana_client = grafana.Grafana(
+            url=os.environ.get("GRAFANA_URL", ""),
+            token=os.environ.get("GRAFANA_TOKEN", ""),
+            pool_size=max(10, args.concurrency)
+        )
+
+        if args.store:
+            index = index_backup(restore.iter_manifest(store.ContentStore(args.store), args.path))
+
+        elif args.bucket:
+            import boto3
+
+            response = boto3.client("s3").get_object(Bucket=args.bucket, Key=args.path)
+            index = index_backup(restore.iter_stream(response["Body"]))
+
+        elif os.path.isdir(args.path):
+            index = index_backup(restore.iter_directory(args.path))
+
+        else:
+            with open(args.path, "rb") as file:
+                index = index_backup(restore.iter_stream(file))
+
+        logging.info("Backup index: {}".format(", ".join(map(lambda item: "{} {}".format(len(item[1]), item[0]), index.items()))))
+        report = Verify(grafana_client, args.concurrency).compare(index)
+
+        if args.json:
+            print(json.dumps(report, indent=2))
+
+        else:
+            for (state, sign) in (("added", "+"), ("removed", "-"), ("changed", "~")):
+                for item in report[state]:
+                    print("{} {} {} {}{}".format(sign, item["type"], item["key"], item["title"], " ({})".format(item["reason"]) if "reason" in item else ""))
+
+        if args.exit_code and any(report.values()):
+            sys.exit(1)
+
+    except Exception:
+        logging.error(traceback.format_exc())
+        sys.exit(1)